@@ -1,5 +1,15 @@
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
 from django.shortcuts import redirect
 
+from books.stats import request_stats
+
 
 class RedirectAuthenticatedUserMiddleware:
     def __init__(self, get_response):
@@ -10,3 +20,120 @@ class RedirectAuthenticatedUserMiddleware:
             return redirect('/admin/')
         response = self.get_response(request)
         return response
+
+
+_current_timer = ContextVar('current_timer', default=None)
+
+
+class QueryTimer:
+    """
+    Database execute wrapper counting the queries of one request and their total time. The
+    connections the request had to open are counted too, reused pooled ones are not.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.connects = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+def time_query(execute, sql, params, many, context):
+    """
+    Execute wrapper of every connection, handing the query to the timer of the current request.
+    The request's context is copied into the threads running its sync ORM calls (sync_to_async),
+    so queries of async views are attributed to their request whatever thread runs them.
+    """
+    timer = _current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def install_query_timer(connection):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+@receiver(connection_created)
+def count_connect(sender, connection, **kwargs):
+    install_query_timer(connection)
+    timer = _current_timer.get()
+    if timer is not None and not getattr(connection, 'reused_connection', False):
+        timer.connects += 1
+
+
+def endpoint_name(request):
+    """
+    Names the endpoint by viewset action (BookViewSet.list), falling back to the URL name.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    view = match.func
+    cls = getattr(view, 'cls', None)
+    actions = getattr(view, 'actions', None)
+    if cls is not None and actions:
+        return f'{cls.__name__}.{actions.get(request.method.lower(), request.method.lower())}'
+    if cls is not None:
+        return f'{cls.__name__}.{request.method.lower()}'
+    return match.view_name or match._func_path
+
+
+class RequestStatsMiddleware:
+    """
+    Records wall time, SQL query count, SQL time, newly opened database connections and
+    response size of every request into books.stats.request_stats, per viewset action, and
+    reports the timings in a Server-Timing header. Sizes of streaming responses are not known
+    here and are skipped. Works in sync and async chains, so it does not force ASGI requests
+    onto a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with self.timed_queries(timer):
+            response = self.get_response(request)
+        return self.finish(request, response, timer, start)
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with self.timed_queries(timer):
+            response = await self.get_response(request)
+        return self.finish(request, response, timer, start)
+
+    def timed_queries(self, timer):
+        stack = ExitStack()
+        # Sync ORM calls of async views run in copies of this context and see the same timer.
+        stack.callback(_current_timer.reset, _current_timer.set(timer))
+        # Connections opened before this module was loaded did not get the wrapper from connection_created.
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection)
+        return stack
+
+    def finish(self, request, response, timer, start):
+        wall_ms = (time.perf_counter() - start) * 1000
+        sql_ms = timer.duration * 1000
+        size = None if response.streaming else len(response.content)
+        request_stats.record(endpoint_name(request), wall_ms=wall_ms, queries=timer.count, sql_ms=sql_ms,
+                             db_connects=timer.connects, size_bytes=size)
+        response['Server-Timing'] = (f'app;dur={wall_ms:.1f}, '
+                                     f'db;dur={sql_ms:.1f};desc="{timer.count} queries"')
+        return response
@@ -0,0 +1,102 @@
+import os
+import threading
+
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base, creation
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+
+from books.postgresql_pool.pool import ConnectionPool
+from books.stats import register_stats
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, options):
+    """
+    Returns the pool of this process for the given connection parameters. Pools are keyed by
+    pid as well, a forked worker must not share its parent's sockets.
+    """
+    key = (os.getpid(), key)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(**options)
+        return pool
+
+
+def pools():
+    pid = os.getpid()
+    with _pools_lock:
+        return [pool for (owner, _), pool in _pools.items() if owner == pid]
+
+
+# Cumulative since start-up, a DELETE of /stats/ leaves them.
+register_stats('db_pools', lambda: [pool.stats() for pool in pools()])
+
+
+def close_pools():
+    pid = os.getpid()
+    with _pools_lock:
+        closing = [key for key in _pools if key[0] == pid]
+        closing = [_pools.pop(key) for key in closing]
+    for pool in closing:
+        pool.close()
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # PostgreSQL refuses to drop a database with open connections, idle pooled ones included.
+        close_pools()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL backend taking its connections from a per-process pool (OPTIONS['pool'], see
+    ConnectionPool for the keys). Django closes the connection at the end of every request
+    when CONN_MAX_AGE is 0, which here hands it back to the pool, so WSGI threads and the
+    per-request threads of ASGI alike reuse a few warm connections.
+    """
+    creation_class = DatabaseCreation
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None
+        self.reused_connection = False
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop('pool', None)
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        options = self.settings_dict['OPTIONS'].get('pool')
+        # Test database creation connects to the 'postgres' database, that one is not pooled.
+        if options is None or self.alias == NO_DB_ALIAS:
+            self.pool, self.reused_connection = None, False
+            return super().get_new_connection(conn_params)
+        pool = get_pool(tuple(sorted((name, repr(value)) for name, value in conn_params.items())), options)
+
+        def connect():
+            return super(DatabaseWrapper, self).get_new_connection(conn_params)
+
+        connection, self.reused_connection = pool.getconn(connect)
+        if self.reused_connection:
+            self.isolation_level = IsolationLevel(
+                self.settings_dict['OPTIONS'].get('isolation_level', IsolationLevel.READ_COMMITTED))
+        else:
+            pool.fill(connect)
+        self.pool = pool
+        return connection
+
+    def _close(self):
+        if self.connection is None or self.pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            if self.in_atomic_block:
+                # Django keeps self.connection until the outermost atomic block exits, it must
+                # not be handed to another thread meanwhile.
+                self.pool.discard(self.connection)
+            else:
+                self.pool.putconn(self.connection)
@@ -0,0 +1,194 @@
+import threading
+import time
+import weakref
+from collections import deque
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    pass
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections opened with the same parameters.
+
+    The most recently returned connection is handed out first, so a quiet process keeps
+    reusing a few warm connections while the rest go idle and get closed. A connection is
+    closed instead of being reused once it is older than `max_age`, when it has been idle
+    longer than `max_idle` and the pool holds more than `min_size`, or when it fails the
+    health check (`SELECT 1`, run on connections idle longer than `check_idle` seconds,
+    never if None). At most `max_size` connections are open, callers wait up to `timeout`
+    seconds for one. A connection garbage collected without being returned (its thread
+    died) frees its slot too.
+    """
+
+    def __init__(self, min_size=0, max_size=10, max_age=1800, max_idle=300, timeout=10, check_idle=None):
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError(f'Invalid pool size: min_size={min_size}, max_size={max_size}')
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_age = max_age
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self.lock = threading.Condition()
+        self.idle = deque()  # (connection, opened_at, returned_at), most recently returned last
+        self.in_use = weakref.WeakKeyDictionary()  # connection -> opened_at
+        self.opening = 0
+        self.closed = False
+        self.counters = dict.fromkeys(('opened', 'closed', 'reused', 'waits', 'timeouts'), 0)
+
+    def size(self):
+        return len(self.idle) + len(self.in_use) + self.opening
+
+    def getconn(self, connect):
+        """
+        Returns (connection, reused). A new connection is opened with `connect()` when no
+        idle one is left and the pool is not full.
+        """
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        while True:
+            with self.lock:
+                entry = None
+                while entry is None:
+                    if self.idle:
+                        entry = self.idle.pop()
+                    elif self.size() < self.max_size:
+                        self.opening += 1
+                        break
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.counters['timeouts'] += 1
+                            raise PoolTimeout(f'No database connection available within {self.timeout}s, '
+                                              f'all {self.max_size} are in use')
+                        if not waited:
+                            self.counters['waits'] += 1
+                            waited = True
+                        # Wake up now and then: slots of lost connections are freed without a notify.
+                        self.lock.wait(min(remaining, 1))
+                if entry is not None:
+                    connection, opened_at, returned_at = entry
+                    self.in_use[connection] = opened_at
+            if entry is None:
+                return self.open(connect), False
+            if self.usable(connection, opened_at, returned_at):
+                with self.lock:
+                    self.counters['reused'] += 1
+                return connection, True
+            self.discard(connection)
+
+    def open(self, connect):
+        try:
+            connection = connect()
+        except BaseException:
+            with self.lock:
+                self.opening -= 1
+                self.lock.notify()
+            raise
+        with self.lock:
+            self.opening -= 1
+            self.counters['opened'] += 1
+            self.in_use[connection] = time.monotonic()
+        return connection
+
+    def usable(self, connection, opened_at, returned_at):
+        now = time.monotonic()
+        if connection.closed or now - opened_at >= self.max_age:
+            return False
+        if self.check_idle is not None and now - returned_at >= self.check_idle:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+            except psycopg2.Error:
+                return False
+        return True
+
+    def reset(self, connection):
+        """
+        Rolls back whatever the borrower left open, returns False if the connection is broken.
+        """
+        try:
+            if connection.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+            if not connection.autocommit:
+                connection.autocommit = True
+        except psycopg2.Error:
+            return False
+        return not connection.closed
+
+    def putconn(self, connection):
+        now = time.monotonic()
+        with self.lock:
+            opened_at = self.in_use.get(connection)
+        if opened_at is None or self.closed or now - opened_at >= self.max_age or not self.reset(connection):
+            self.discard(connection)
+            return
+        with self.lock:
+            self.in_use.pop(connection, None)
+            self.idle.append((connection, opened_at, now))
+            expired = self.expire_idle(now)
+            self.lock.notify()
+        for connection in expired:
+            self.close_connection(connection)
+
+    def expire_idle(self, now):
+        """
+        Takes the connections idle for too long off the pool, least recently used first.
+        Must be called with the lock held, the caller closes them.
+        """
+        expired = []
+        while self.idle and self.size() > self.min_size:
+            connection, opened_at, returned_at = self.idle[0]
+            if now - returned_at < self.max_idle and now - opened_at < self.max_age:
+                break
+            self.idle.popleft()
+            self.counters['closed'] += 1
+            expired.append(connection)
+        return expired
+
+    def discard(self, connection):
+        with self.lock:
+            if self.in_use.pop(connection, None) is not None:
+                self.counters['closed'] += 1
+            self.lock.notify()
+        self.close_connection(connection)
+
+    def close_connection(self, connection):
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+    def fill(self, connect):
+        """
+        Opens connections until the pool holds `min_size`.
+        """
+        while True:
+            with self.lock:
+                if self.closed or self.size() >= self.min_size:
+                    return
+                self.opening += 1
+            connection = self.open(connect)
+            self.putconn(connection)
+
+    def close(self):
+        """
+        Closes the idle connections; connections in use are closed when they come back.
+        """
+        with self.lock:
+            self.closed = True
+            idle = [connection for connection, _, _ in self.idle]
+            self.idle.clear()
+            self.counters['closed'] += len(idle)
+            self.lock.notify_all()
+        for connection in idle:
+            self.close_connection(connection)
+
+    def stats(self):
+        with self.lock:
+            return {**self.counters, 'idle': len(self.idle), 'in_use': len(self.in_use)}
@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 import sys
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 
 TESTING = "test" in sys.argv
 
@@ -25,9 +25,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = config('SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = config('DEBUG', default=True, cast=bool)
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='', cast=Csv())
 
 # Application definition
 
@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'rest_framework',
     'django_filters',
@@ -48,6 +49,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'books.middleware.RequestStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,13 +57,15 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
 ]
-if not TESTING:
+if not TESTING and DEBUG:
     INSTALLED_APPS = [
+        *INSTALLED_APPS,
         "debug_toolbar",
     ]
+    # Sync only: under ASGI it moves every request onto a worker thread.
     MIDDLEWARE = [
+        *MIDDLEWARE,
         "debug_toolbar.middleware.DebugToolbarMiddleware",
     ]
 
@@ -88,17 +92,90 @@ WSGI_APPLICATION = 'books.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# DB_POOL switches to books.postgresql_pool: Django's PostgreSQL backend with a per-process
+# connection pool, for gunicorn threads and uvicorn alike. Without it a thread keeps its own
+# connection for DB_CONN_MAX_AGE seconds; leave that at 0 under ASGI, where every request runs
+# on a new thread and persistent connections would pile up.
+DB_POOL = config('DB_POOL', default=True, cast=bool)
+DB_CONN_HEALTH_CHECKS = config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool)
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'books_db',
-        'USER': 'books_user',
-        'PASSWORD': 'admin',
-        'HOST': 'localhost',
-        'PORT': '5432',
+        'ENGINE': 'books.postgresql_pool' if DB_POOL else 'django.db.backends.postgresql',
+        'NAME': config('DB_NAME', default='books_db'),
+        'USER': config('DB_USER', default='books_user'),
+        'PASSWORD': config('DB_PASSWORD', default='admin'),
+        'HOST': config('DB_HOST', default='localhost'),
+        'PORT': config('DB_PORT', default='5432'),
+        # Pooled connections are handed back when Django closes them at the end of the request.
+        'CONN_MAX_AGE': 0 if DB_POOL else config('DB_CONN_MAX_AGE', default=0, cast=int),
+        'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
+        'OPTIONS': {
+            'pool': {
+                'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+                'max_size': config('DB_POOL_MAX_SIZE', default=20, cast=int),
+                # Seconds: connection lifetime, idle time before closing (above min_size),
+                # wait for a free connection, idle time before a SELECT 1 health check.
+                'max_age': config('DB_POOL_MAX_AGE', default=1800, cast=float),
+                'max_idle': config('DB_POOL_MAX_IDLE', default=300, cast=float),
+                'timeout': config('DB_POOL_TIMEOUT', default=10, cast=float),
+                'check_idle': config('DB_POOL_CHECK_IDLE', default=5, cast=float) if DB_CONN_HEALTH_CHECKS else None,
+            },
+        } if DB_POOL else {},
+    }
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='books'),
     }
 }
 
+# Cache holding the generation counters and change times behind the response caches and ETags. Every worker
+# must see the same counters: with a process-local backend (LocMemCache, DummyCache) response caching and
+# conditional GETs are switched off unless DEBUG or testing, as a worker would miss the writes of the others.
+STORE_GENERATION_CACHE = config('STORE_GENERATION_CACHE', default='default')
+
+# Lifetime of cached /book/ responses, stale entries are made unreachable by the generation counters anyway.
+STORE_RESPONSE_CACHE_TIMEOUT = config('STORE_RESPONSE_CACHE_TIMEOUT', default=300, cast=int)
+
+# Cached single book representations (store.objectcache): the in-process LRU in front of the shared cache
+# holds up to STORE_OBJECT_CACHE_LOCAL_BYTES, entries expire from the shared cache after STORE_OBJECT_CACHE_TIMEOUT.
+STORE_OBJECT_CACHE_LOCAL_BYTES = config('STORE_OBJECT_CACHE_LOCAL_BYTES', default=16 * 1024 * 1024, cast=int)
+STORE_OBJECT_CACHE_TIMEOUT = config('STORE_OBJECT_CACHE_TIMEOUT', default=3600, cast=int)
+
+# Async endpoints querying the database at once per event loop, the rest wait without holding a connection.
+STORE_ASYNC_DB_CONCURRENCY = config('STORE_ASYNC_DB_CONCURRENCY', default=20, cast=int)
+
+# Write-behind mode for like / bookmark / rate changes (store.writebehind): PATCH and PUT of
+# /userbookrelation/<book>/ are queued per process and written in batches, every
+# STORE_RELATION_FLUSH_INTERVAL seconds or once STORE_RELATION_FLUSH_SIZE (user, book) pairs are waiting.
+STORE_RELATION_WRITE_BEHIND = config('STORE_RELATION_WRITE_BEHIND', default=False, cast=bool)
+STORE_RELATION_FLUSH_INTERVAL = config('STORE_RELATION_FLUSH_INTERVAL', default=1.0, cast=float)
+STORE_RELATION_FLUSH_SIZE = config('STORE_RELATION_FLUSH_SIZE', default=1000, cast=int)
+
+# Leaderboards (store.leaderboard): half-life of the trending score in seconds (3.5 days), and how
+# often a process reads the score changes made by other processes.
+STORE_TRENDING_HALF_LIFE = config('STORE_TRENDING_HALF_LIFE', default=302400, cast=float)
+STORE_LEADERBOARD_SYNC_INTERVAL = config('STORE_LEADERBOARD_SYNC_INTERVAL', default=5.0, cast=float)
+
+# N+1 guard of the store serializers (store.queryguard): 'raise' fails a list response whose items
+# each run their own query, 'log' only warns about it, '' switches the check off.
+STORE_QUERY_GUARD = config('STORE_QUERY_GUARD', default='raise' if TESTING else '')
+
+# Write throttling (store.throttling): token buckets per user and endpoint, refilled at the rates of
+# REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], kept per process ('local') or in the cache of that alias.
+STORE_THROTTLE_STORE = config('STORE_THROTTLE_STORE', default='local')
+STORE_THROTTLE_LOCAL_KEYS = config('STORE_THROTTLE_LOCAL_KEYS', default=100000, cast=int)
+
+# Load shedding of low-priority writes (likes, bookmarks, rates, comments): answered 503 with Retry-After
+# while the p95 SQL time of the last STORE_SHED_INTERVAL seconds is above STORE_SHED_SQL_P95_MS (0 is off).
+STORE_SHED_SQL_P95_MS = config('STORE_SHED_SQL_P95_MS', default=0 if TESTING else 250, cast=float)
+STORE_SHED_INTERVAL = config('STORE_SHED_INTERVAL', default=1.0, cast=float)
+STORE_SHED_MIN_SAMPLES = config('STORE_SHED_MIN_SAMPLES', default=20, cast=int)
+STORE_SHED_RETRY_AFTER = config('STORE_SHED_RETRY_AFTER', default=5, cast=int)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -146,12 +223,20 @@ INTERNAL_IPS = [
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
+    # orjson based, with the standard library as the fallback when orjson is not installed.
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'store.renderers.FastJSONRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
-        'rest_framework.parsers.JSONParser',
-    ]
+        'store.renderers.FastJSONParser',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'store.pagination.KeysetPagination',
+    'PAGE_SIZE': 100,
+    # Token bucket rates of the write endpoints (store.throttling.TokenBucketThrottle), the number is the burst.
+    'DEFAULT_THROTTLE_RATES': {
+        'relation': config('THROTTLE_RELATION_RATE', default='120/min'),
+        'comment': config('THROTTLE_COMMENT_RATE', default='20/min'),
+    },
 }
 
 SOCIAL_AUTH_GITHUB_KEY = config('SOCIAL_AUTH_GITHUB_KEY')
@@ -0,0 +1,214 @@
+import math
+import threading
+
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+GROWTH = 1.1
+LOG_GROWTH = math.log(GROWTH)
+METRICS = ('wall_ms', 'queries', 'sql_ms', 'db_connects', 'size_bytes')
+PERCENTILES = (50, 95, 99)
+
+
+class Histogram:
+    """
+    Log-scale histogram: a value lands in bucket floor(log(value, 1.1)), so percentiles
+    are accurate to about 10% whatever the range. Buckets are sparse, zeros are kept apart.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if value <= 0:
+            self.zeros += 1
+            return
+        index = math.floor(math.log(value) / LOG_GROWTH)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def merge(self, other):
+        for index, count in list(other.buckets.items()):
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        return self
+
+    def since(self, earlier):
+        """
+        Returns a histogram of the values recorded after `earlier`, a merged copy of this one
+        taken before. Its max is the overall one. A reset in between makes it a copy of this one.
+        """
+        if earlier is None or earlier.count > self.count or any(
+                count > self.buckets.get(index, 0) for index, count in earlier.buckets.items()):
+            return Histogram().merge(self)
+        window = Histogram()
+        window.buckets = {index: count - earlier.buckets.get(index, 0) for index, count in self.buckets.items()
+                          if count > earlier.buckets.get(index, 0)}
+        window.zeros = self.zeros - earlier.zeros
+        window.count = self.count - earlier.count
+        window.total = self.total - earlier.total
+        window.max = self.max
+        return window
+
+    def percentile(self, percent):
+        """
+        Returns the upper bound of the bucket holding the given percentile, or None if empty.
+        """
+        if not self.count:
+            return None
+        rank = math.ceil(self.count * percent / 100)
+        seen = self.zeros
+        if seen >= rank:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(GROWTH ** (index + 1), self.max)
+        return self.max
+
+    def summary(self):
+        summary = {'mean': round(self.total / self.count, 2) if self.count else None,
+                   'max': round(self.max, 2)}
+        for percent in PERCENTILES:
+            value = self.percentile(percent)
+            summary[f'p{percent}'] = round(value, 2) if value is not None else None
+        return summary
+
+
+def merge_shard(target, shard):
+    """
+    Merges the {endpoint: {metric: Histogram}} of `shard` into `target` and returns it.
+    """
+    for name, histograms in list(shard.items()):
+        merged = target.setdefault(name, {metric: Histogram() for metric in METRICS})
+        for metric, histogram in histograms.items():
+            merged[metric].merge(histogram)
+    return target
+
+
+class RequestStats:
+    """
+    Per-endpoint request histograms. Every thread records into its own shard, so the
+    request path never takes a lock; readers merge the shards into a snapshot. Shards of
+    exited threads are folded into one retired shard whenever a thread registers or a
+    reader merges, so short-lived threads do not pile up.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = {}
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            # Once per thread, the only time the request path takes the lock.
+            with self._lock:
+                self._prune()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _prune(self):
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                merge_shard(self._retired, shard)
+        self._shards = alive
+
+    def record(self, endpoint, **values):
+        histograms = self._shard().get(endpoint)
+        if histograms is None:
+            histograms = self._shard()[endpoint] = {metric: Histogram() for metric in METRICS}
+        for metric, value in values.items():
+            if value is not None:
+                histograms[metric].record(value)
+
+    def merged(self, endpoint=None):
+        """
+        Returns {endpoint: {metric: Histogram}} merged over all threads, or the merged
+        metrics of one endpoint (every endpoint together when `endpoint` is '*').
+        """
+        with self._lock:
+            self._prune()
+            merged = merge_shard({}, self._retired)
+            for _, shard in self._shards:
+                merge_shard(merged, shard)
+        if endpoint is None:
+            return merged
+        total = {metric: Histogram() for metric in METRICS}
+        for name, histograms in merged.items():
+            if endpoint in ('*', name):
+                for metric, histogram in histograms.items():
+                    total[metric].merge(histogram)
+        return total
+
+    def snapshot(self):
+        return {
+            endpoint: {'count': histograms['wall_ms'].count,
+                       **{metric: histogram.summary() for metric, histogram in histograms.items()}}
+            for endpoint, histograms in sorted(self.merged().items())
+        }
+
+    def reset(self):
+        with self._lock:
+            self._retired.clear()
+            for _, shard in self._shards:
+                shard.clear()
+
+    def shard_count(self):
+        with self._lock:
+            self._prune()
+            return len(self._shards)
+
+
+request_stats = RequestStats()
+
+_components = {}
+
+
+def register_stats(name, stats, reset=None):
+    """
+    Reports `stats()` under `name` in the components of /stats/; `reset()`, if given, runs on DELETE.
+    """
+    _components[name] = (stats, reset)
+
+
+def component_stats():
+    return {name: stats() for name, (stats, _) in sorted(_components.items())}
+
+
+def reset_component_stats():
+    for _, reset in _components.values():
+        if reset is not None:
+            reset()
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def stats(request):
+    """
+    Per-endpoint wall time, query count, SQL time, connection churn (db_connects, connections
+    opened per request) and response size, collected by RequestStatsMiddleware since start-up
+    (or the last DELETE), and the counters of the registered components: response and object
+    caches, request coalescing, connection pools.
+    """
+    if request.method == 'DELETE':
+        request_stats.reset()
+        reset_component_stats()
+        return Response(status=204)
+    return Response({'requests': request_stats.snapshot(), 'components': component_stats()})
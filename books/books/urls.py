@@ -3,8 +3,10 @@ from django.urls import path, include
 from rest_framework.routers import SimpleRouter
 
 from books import settings
+from books.stats import stats
+from store.async_views import AsyncBookView, AsyncShopView, AsyncStockView
 from store.views import BookViewSet, oauth, UserBookRelationViewSet, CommentViewSet, QuoteViewSet, StockViewSet, \
-    ShopViewSet
+    ShopViewSet, CheckoutViewSet, ShopInventoryViewSet, BookInventoryViewSet, LeaderboardViewSet
 
 router = SimpleRouter()
 router.register(r'book', BookViewSet)
@@ -13,11 +15,20 @@ router.register(r'comment', CommentViewSet)
 router.register(r'quote', QuoteViewSet)
 router.register(r'stock', StockViewSet)
 router.register(r'shop', ShopViewSet)
+router.register(r'checkout', CheckoutViewSet, basename='checkout')
+router.register(r'inventory/shop', ShopInventoryViewSet)
+router.register(r'inventory/book', BookInventoryViewSet)
+router.register(r'leaderboard', LeaderboardViewSet, basename='leaderboard')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('social_django.urls', namespace='social')),
     path('oauth/', oauth),
+    path('stats/', stats),
+    path('async/book/', AsyncBookView.as_view(), name='async-book-list'),
+    path('async/book/<int:pk>/', AsyncBookView.as_view(), name='async-book-detail'),
+    path('async/shop/', AsyncShopView.as_view(), name='async-shop-list'),
+    path('async/stock/', AsyncStockView.as_view(), name='async-stock-list'),
 ]
 if not settings.TESTING:
     urlpatterns = [
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class StoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'store'
+
+    def ready(self):
+        from store import checks, signals  # noqa: F401
+        # Connects the request query timer to every database connection, before any is opened.
+        from books import middleware  # noqa: F401
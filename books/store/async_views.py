@@ -0,0 +1,129 @@
+import asyncio
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import PermissionDenied, ValidationError as DjangoValidationError
+from django.http import Http404, HttpResponse
+from django.views import View
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from store.cache import generations_shared
+from store.views import BookViewSet, ShopViewSet, StockViewSet, response_flight
+
+_db_slots = weakref.WeakKeyDictionary()
+
+
+def db_slots():
+    """
+    Per event loop semaphore bounding the requests that query the database at once.
+    Requests beyond STORE_ASYNC_DB_CONCURRENCY wait on the loop instead of opening
+    another connection.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _db_slots:
+        _db_slots[loop] = asyncio.Semaphore(getattr(settings, 'STORE_ASYNC_DB_CONCURRENCY', 20))
+    return _db_slots[loop]
+
+
+class AsyncReadView(View):
+    """
+    Async read-only counterpart of a store viewset. The viewset still supplies the
+    queryset, filters, pagination and serializer; the rows are loaded with the async
+    ORM, so under ASGI a request waiting on PostgreSQL does not hold a worker thread.
+    There is no ETag / 304 handling here, conditional requests go to the sync endpoints.
+    """
+    viewset_class = None
+    # Serve from the viewset's response cache, the one get_response_cache() picks for the request.
+    cache_responses = False
+    renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+
+    def get_viewset(self, request, action, **kwargs):
+        viewset = self.viewset_class(action=action, args=(), kwargs=kwargs, format_kwarg=None)
+        viewset.request = Request(request)
+        viewset.headers = {}
+        return viewset
+
+    def render(self, data, status=200, cache=None):
+        response = HttpResponse(self.renderer.render(data), content_type='application/json', status=status)
+        if cache is not None:
+            response['X-Cache'] = cache
+        return response
+
+    async def get(self, request, **kwargs):
+        action = 'retrieve' if kwargs else 'list'
+        viewset = self.get_viewset(request, action, **kwargs)
+        try:
+            response_cache = viewset.get_response_cache() if self.cache_responses else None
+            if response_cache is None:
+                return self.render(await self.load(viewset, action))
+            name = 'detail' if kwargs else 'list'
+            cacheable = generations_shared()
+            if cacheable:
+                key = await response_cache.amake_key(name, viewset.request)
+                data = await response_cache.aget(key)
+                if data is not None:
+                    return self.render(data, cache='HIT')
+            else:
+                key = response_cache.build_key(name, viewset.request, ())
+
+            async def load_and_cache():
+                data = await self.load(viewset, action)
+                if cacheable:
+                    await response_cache.aset(key, data)
+                return data
+
+            # Coalesced with identical async requests in flight, see CachedResponseMixin.
+            data, shared = await response_flight.ado(key, load_and_cache)
+            return self.render(data, cache='COALESCED' if shared else 'MISS')
+        except (APIException, Http404, PermissionDenied) as exc:
+            # The exceptions the sync views turn into responses, through the same handler.
+            response = viewset.get_exception_handler()(exc, viewset.get_exception_handler_context())
+            if response is None:
+                raise
+            return self.render(response.data, status=response.status_code)
+
+    async def load(self, viewset, action):
+        async with db_slots():
+            # Filter backends may touch the database while building the queryset (search).
+            queryset = await sync_to_async(viewset.filter_queryset)(viewset.get_queryset())
+            if action == 'retrieve':
+                return viewset.get_serializer(await self.get_object(viewset, queryset)).data
+            paginator = viewset.paginator
+            page = await paginator.apaginate_queryset(queryset, viewset.request, view=viewset)
+            if page is None:
+                return viewset.get_serializer([obj async for obj in queryset.aiterator(chunk_size=2000)],
+                                              many=True).data
+            return paginator.get_paginated_data(viewset.get_serializer(page, many=True).data)
+
+    async def get_object(self, viewset, queryset):
+        lookup = viewset.lookup_url_kwarg or viewset.lookup_field
+        try:
+            return await queryset.aget(**{viewset.lookup_field: viewset.kwargs[lookup]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError, DjangoValidationError):
+            raise NotFound(f'No {queryset.model._meta.object_name} matches the given query.')
+
+
+class AsyncBookView(AsyncReadView):
+    """
+    /async/book/ and /async/book/<pk>/: BookViewSet list and retrieve, cached like the sync endpoints
+    (book_stock_response_cache for ?expand=stock).
+    """
+    viewset_class = BookViewSet
+    cache_responses = True
+
+
+class AsyncShopView(AsyncReadView):
+    """
+    /async/shop/: ShopViewSet list.
+    """
+    viewset_class = ShopViewSet
+
+
+class AsyncStockView(AsyncReadView):
+    """
+    /async/stock/?shop=&book=: StockViewSet list, for stock lookups.
+    """
+    viewset_class = StockViewSet
@@ -0,0 +1,171 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import Max
+
+
+def generation_key(model):
+    return f'store:generation:{model._meta.label_lower}'
+
+
+def modified_key(model):
+    return f'store:modified:{model._meta.label_lower}'
+
+
+def generation_cache_alias():
+    return getattr(settings, 'STORE_GENERATION_CACHE', 'default')
+
+
+def generations_shared():
+    """
+    Whether the generation counters can be trusted across workers. A process-local cache
+    only sees the writes of its own process, outside DEBUG and tests it disables the
+    response caches and conditional GETs built on the counters.
+    """
+    if settings.DEBUG or getattr(settings, 'TESTING', False):
+        return True
+    return not isinstance(caches[generation_cache_alias()], (LocMemCache, DummyCache))
+
+
+def bump_generation(model, cache_alias=None):
+    """
+    Moves the model to a new generation and records when it changed. Called right away
+    and again on commit, so a response computed from the pre-commit state cannot stay
+    reachable after the commit.
+    """
+    def bump():
+        cache = caches[cache_alias or generation_cache_alias()]
+        key = generation_key(model)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns())
+        cache.set(modified_key(model), time.time(), None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def get_generations(models, cache_alias=None):
+    cache = caches[cache_alias or generation_cache_alias()]
+    keys = [generation_key(model) for model in models]
+    values = cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        # A fresh, time based start value: an evicted counter never comes back as an old generation.
+        start = time.time_ns()
+        for key in missing:
+            cache.add(key, start)
+        values.update(cache.get_many(missing))
+    return [values.get(key, 0) for key in keys]
+
+
+async def aget_generations(models, cache_alias=None):
+    cache = caches[cache_alias or generation_cache_alias()]
+    keys = [generation_key(model) for model in models]
+    values = await cache.aget_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        start = time.time_ns()
+        for key in missing:
+            await cache.aadd(key, start)
+        values.update(await cache.aget_many(missing))
+    return [values.get(key, 0) for key in keys]
+
+
+def get_last_modified(models, cache_alias=None):
+    """
+    Returns the latest change time (a timestamp) of the given models, or None if unknown.
+    Falls back to Max('updated_at') for models whose marker is not cached yet; models
+    without that column (UserBookRelation touches Book.updated_at through the counters)
+    only count once they have changed.
+    """
+    cache = caches[cache_alias or generation_cache_alias()]
+    values = cache.get_many([modified_key(model) for model in models])
+    timestamps = []
+    for model in models:
+        timestamp = values.get(modified_key(model))
+        if timestamp is None:
+            if not any(field.name == 'updated_at' for field in model._meta.concrete_fields):
+                continue
+            latest = model.objects.aggregate(latest=Max('updated_at'))['latest']
+            timestamp = latest.timestamp() if latest is not None else 0
+            cache.add(modified_key(model), timestamp, None)
+        if timestamp:
+            timestamps.append(timestamp)
+    return max(timestamps, default=None)
+
+
+class GenerationCache:
+    """
+    Caches response data under keys that embed the generation of every model the
+    response depends on. Bumping a generation makes older entries unreachable,
+    so invalidation never has to scan or delete keys. The data lives in `cache_alias`,
+    the generations in STORE_GENERATION_CACHE.
+    """
+
+    def __init__(self, prefix, models, timeout=None, cache_alias='default'):
+        self.prefix = prefix
+        self.models = models
+        self.timeout = timeout
+        self.cache_alias = cache_alias
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def get_timeout(self):
+        if self.timeout is not None:
+            return self.timeout
+        return getattr(settings, 'STORE_RESPONSE_CACHE_TIMEOUT', 300)
+
+    def generations(self):
+        return get_generations(self.models)
+
+    def make_key(self, name, request):
+        return self.build_key(name, request, self.generations())
+
+    async def amake_key(self, name, request):
+        return self.build_key(name, request, await aget_generations(self.models))
+
+    def build_key(self, name, request, generations):
+        params = sorted((key, sorted(values)) for key, values in request.query_params.lists())
+        digest = hashlib.md5(repr((request.build_absolute_uri(request.path), params)).encode()).hexdigest()
+        return f'{self.prefix}:{name}:{digest}:{".".join(str(value) for value in generations)}'
+
+    def get(self, key):
+        return self.count(self.cache.get(key))
+
+    async def aget(self, key):
+        return self.count(await self.cache.aget(key))
+
+    def count(self, data):
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def set(self, key, data):
+        self.cache.set(key, data, self.get_timeout())
+
+    async def aset(self, key, data):
+        await self.cache.aset(key, data, self.get_timeout())
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = 0
@@ -0,0 +1,75 @@
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Now
+
+from store.cache import bump_generation
+from store.inventory import apply_count_changes
+from store.models import Book, Cart, Order, OrderItem, Stock
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class EmptyCart(CheckoutError):
+    pass
+
+
+class OutOfStock(CheckoutError):
+    def __init__(self, book_ids):
+        super().__init__(f'Out of stock: {book_ids}')
+        self.book_ids = book_ids
+
+
+def reserve(book_id, count=1):
+    """
+    Takes `count` units of the book from one shop and returns the Stock id, or None if
+    no shop has enough. A free row is picked with SKIP LOCKED so concurrent checkouts
+    spread over the shops; if every candidate is locked it falls back to a conditional
+    UPDATE ... WHERE count >= n, which waits for the lock and re-checks the count, so two
+    checkouts can never both take the last unit.
+    """
+    stock = (Stock.objects.select_for_update(skip_locked=True)
+             .filter(book_id=book_id, count__gte=count).order_by('-count', 'pk').first())
+    if stock is not None:
+        Stock.objects.filter(pk=stock.pk).update(count=F('count') - count, updated_at=Now())
+        return stock.pk
+    while True:
+        candidates = list(Stock.objects.filter(book_id=book_id, count__gte=count)
+                          .order_by('-count', 'pk').values_list('pk', flat=True)[:5])
+        if not candidates:
+            return None
+        for stock_id in candidates:
+            if Stock.objects.filter(pk=stock_id, count__gte=count).update(count=F('count') - count,
+                                                                          updated_at=Now()):
+                return stock_id
+
+
+def checkout(user):
+    """
+    Converts the user's Cart into an Order with one OrderItem per book, reserving one unit
+    of every book. Either everything is reserved and the order created, or OutOfStock is
+    raised and the transaction rolls every reservation back.
+    """
+    with transaction.atomic():
+        cart = Cart.objects.select_for_update().get(user=user)
+        # Reserving in book id order keeps concurrent checkouts from locking stock rows in opposite orders.
+        book_ids = list(cart.books.order_by('pk').values_list('pk', flat=True))
+        if not book_ids:
+            raise EmptyCart('The cart is empty')
+        reserved = {book_id: reserve(book_id) for book_id in book_ids}
+        missing = [book_id for book_id, stock_id in reserved.items() if stock_id is None]
+        if missing:
+            raise OutOfStock(missing)
+
+        total_price = Book.objects.filter(pk__in=book_ids).aggregate(total=Sum('price'))['total']
+        order = Order.objects.create(user=user, total_price=total_price)
+        order.books.add(*book_ids)
+        OrderItem.objects.bulk_create([OrderItem(order=order, book_id=book_id, count=1) for book_id in book_ids])
+        cart.books.clear()
+        cart.total_price = 0
+        cart.save(update_fields=['total_price'])
+        # Last, so the summary rows shared by all checkouts of a shop stay locked only until the commit.
+        apply_count_changes({stock_id: -1 for stock_id in reserved.values()})
+        bump_generation(Stock)
+    return order
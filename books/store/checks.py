@@ -0,0 +1,15 @@
+from django.core import checks
+
+from store.cache import generation_cache_alias, generations_shared
+
+
+@checks.register(checks.Tags.caches)
+def check_generation_cache(app_configs, **kwargs):
+    if generations_shared():
+        return []
+    return [checks.Warning(
+        f'The generation counters are kept in the process-local cache {generation_cache_alias()!r}.',
+        hint='Point STORE_GENERATION_CACHE at a cache shared by all workers (Redis, Memcached, database); '
+             'until then response caching and ETag / Last-Modified are switched off.',
+        id='store.W001',
+    )]
@@ -0,0 +1,92 @@
+from collections import defaultdict
+
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Now
+
+from store.models import Book, Comment, UserBookRelation
+
+
+def contribution(state):
+    """
+    Returns the book id and the counter values a single relation adds to that book.
+    """
+    book_id, like, rate = state
+    return book_id, {
+        'rating_sum': rate or 0,
+        'rating_count': int(rate is not None),
+        'likes_count': int(bool(like)),
+    }
+
+
+def relation_deltas(old_state, new_state):
+    """
+    Returns {book_id: {counter: delta}} for a relation moving from old_state to new_state.
+    Either state may be None (relation created or deleted).
+    """
+    deltas = defaultdict(lambda: dict.fromkeys(Book.COUNTER_FIELDS, 0))
+    if old_state is not None:
+        book_id, values = contribution(old_state)
+        for field, value in values.items():
+            deltas[book_id][field] -= value
+    if new_state is not None:
+        book_id, values = contribution(new_state)
+        for field, value in values.items():
+            deltas[book_id][field] += value
+    return {book_id: values for book_id, values in deltas.items() if any(values.values())}
+
+
+def comment_deltas(old_book_id, new_book_id):
+    """
+    Returns {book_id: {'comments_count': delta}} for a comment moving from one book to
+    another. Either may be None (comment created or deleted).
+    """
+    deltas = {}
+    if old_book_id != new_book_id:
+        if old_book_id is not None:
+            deltas[old_book_id] = {'comments_count': -1}
+        if new_book_id is not None:
+            deltas[new_book_id] = {'comments_count': 1}
+    return deltas
+
+
+def merge_deltas(total, deltas):
+    """
+    Adds `deltas` into `total` in place, so a batch of changes is applied with one UPDATE per book.
+    """
+    for book_id, values in deltas.items():
+        current = total.setdefault(book_id, dict.fromkeys(Book.COUNTER_FIELDS, 0))
+        for field, value in values.items():
+            current[field] += value
+    return total
+
+
+def apply_deltas(deltas):
+    """
+    Applies counter deltas with F() expressions, so concurrent writers never lose increments.
+    """
+    for book_id, values in deltas.items():
+        changes = {field: F(field) + value for field, value in values.items() if value}
+        if changes:
+            Book.objects.filter(pk=book_id).update(updated_at=Now(), **changes)
+
+
+def rebuild_counters(books=None):
+    """
+    Recomputes the counters from UserBookRelation and Comment in a single UPDATE over `books`
+    (all books by default). Returns the number of updated rows.
+    """
+    if books is None:
+        books = Book.objects.all()
+    relations = UserBookRelation.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    rating_sum = relations.annotate(value=Sum('rate')).values('value')
+    rating_count = relations.annotate(value=Count('rate')).values('value')
+    likes_count = relations.annotate(value=Count('pk', filter=Q(like=True))).values('value')
+    comments_count = (Comment.objects.filter(book=OuterRef('pk')).order_by().values('book')
+                      .annotate(value=Count('pk')).values('value'))
+    return books.update(
+        rating_sum=Coalesce(Subquery(rating_sum), Value(0)),
+        rating_count=Coalesce(Subquery(rating_count), Value(0)),
+        likes_count=Coalesce(Subquery(likes_count), Value(0)),
+        comments_count=Coalesce(Subquery(comments_count), Value(0)),
+        updated_at=Now(),
+    )
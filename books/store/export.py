@@ -0,0 +1,28 @@
+import csv
+
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class Echo:
+    """
+    File-like object whose write() returns the value, lets csv.writer produce lines lazily.
+    """
+
+    def write(self, value):
+        return value
+
+
+def ndjson_lines(rows):
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+def csv_lines(rows, fieldnames):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fieldnames)
+    for row in rows:
+        yield writer.writerow([
+            ' '.join(str(value) for value in row[name]) if isinstance(row[name], list) else row[name]
+            for name in fieldnames
+        ])
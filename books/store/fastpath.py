@@ -0,0 +1,132 @@
+import decimal
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import ISO_8601, serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.settings import api_settings
+
+# Fields returning a column value from the database unchanged (int, str, bool and float columns).
+PASSTHROUGH_FIELDS = (serializers.IntegerField, serializers.CharField, serializers.BooleanField,
+                      serializers.FloatField, serializers.ReadOnlyField)
+
+
+def decimal_converter(field):
+    """
+    DecimalField.to_representation with the quantize exponent and context built once per column.
+    """
+    if (field.decimal_places is None or field.normalize_output or field.localize
+            or not getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)):
+        return field.to_representation
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def convert(value):
+        if not isinstance(value, decimal.Decimal):
+            return field.to_representation(value)
+        return '{:f}'.format(value.quantize(exponent, rounding=rounding, context=context))
+    return convert
+
+
+def datetime_converter(field):
+    """
+    DateTimeField.to_representation with the output format and time zone looked up once per column.
+    """
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+        return field.to_representation
+
+    def convert(value):
+        if getattr(value, 'tzinfo', None) is None:
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return convert
+
+
+class CompiledSerializer:
+    """
+    Read-only serialization of a list without the per-field DRF machinery: rows are read with
+    values_list() and turned into dicts through a converter per column, built once per page.
+    The output is the one of serializer.to_representation(). compile() returns None when a
+    field cannot be read from a single column (nested serializers, method fields, many-to-many
+    or a source that is not a field or annotation of the queryset); use the serializer then.
+    """
+
+    def __init__(self, names, columns, fields):
+        self.names = names
+        self.columns = columns
+        self.fields = fields
+
+    @classmethod
+    def compile(cls, serializer, queryset):
+        names, columns, fields = [], [], []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            column = cls.get_column(field, queryset)
+            if column is None:
+                return None
+            names.append(name)
+            columns.append(column)
+            fields.append(field)
+        return cls(names, columns, fields)
+
+    @staticmethod
+    def get_column(field, queryset):
+        if isinstance(field, PrimaryKeyRelatedField):
+            if field.pk_field is not None:
+                return None
+        elif not isinstance(field, (serializers.DecimalField, serializers.DateTimeField, *PASSTHROUGH_FIELDS)):
+            return None
+        if not field.source_attrs or field.source == '*':
+            return None
+        model, attrs = queryset.model, field.source_attrs
+        if len(attrs) == 1 and attrs[0] in queryset.query.annotations:
+            return attrs[0]
+        for index, attr in enumerate(attrs):
+            try:
+                model_field = model._meta.get_field(attr)
+            except FieldDoesNotExist:
+                return None
+            if model_field.many_to_many or model_field.one_to_many:
+                return None
+            if index < len(attrs) - 1:
+                # DRF reads a.b of a missing a differently, only follow required relations.
+                if not model_field.many_to_one or model_field.null:
+                    return None
+                model = model_field.related_model
+            elif model_field.is_relation and not isinstance(field, PrimaryKeyRelatedField):
+                return None
+        return '__'.join(attrs)
+
+    def values(self, queryset, extra=()):
+        """
+        The queryset read as named rows of the columns, plus the `extra` columns (e.g. the
+        ones a paginator needs).
+        """
+        columns = [*self.columns, *(column for column in extra if column not in self.columns)]
+        return queryset.values_list(*columns, named=True)
+
+    def converters(self):
+        converters = []
+        for index, field in enumerate(self.fields):
+            if isinstance(field, serializers.DecimalField):
+                converters.append((self.names[index], index, decimal_converter(field)))
+            elif isinstance(field, serializers.DateTimeField):
+                converters.append((self.names[index], index, datetime_converter(field)))
+        return converters
+
+    def to_representation(self, rows):
+        names, converters, data = self.names, self.converters(), []
+        for row in rows:
+            item = dict(zip(names, row))
+            for name, index, convert in converters:
+                value = row[index]
+                if value is not None:
+                    item[name] = convert(value)
+            data.append(item)
+        return data
@@ -0,0 +1,101 @@
+from django.db.models import Count, F, Q, Sum
+
+from store.models import BookInventory, ShopInventory, Stock
+
+# (summary model, Stock column it is grouped by, counter that counts the Stock rows)
+SUMMARIES = (
+    (ShopInventory, 'shop_id', 'titles'),
+    (BookInventory, 'book_id', 'shops'),
+)
+
+
+def contribution(state):
+    """
+    Returns {(summary model, id): {counter: value}} for what a single Stock row adds to the summaries.
+    """
+    shop_id, book_id, count = state
+    keys = {'shop_id': shop_id, 'book_id': book_id}
+    return {
+        (model, keys[column]): {'units': count, rows: 1, 'out_of_stock': int(count <= 0)}
+        for model, column, rows in SUMMARIES
+    }
+
+
+def stock_deltas(old_state, new_state):
+    """
+    Returns {(summary model, id): {counter: delta}} for a Stock row moving from old_state to
+    new_state, either of which may be None (row created or deleted).
+    """
+    deltas = {}
+    if old_state is not None:
+        merge_deltas(deltas, {key: {field: -value for field, value in values.items()}
+                              for key, values in contribution(old_state).items()})
+    if new_state is not None:
+        merge_deltas(deltas, contribution(new_state))
+    return {key: values for key, values in deltas.items() if any(values.values())}
+
+
+def merge_deltas(total, deltas):
+    """
+    Adds `deltas` into `total` in place, so a batch of changes is applied with one UPDATE per summary row.
+    """
+    for key, values in deltas.items():
+        current = total.setdefault(key, dict.fromkeys(values, 0))
+        for field, value in values.items():
+            current[field] = current.get(field, 0) + value
+    return total
+
+
+def apply_deltas(deltas):
+    """
+    Applies summary deltas with F() expressions, shops before books and in id order, so
+    concurrent writers take the summary row locks in the same order.
+    A missing summary row is created empty first when the change adds a Stock row; a
+    missing row otherwise belongs to a shop or book deleted in this transaction.
+    """
+    for model, _, rows in SUMMARIES:
+        for (_, pk), values in sorted(((key, values) for key, values in deltas.items() if key[0] is model),
+                                           key=lambda item: item[0][1]):
+            changes = {field: F(field) + value for field, value in values.items() if value}
+            if not changes or model.objects.filter(pk=pk).update(**changes):
+                continue
+            if values.get(rows, 0) > 0:
+                model.objects.bulk_create([model(pk=pk)], ignore_conflicts=True)
+                model.objects.filter(pk=pk).update(**changes)
+
+
+def apply_count_changes(changes):
+    """
+    Updates the summaries for Stock rows whose count was changed with QuerySet.update(),
+    which sends no signals; `changes` maps the Stock id to the amount added. Must run in
+    the transaction that made the changes, the rows are still locked so their counts are exact.
+    """
+    deltas = {}
+    for stock_id, shop_id, book_id, count in (Stock.objects.filter(pk__in=changes)
+                                              .values_list('pk', 'shop_id', 'book_id', 'count')):
+        merge_deltas(deltas, stock_deltas((shop_id, book_id, count - changes[stock_id]), (shop_id, book_id, count)))
+    apply_deltas(deltas)
+
+
+def rebuild_inventory(shop_ids=None, book_ids=None):
+    """
+    Recomputes the summaries of the given shops and books from Stock (all of them for None,
+    nothing for an empty list). Summaries of shops and books without stock any more are zeroed.
+    Returns the number of summary rows written.
+    """
+    written = 0
+    for (model, column, rows), ids in zip(SUMMARIES, (shop_ids, book_ids)):
+        stock = Stock.objects.order_by()
+        summaries = model.objects.all()
+        if ids is not None:
+            stock = stock.filter(**{f'{column}__in': ids})
+            summaries = summaries.filter(pk__in=ids)
+        totals = stock.values(column).annotate(units=Sum('count'), stocked=Count('pk'),
+                                               out_of_stock=Count('pk', filter=Q(count__lte=0)))
+        objs = [model(pk=row[column], units=row['units'], out_of_stock=row['out_of_stock'], **{rows: row['stocked']})
+                for row in totals]
+        model.objects.bulk_create(objs, update_conflicts=True, unique_fields=[model._meta.pk.name],
+                                  update_fields=list(model.COUNTER_FIELDS))
+        summaries.exclude(pk__in=stock.values(column)).update(**dict.fromkeys(model.COUNTER_FIELDS, 0))
+        written += len(objs)
+    return written
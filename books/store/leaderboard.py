@@ -0,0 +1,340 @@
+import datetime
+import math
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Q, Value
+from django.db.models.functions import Greatest, Least, Now, Power
+
+from store.models import Book, BookScore
+
+# Top rated is a Bayesian average: every book starts with RATING_PRIOR_COUNT rates of
+# RATING_PRIOR_MEAN, so a single 5 does not beat a hundred 4s.
+RATING_PRIOR_COUNT = 5
+RATING_PRIOR_MEAN = 3.0
+
+# Trending activity weights, decayed with a half-life of STORE_TRENDING_HALF_LIFE seconds.
+LIKE_WEIGHT = 1.0
+RATE_WEIGHT = 1.0
+COMMENT_WEIGHT = 0.5
+
+# A sync re-reads the changes of the last SYNC_SLACK seconds, so a transaction that
+# commits up to that long after its updated_at is not missed by other processes.
+SYNC_SLACK = 10
+
+BOARDS = ('top-rated', 'trending')
+
+
+def half_life():
+    return getattr(settings, 'STORE_TRENDING_HALF_LIFE', 3.5 * 86400)
+
+
+def sync_interval():
+    return getattr(settings, 'STORE_LEADERBOARD_SYNC_INTERVAL', 5.0)
+
+
+class SkipListNode:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        # width[i]: how many positions next[i] is ahead of this node.
+        self.width = [1] * level
+
+
+class SkipList:
+    """
+    Sorted collection of distinct keys with O(log n) insert, remove, rank() and
+    indexed access: an indexable skiplist, every link knows how many items it skips.
+    """
+    max_level = 32
+
+    def __init__(self, seed=None):
+        self.random = random.Random(seed)
+        self.tail = SkipListNode(None, 0)
+        self.head = SkipListNode(None, self.max_level)
+        self.head.next = [self.tail] * self.max_level
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return self.iter_from(0)
+
+    def _chain(self, key):
+        """
+        Returns, per level, the last node before `key` and the position of that node.
+        """
+        chain, positions = [None] * self.max_level, [0] * self.max_level
+        node, position = self.head, 0
+        for level in reversed(range(self.max_level)):
+            while node.next[level] is not self.tail and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+            chain[level], positions[level] = node, position
+        return chain, positions
+
+    def insert(self, key):
+        chain, positions = self._chain(key)
+        if chain[0].next[0] is not self.tail and chain[0].next[0].key == key:
+            raise KeyError(key)
+        level = min(self.max_level, 1 - int(math.log2(1 - self.random.random())))
+        node = SkipListNode(key, level)
+        position = positions[0] + 1
+        for i in range(level):
+            previous = chain[i]
+            node.next[i], previous.next[i] = previous.next[i], node
+            node.width[i] = previous.width[i] - (position - positions[i]) + 1
+            previous.width[i] = position - positions[i]
+        for i in range(level, self.max_level):
+            chain[i].width[i] += 1
+        self.size += 1
+
+    def remove(self, key):
+        chain, _ = self._chain(key)
+        node = chain[0].next[0]
+        if node is self.tail or node.key != key:
+            raise KeyError(key)
+        for i in range(len(node.next)):
+            chain[i].width[i] += node.width[i] - 1
+            chain[i].next[i] = node.next[i]
+        for i in range(len(node.next), self.max_level):
+            chain[i].width[i] -= 1
+        self.size -= 1
+
+    def rank(self, key):
+        """
+        Returns the 0-based position of `key`, None if it is not in the list.
+        """
+        chain, positions = self._chain(key)
+        node = chain[0].next[0]
+        return positions[0] if node is not self.tail and node.key == key else None
+
+    def iter_from(self, index):
+        """
+        Iterates over the keys from position `index` on.
+        """
+        node, remaining = self.head, index + 1
+        for level in reversed(range(self.max_level)):
+            while node.next[level] is not self.tail and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        if remaining:
+            return
+        while node is not self.tail:
+            yield node.key
+            node = node.next[0]
+
+
+def relation_activity(state):
+    """
+    Returns the book id and the trending weight of a single relation.
+    """
+    book_id, like, rate = state
+    return book_id, LIKE_WEIGHT * bool(like) + (RATE_WEIGHT * (rate - 1) / 4 if rate else 0)
+
+
+def activity_deltas(old_state, new_state):
+    """
+    Returns {book_id: weight delta} for a relation moving from old_state to new_state, either
+    of which may be None. Books whose relation changed are included even for a zero delta,
+    their rating may have moved.
+    """
+    deltas = {}
+    if old_state == new_state:
+        return deltas
+    if old_state is not None:
+        book_id, weight = relation_activity(old_state)
+        deltas[book_id] = deltas.get(book_id, 0) - weight
+    if new_state is not None:
+        book_id, weight = relation_activity(new_state)
+        deltas[book_id] = deltas.get(book_id, 0) + weight
+    return deltas
+
+
+def merge_activity(total, deltas):
+    """
+    Adds activity `deltas` into `total` in place, so a batch touches every BookScore row once.
+    """
+    for book_id, weight in deltas.items():
+        total[book_id] = total.get(book_id, 0) + weight
+    return total
+
+
+def record_activity(deltas, create=True):
+    """
+    Adds trending weight to the BookScore rows of `deltas` ({book_id: weight}, decaying
+    the stored score to now first) and moves their updated_at. A missing row is created
+    unless `create` is false (deletes: the book may be deleted in this transaction).
+    The in-process leaderboard picks the books up once the transaction commits.
+    """
+    now = time.time()
+    elapsed_half_lives = Least((Value(now) - F('trending_at')) / Value(float(half_life())), Value(1000.0))
+    for book_id, weight in sorted(deltas.items()):
+        changes = {'updated_at': Now()}
+        if weight:
+            changes.update(trending=Greatest(F('trending') * Power(Value(0.5), elapsed_half_lives) + Value(weight),
+                                             Value(0.0)),
+                           trending_at=Value(now))
+        if BookScore.objects.filter(pk=book_id).update(**changes) or not create:
+            continue
+        BookScore.objects.bulk_create([BookScore(pk=book_id, trending_at=now)], ignore_conflicts=True)
+        BookScore.objects.filter(pk=book_id).update(**changes)
+    if deltas and leaderboard.built:
+        book_ids = list(deltas)
+        transaction.on_commit(lambda: leaderboard.refresh(book_ids))
+
+
+def rebuild_scores(books=None):
+    """
+    Rewrites the BookScore rows of `books` (all books by default) from their counters, as if
+    every like, rate and comment happened now: relations keep no time to decay from. Books
+    without relations or comments lose their row. Run after rebuild_counters. Returns the
+    number of rows written.
+    """
+    if books is None:
+        books = Book.objects.all()
+    BookScore.objects.filter(book__in=books).delete()
+    now = time.time()
+    rows = books.filter(Q(likes_count__gt=0) | Q(rating_count__gt=0) | Q(comments_count__gt=0)).values_list(
+        'pk', 'likes_count', 'rating_sum', 'rating_count', 'comments_count')
+    scores = [BookScore(book_id=book_id, trending_at=now,
+                        trending=(LIKE_WEIGHT * likes_count + RATE_WEIGHT * (rating_sum - rating_count) / 4
+                                  + COMMENT_WEIGHT * comments_count))
+              for book_id, likes_count, rating_sum, rating_count, comments_count in rows]
+    BookScore.objects.bulk_create(scores)
+    return len(scores)
+
+
+def rating_value(rating_sum, rating_count):
+    return (rating_sum + RATING_PRIOR_COUNT * RATING_PRIOR_MEAN) / (rating_count + RATING_PRIOR_COUNT)
+
+
+def trending_value(key, now=None):
+    """
+    Turns a trending ranking key back into the decayed score at `now`.
+    """
+    return 2 ** (key - (time.time() if now is None else now) / half_life())
+
+
+class Leaderboard:
+    """
+    In-process ranking of books by rating and by trending score, one SkipList per board
+    keyed on (-value, book id). Built from the database on first use; afterwards local
+    changes are applied on commit and changes made by other processes are read from
+    BookScore.updated_at at most every STORE_LEADERBOARD_SYNC_INTERVAL seconds.
+
+    Trending books are keyed on log2(score) + trending_at / half-life, which orders them
+    by their score decayed to any common time, so the keys never need to be decayed.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.built = False
+            self.boards = {name: SkipList() for name in BOARDS}
+            self.keys = {name: {} for name in BOARDS}
+            self.synced_up_to = None
+            self.synced_at = 0
+
+    def _set(self, name, book_id, value):
+        old = self.keys[name].pop(book_id, None)
+        if old is not None:
+            self.boards[name].remove((old, book_id))
+        if value is not None:
+            self.keys[name][book_id] = -value
+            self.boards[name].insert((-value, book_id))
+
+    def update(self, book_id, rating_sum, rating_count, trending, trending_at):
+        with self.lock:
+            self._set('top-rated', book_id, rating_value(rating_sum, rating_count) if rating_count else None)
+            self._set('trending', book_id,
+                      math.log2(trending) + trending_at / half_life() if trending and trending > 0 else None)
+
+    def remove(self, book_id):
+        with self.lock:
+            for name in BOARDS:
+                self._set(name, book_id, None)
+
+    def build(self):
+        with self.lock:
+            self.reset()
+            self.synced_up_to = BookScore.objects.aggregate(latest=Max('updated_at'))['latest']
+            rows = Book.objects.filter(Q(rating_count__gt=0) | Q(trending_score__trending__gt=0)).values_list(
+                'pk', 'rating_sum', 'rating_count', 'trending_score__trending', 'trending_score__trending_at')
+            for row in rows.iterator(chunk_size=10000):
+                self.update(*row)
+            self.built = True
+            self.synced_at = time.monotonic()
+
+    def refresh(self, book_ids):
+        """
+        Reloads the given books from the database.
+        """
+        with self.lock:
+            if not self.built:
+                return
+            missing = set(book_ids)
+            for row in Book.objects.filter(pk__in=book_ids).values_list(
+                    'pk', 'rating_sum', 'rating_count', 'trending_score__trending', 'trending_score__trending_at'):
+                self.update(*row)
+                missing.discard(row[0])
+            for book_id in missing:
+                self.remove(book_id)
+
+    def sync(self):
+        with self.lock:
+            if not self.built:
+                self.build()
+                return
+            if time.monotonic() - self.synced_at < sync_interval():
+                return
+            rows = BookScore.objects.all()
+            if self.synced_up_to is not None:
+                rows = rows.filter(updated_at__gte=self.synced_up_to - datetime.timedelta(seconds=SYNC_SLACK))
+            for book_id, rating_sum, rating_count, trending, trending_at, updated_at in rows.values_list(
+                    'book', 'book__rating_sum', 'book__rating_count', 'trending', 'trending_at', 'updated_at'):
+                self.update(book_id, rating_sum, rating_count, trending, trending_at)
+                if self.synced_up_to is None or updated_at > self.synced_up_to:
+                    self.synced_up_to = updated_at
+            self.synced_at = time.monotonic()
+
+    def top(self, name, offset=0, limit=20):
+        """
+        Returns the number of ranked books and [(book id, rank, value)] for the `limit` books
+        from 0-based rank `offset` on.
+        """
+        self.sync()
+        now = time.time()
+        with self.lock:
+            entries = []
+            for key, book_id in self.boards[name].iter_from(offset):
+                if len(entries) == limit:
+                    break
+                entries.append((book_id, offset + len(entries), self.value(name, key, now)))
+            return len(self.boards[name]), entries
+
+    def rank(self, name, book_id):
+        """
+        Returns (rank, value) of the book, None if it is not ranked.
+        """
+        self.sync()
+        with self.lock:
+            key = self.keys[name].get(book_id)
+            if key is None:
+                return None
+            return self.boards[name].rank((key, book_id)), self.value(name, key)
+
+    def value(self, name, key, now=None):
+        return -key if name == 'top-rated' else trending_value(-key, now)
+
+
+leaderboard = Leaderboard()
@@ -0,0 +1,203 @@
+import json
+import math
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from books.urls import router
+from store.fastpath import CompiledSerializer
+from store.models import Book, Comment, Quote, Stock
+from store.serializers import BookSerializer, CommentSerializer, QuoteSerializer, StockSerializer
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = ('Drives every GET endpoint of the store router in-process and reports latency percentiles and '
+            'queries per request, then measures bulk import throughput inside a rolled back transaction '
+            'and the rows/s of the serializers against their compiled list path.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint.')
+        parser.add_argument('--export-requests', type=int, default=3,
+                            help='Requests per streaming export, each one reads the whole catalog.')
+        parser.add_argument('--import-rows', type=int, default=5000, help='Rows posted to each bulk endpoint.')
+        parser.add_argument('--serialize-rows', type=int, default=1000,
+                            help='Rows read and serialized per serializer run, like a page of that size.')
+        parser.add_argument('--username', help='User to authenticate as (the first staff user by default).')
+        parser.add_argument('--cold', action='store_true', help='Clear the cache before every request.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Also write the results as JSON to this file.')
+
+    def handle(self, *args, **options):
+        if settings.DEBUG:
+            self.stderr.write('DEBUG is on: query logging and the debug toolbar skew the numbers.')
+        self.random = random.Random(options['seed'])
+        self.cold = options['cold']
+        self.user = self.get_user(options['username'])
+        host = next((host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')),
+                    'localhost')
+        # A documentation address keeps the debug toolbar (shown to INTERNAL_IPS) out of the measurements.
+        self.client = Client(SERVER_NAME=host, REMOTE_ADDR='192.0.2.1')
+        self.client.force_login(self.user)
+
+        results = {'endpoints': {}, 'imports': {}, 'serializers': {}}
+        for name, urls, streaming in self.scenarios():
+            result = self.run(urls, options['export_requests'] if streaming else options['requests'])
+            results['endpoints'][name] = result
+            self.stdout.write(f'{name:<32} p50 {result["p50_ms"]:8.2f}ms  p95 {result["p95_ms"]:8.2f}ms  '
+                              f'p99 {result["p99_ms"]:8.2f}ms  {result["queries"]:5.1f} queries/req'
+                              + (f'  {result["errors"]} errors' if result['errors'] else ''))
+        if options['import_rows']:
+            for name, url, rows, batch_size in self.imports(options['import_rows']):
+                rate = self.run_import(name, url, rows, batch_size)
+                results['imports'][name] = {'rows': len(rows), 'rows_per_s': rate}
+                self.stdout.write(f'{name:<32} {len(rows)} rows, {rate:,.0f} rows/s')
+        if options['serialize_rows']:
+            for name, queryset, serializer in self.serializers():
+                result = self.run_serializer(name, queryset, serializer, options['serialize_rows'])
+                results['serializers'][name] = result
+                self.stdout.write(f'{name:<32} {result["rows"]} rows, {result["serializer_rows_per_s"]:,.0f} rows/s, '
+                                  f'compiled {result["compiled_rows_per_s"]:,.0f} rows/s')
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+
+    def get_user(self, username):
+        users = User.objects.all()
+        user = users.filter(username=username).first() if username else (
+            users.filter(is_staff=True).order_by('pk').first() or users.order_by('pk').first())
+        if user is None:
+            raise CommandError('No user to authenticate as, run generate_catalog first')
+        return user
+
+    def sample(self, queryset, field, size=50):
+        return list(queryset.order_by('?').values_list(field, flat=True)[:size])
+
+    def scenarios(self):
+        """
+        Yields (name, [url, ...], streaming) for every list, retrieve and GET extra action of
+        the router. Viewsets without a queryset (checkout) only accept writes and are skipped.
+        """
+        for _, viewset, basename in router.registry:
+            queryset = getattr(viewset, 'queryset', None)
+            if queryset is None:
+                continue
+            list_url = reverse(f'{basename}-list')
+            urls = [list_url]
+            # Follow a few pages so keyset pagination is measured past the first page.
+            response = self.client.get(list_url)
+            for _ in range(3):
+                next_url = response.json().get('next') if response.status_code == 200 else None
+                if not next_url:
+                    break
+                urls.append(next_url)
+                response = self.client.get(next_url)
+            yield f'{viewset.__name__}.list', urls, False
+
+            lookup = getattr(viewset, 'lookup_field', 'pk')
+            if lookup == 'book':
+                keys = self.sample(queryset.model.objects.filter(user=self.user), 'book')
+            else:
+                keys = self.sample(queryset.model.objects.all(), lookup)
+            if keys:
+                yield (f'{viewset.__name__}.retrieve', [reverse(f'{basename}-detail', args=[key]) for key in keys],
+                       False)
+
+            for extra in viewset.get_extra_actions():
+                if 'get' in extra.mapping and not extra.detail:
+                    yield f'{viewset.__name__}.{extra.__name__}', [reverse(f'{basename}-{extra.url_name}')], True
+
+    def run(self, urls, total):
+        latencies, queries, errors = [], [], 0
+        for index in range(total):
+            url = urls[index % len(urls)]
+            if self.cold:
+                cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = self.client.get(url)
+                errors += response.status_code >= 400
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(len(context.captured_queries))
+        return {
+            'requests': total,
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'mean_ms': statistics.fmean(latencies),
+            'queries': statistics.fmean(queries),
+            'errors': errors,
+        }
+
+    def imports(self, total):
+        """
+        Yields (name, url, rows, rows per request) for the bulk endpoints.
+        """
+        viewsets = {viewset.__name__: (viewset, basename) for _, viewset, basename in router.registry}
+        books = [{'name': f'Импорт {index}', 'price': f'{self.random.randint(100, 3000)}.00',
+                  'author_name': 'Автор импорта'} for index in range(total)]
+        relations = [{'book': book_id, 'like': True, 'rate': self.random.randint(1, 5)}
+                     for book_id in self.sample(Book.objects.all(), 'pk', total)]
+        for name, rows in (('BookViewSet', books), ('UserBookRelationViewSet', relations)):
+            viewset, basename = viewsets[name]
+            yield f'{name}.bulk', reverse(f'{basename}-bulk'), rows, viewset.bulk_max_rows
+
+    def run_import(self, name, url, rows, batch_size):
+        started = time.perf_counter()
+        with transaction.atomic():
+            for start in range(0, len(rows), batch_size):
+                response = self.client.post(url, rows[start:start + batch_size], content_type='application/json')
+                if response.status_code >= 400:
+                    raise CommandError(f'{name} failed with {response.status_code}: {response.content[:200]}')
+            elapsed = time.perf_counter() - started
+            # The benchmark must not leave its rows behind.
+            transaction.set_rollback(True)
+        return len(rows) / elapsed if elapsed else 0
+
+    def serializers(self):
+        """
+        Yields (name, queryset, serializer) for the serializers of the compiled list endpoints.
+        """
+        yield 'BookSerializer', Book.objects.with_rate().order_by('pk'), BookSerializer()
+        yield 'StockSerializer', Stock.objects.order_by('pk'), StockSerializer()
+        yield 'CommentSerializer', Comment.objects.select_related('user').order_by('pk'), CommentSerializer()
+        yield 'QuoteSerializer', Quote.objects.order_by('pk'), QuoteSerializer()
+
+    def run_serializer(self, name, queryset, serializer, total, repeat=3):
+        """
+        Reads and serializes `total` rows with the serializer and with its CompiledSerializer,
+        best of `repeat` runs each. The two outputs must be equal.
+        """
+        compiled = CompiledSerializer.compile(serializer, queryset)
+        timings = {'serializer': [], 'compiled': []}
+        for _ in range(repeat):
+            started = time.perf_counter()
+            expected = type(serializer)(list(queryset[:total]), many=True).data
+            timings['serializer'].append(time.perf_counter() - started)
+            started = time.perf_counter()
+            data = compiled.to_representation(list(compiled.values(queryset)[:total]))
+            timings['compiled'].append(time.perf_counter() - started)
+            if data != expected:
+                raise CommandError(f'{name}: the compiled output differs from the serializer')
+        rows = len(expected)
+        return {
+            'rows': rows,
+            'serializer_rows_per_s': rows / min(timings['serializer']) if rows else 0,
+            'compiled_rows_per_s': rows / min(timings['compiled']) if rows else 0,
+        }
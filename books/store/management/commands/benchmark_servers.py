@@ -0,0 +1,201 @@
+import asyncio
+import importlib.util
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+HOST = '127.0.0.1'
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)] if ordered else None
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+async def read_response(reader):
+    """
+    Reads one HTTP/1.1 response, returns (status, keep_alive).
+    """
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ', 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip().lower()
+    if headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    else:
+        await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, headers.get('connection') != 'close'
+
+
+class LoadRun:
+    """
+    Keeps `connections` keep-alive connections busy with GET `path` until the deadline.
+    `slow_clients` more connections trickle request headers and never finish a request,
+    the way slow mobile clients hold a connection open.
+    """
+
+    def __init__(self, port, path, connections, duration, timeout, slow_clients):
+        self.port = port
+        self.request = f'GET {path} HTTP/1.1\r\nHost: {HOST}\r\n\r\n'.encode()
+        self.connections = connections
+        self.duration = duration
+        self.timeout = timeout
+        self.slow_clients = slow_clients
+        self.latencies = []
+        self.errors = 0
+
+    async def client(self, deadline):
+        reader = writer = None
+        while time.perf_counter() < deadline:
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.wait_for(asyncio.open_connection(HOST, self.port), self.timeout)
+                started = time.perf_counter()
+                writer.write(self.request)
+                status, keep_alive = await asyncio.wait_for(read_response(reader), self.timeout)
+                self.latencies.append((time.perf_counter() - started) * 1000)
+                self.errors += status >= 400
+                if not keep_alive:
+                    writer.close()
+                    writer = None
+            except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                self.errors += 1
+                if writer is not None:
+                    writer.close()
+                writer = None
+                await asyncio.sleep(0.01)
+        if writer is not None:
+            writer.close()
+
+    async def slow_client(self, deadline):
+        try:
+            _, writer = await asyncio.open_connection(HOST, self.port)
+            writer.write(self.request.split(b'\r\n')[0] + b'\r\n')
+            while time.perf_counter() < deadline:
+                await asyncio.sleep(1)
+                writer.write(b'X-Slow: 1\r\n')
+            writer.close()
+        except OSError:
+            pass
+
+    async def run(self):
+        deadline = time.perf_counter() + self.duration
+        slow = [asyncio.create_task(self.slow_client(deadline + 1)) for _ in range(self.slow_clients)]
+        await asyncio.sleep(0.5 if slow else 0)
+        started = time.perf_counter()
+        await asyncio.gather(*(self.client(deadline) for _ in range(self.connections)))
+        elapsed = time.perf_counter() - started
+        for task in slow:
+            task.cancel()
+        return {
+            'requests': len(self.latencies),
+            'requests_per_s': len(self.latencies) / elapsed,
+            'p50_ms': percentile(self.latencies, 50),
+            'p95_ms': percentile(self.latencies, 95),
+            'p99_ms': percentile(self.latencies, 99),
+            'errors': self.errors,
+        }
+
+
+class Command(BaseCommand):
+    help = ('Starts the project under gunicorn (WSGI, threaded workers) and uvicorn (ASGI), drives each with '
+            'the same number of concurrent keep-alive connections and compares throughput and latency. '
+            'The sync endpoint runs under both servers, the async one under uvicorn.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=1000)
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per server.')
+        parser.add_argument('--workers', type=int, default=1, help='Processes per server.')
+        parser.add_argument('--threads', type=int, default=32, help='Threads per gunicorn worker.')
+        parser.add_argument('--sync-path', default='/book/?ordering=price')
+        parser.add_argument('--async-path', default='/async/book/?ordering=price')
+        parser.add_argument('--slow-clients', type=int, default=0,
+                            help='Extra connections that never complete a request.')
+        parser.add_argument('--timeout', type=float, default=30, help='Per request timeout in seconds.')
+        parser.add_argument('--cache', action='store_true',
+                            help='Keep the configured cache; by default it is replaced by DummyCache so every '
+                                 'request reaches the database.')
+        parser.add_argument('--output', help='Also write the results as JSON to this file.')
+
+    def handle(self, *args, **options):
+        for module in ('gunicorn', 'uvicorn'):
+            if importlib.util.find_spec(module) is None:
+                raise CommandError(f'{module} is not installed (pip install -r requirements.txt)')
+        scenarios = [
+            ('wsgi', self.gunicorn_command(options), options['sync_path']),
+            ('asgi', self.uvicorn_command(options), options['sync_path']),
+            ('asgi-async', self.uvicorn_command(options), options['async_path']),
+        ]
+        results = {}
+        for name, command, path in scenarios:
+            port = free_port()
+            result = self.run_server([part.format(port=port) for part in command], port, path, options)
+            results[name] = {'path': path, **result}
+            self.stdout.write(
+                f'{name:<11} {path:<30} {result["requests_per_s"]:8.1f} req/s  p50 {result["p50_ms"] or 0:8.1f}ms  '
+                f'p95 {result["p95_ms"] or 0:8.1f}ms  p99 {result["p99_ms"] or 0:8.1f}ms  {result["errors"]} errors')
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+
+    def gunicorn_command(self, options):
+        return [sys.executable, '-m', 'gunicorn', 'books.wsgi:application', '--bind', f'{HOST}:{{port}}',
+                '--worker-class', 'gthread', '--workers', str(options['workers']), '--threads',
+                str(options['threads']), '--backlog', '4096', '--keep-alive', '30', '--log-level', 'warning']
+
+    def uvicorn_command(self, options):
+        return [sys.executable, '-m', 'uvicorn', 'books.asgi:application', '--host', HOST, '--port', '{port}',
+                '--workers', str(options['workers']), '--backlog', '4096', '--no-access-log', '--log-level',
+                'warning']
+
+    def server_env(self, options):
+        env = {**os.environ, 'DEBUG': 'False', 'ALLOWED_HOSTS': HOST}
+        if not options['cache']:
+            env['CACHE_BACKEND'] = 'django.core.cache.backends.dummy.DummyCache'
+        return env
+
+    def run_server(self, command, port, path, options):
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=self.server_env(options))
+        try:
+            self.wait_until_ready(server, port)
+            return asyncio.run(LoadRun(port, path, options['connections'], options['duration'], options['timeout'],
+                                       options['slow_clients']).run())
+        finally:
+            server.terminate()
+            try:
+                server.wait(10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    def wait_until_ready(self, server, port, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'{server.args[2]} exited with {server.returncode}')
+            try:
+                with socket.create_connection((HOST, port), timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f'{server.args[2]} did not start within {timeout}s')
@@ -0,0 +1,202 @@
+import itertools
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from store.cache import bump_generation
+from store.models import Book, Comment, Quote, Shop, Stock, UserBookRelation
+
+TITLE_WORDS = ['Война', 'Мир', 'Тень', 'Сад', 'Дом', 'Ночь', 'Город', 'Море', 'Путь', 'Сон', 'Огонь', 'Ветер',
+               'Память', 'Дорога', 'Звезда', 'Остров', 'Зима', 'Лето', 'Река', 'Небо']
+TITLE_ADJECTIVES = ['Тихий', 'Последний', 'Белый', 'Вечный', 'Забытый', 'Северный', 'Красный', 'Долгий',
+                    'Чужой', 'Старый', 'Новый', 'Тайный']
+FIRST_NAMES = ['Лев', 'Фёдор', 'Михаил', 'Анна', 'Иван', 'Мария', 'Алексей', 'Ольга', 'Николай', 'Елена']
+LAST_NAMES = ['Толстой', 'Достоевский', 'Булгаков', 'Ахматова', 'Бунин', 'Цветаева', 'Чехов', 'Гоголь',
+              'Набоков', 'Пастернак', 'Тургенев', 'Пушкин']
+
+
+def count(value):
+    """
+    Argument type accepting 1000, 1e6 or 2_000_000.
+    """
+    try:
+        number = int(float(value))
+    except ValueError:
+        raise CommandError(f'Not a number: {value}')
+    if number < 0:
+        raise CommandError(f'Must not be negative: {value}')
+    return number
+
+
+def zipf_weights(size, exponent):
+    """
+    Cumulative Zipf weights for ranks 1..size, for random.choices(cum_weights=...).
+    """
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, size + 1)))
+
+
+def chunks(total, size):
+    for start in range(0, total, size):
+        yield min(size, total - start)
+
+
+class Command(BaseCommand):
+    help = ('Fills the database with a synthetic catalog: books with Zipf-distributed popularity, '
+            'readers with a long tail of activity, ratings, shops, stock and comments. '
+            'The output is reproducible for a given --seed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=count, default=10000)
+        parser.add_argument('--users', type=count, default=1000)
+        parser.add_argument('--relations', type=count, default=100000,
+                            help='Relations to generate; repeated (user, book) pairs are dropped.')
+        parser.add_argument('--shops', type=count, default=20)
+        parser.add_argument('--comments', type=count, default=None, help='Defaults to a tenth of --relations.')
+        parser.add_argument('--quotes', type=count, default=None, help='Defaults to a tenth of --books.')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Exponent of the book popularity distribution.')
+        parser.add_argument('--reader-zipf', type=float, default=0.8,
+                            help='Exponent of the reader activity distribution.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--chunk-size', type=count, default=5000, help='Rows per bulk_create.')
+        parser.add_argument('--prefix', default='reader', help='Username prefix of the generated users.')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.chunk_size = max(options['chunk_size'], 1)
+        if options['relations'] and not (options['books'] and options['users']):
+            raise CommandError('--relations needs at least one book and one user')
+        comments = options['comments'] if options['comments'] is not None else options['relations'] // 10
+        quotes = options['quotes'] if options['quotes'] is not None else options['books'] // 10
+
+        user_ids = self.create_users(options['users'], options['prefix'])
+        book_ids = self.create_books(options['books'], user_ids)
+        shop_ids = self.create_shops(options['shops'])
+        self.create_stock(book_ids, shop_ids)
+        # Popularity follows a rank, the ranks are shuffled so popular books are spread over the id range.
+        popular_books = self.random.sample(book_ids, len(book_ids))
+        active_users = self.random.sample(user_ids, len(user_ids))
+        book_weights = zipf_weights(len(popular_books), options['zipf'])
+        user_weights = zipf_weights(len(active_users), options['reader_zipf'])
+        self.create_relations(options['relations'], popular_books, book_weights, active_users, user_weights)
+        if comments and book_ids and user_ids:
+            self.create_comments(comments, popular_books, book_weights, active_users, user_weights)
+        if quotes and book_ids:
+            self.create_quotes(quotes, popular_books, book_weights, user_ids)
+
+        call_command('rebuild_book_counters', stdout=self.stdout)
+        call_command('rebuild_book_scores', stdout=self.stdout)
+        call_command('rebuild_inventory', stdout=self.stdout)
+        for model in (Book, UserBookRelation, Comment, Quote, Shop, Stock):
+            bump_generation(model)
+
+    def report(self, label, rows, started):
+        elapsed = time.perf_counter() - started
+        rate = rows / elapsed if elapsed else 0
+        self.stdout.write(f'{label}: {rows} rows in {elapsed:.1f}s ({rate:,.0f} rows/s)')
+
+    def insert(self, model, objs, **kwargs):
+        return model.objects.bulk_create(objs, batch_size=self.chunk_size, **kwargs)
+
+    def create_users(self, total, prefix):
+        started = time.perf_counter()
+        password = make_password(None)
+        first = User.objects.filter(username__startswith=prefix).count()
+        ids = []
+        for size in chunks(total, self.chunk_size):
+            users = [User(username=f'{prefix}{first + len(ids) + index}', password=password) for index in range(size)]
+            ids.extend(user.pk for user in self.insert(User, users))
+        self.report('users', len(ids), started)
+        return ids
+
+    def create_books(self, total, user_ids):
+        started = time.perf_counter()
+        authors = [f'{self.random.choice(FIRST_NAMES)} {self.random.choice(LAST_NAMES)}'
+                   for _ in range(max(total // 20, 1))]
+        author_weights = zipf_weights(len(authors), 1.0)
+        ids = []
+        for size in chunks(total, self.chunk_size):
+            books = []
+            for author in self.random.choices(authors, cum_weights=author_weights, k=size):
+                books.append(Book(
+                    name=(f'{self.random.choice(TITLE_ADJECTIVES)} {self.random.choice(TITLE_WORDS).lower()} '
+                          f'{len(ids) + len(books) + 1}'),
+                    price=Decimal(self.random.randint(10000, 300000)) / 100,
+                    author_name=author,
+                    owner_id=self.random.choice(user_ids) if user_ids else None,
+                ))
+            ids.extend(book.pk for book in self.insert(Book, books))
+        self.report('books', len(ids), started)
+        return ids
+
+    def create_shops(self, total):
+        started = time.perf_counter()
+        shops = self.insert(Shop, [Shop(name=f'Магазин {index + 1}') for index in range(total)])
+        self.report('shops', len(shops), started)
+        return [shop.pk for shop in shops]
+
+    def create_stock(self, book_ids, shop_ids):
+        if not shop_ids:
+            return
+        started = time.perf_counter()
+        rows = 0
+        for start in range(0, len(book_ids), self.chunk_size):
+            stock, listed = [], []
+            for book_id in book_ids[start:start + self.chunk_size]:
+                for shop_id in self.random.sample(shop_ids, min(len(shop_ids), self.random.randint(1, 3))):
+                    stock.append(Stock(shop_id=shop_id, book_id=book_id, count=self.random.randint(0, 50)))
+                    listed.append(Shop.books.through(shop_id=shop_id, book_id=book_id))
+            self.insert(Stock, stock)
+            self.insert(Shop.books.through, listed, ignore_conflicts=True)
+            rows += len(stock)
+        self.report('stock', rows, started)
+
+    def create_relations(self, total, book_ids, book_weights, user_ids, user_weights):
+        started = time.perf_counter()
+        before = UserBookRelation.objects.count()
+        total = min(total, len(book_ids) * len(user_ids))
+        created = stalled = 0
+        # Active readers meet popular books more than once. Repeated pairs are skipped by the
+        # unique constraint, so keep drawing until the target is reached or hardly anything new comes up.
+        while created < total and stalled < 3:
+            missing = total - created
+            for size in chunks(missing, self.chunk_size):
+                books = self.random.choices(book_ids, cum_weights=book_weights, k=size)
+                users = self.random.choices(user_ids, cum_weights=user_weights, k=size)
+                relations = []
+                for user_id, book_id in dict.fromkeys(zip(users, books)):
+                    rated = self.random.random() < 0.6
+                    relations.append(UserBookRelation(
+                        user_id=user_id, book_id=book_id,
+                        like=self.random.random() < 0.3,
+                        in_bookmarks=self.random.random() < 0.1,
+                        rate=self.random.choices((1, 2, 3, 4, 5), weights=(1, 2, 4, 6, 5))[0] if rated else None,
+                    ))
+                self.insert(UserBookRelation, relations, ignore_conflicts=True)
+            stored = UserBookRelation.objects.count() - before
+            stalled = stalled + 1 if stored - created <= missing // 100 else 0
+            created = stored
+        self.report('relations', created, started)
+
+    def create_comments(self, total, book_ids, book_weights, user_ids, user_weights):
+        started = time.perf_counter()
+        for size in chunks(total, self.chunk_size):
+            books = self.random.choices(book_ids, cum_weights=book_weights, k=size)
+            users = self.random.choices(user_ids, cum_weights=user_weights, k=size)
+            self.insert(Comment, [Comment(user_id=user_id, book_id=book_id, text=f'Отзыв о книге {book_id}')
+                                  for user_id, book_id in zip(users, books)])
+        self.report('comments', total, started)
+
+    def create_quotes(self, total, book_ids, book_weights, user_ids):
+        started = time.perf_counter()
+        for size in chunks(total, self.chunk_size):
+            books = self.random.choices(book_ids, cum_weights=book_weights, k=size)
+            self.insert(Quote, [Quote(book_id=book_id, text=f'Цитата из книги {book_id}',
+                                      author=f'{self.random.choice(FIRST_NAMES)} {self.random.choice(LAST_NAMES)}',
+                                      owner_id=self.random.choice(user_ids) if user_ids else None)
+                                for book_id in books])
+        self.report('quotes', total, started)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.leaderboard import rebuild_scores
+from store.models import Book
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds the trending scores (BookScore) from the book counters, as if all activity were recent. '
+            'Run rebuild_book_counters first.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Number of books rebuilt per transaction.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        written = 0
+        last_id = 0
+        while True:
+            ids = list(Book.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                written += rebuild_scores(Book.objects.filter(pk__in=ids))
+            last_id = ids[-1]
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt trending scores for {written} books'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.inventory import rebuild_inventory
+from store.models import Book, Shop
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the ShopInventory and BookInventory summaries from Stock.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Number of shops or books rebuilt per transaction.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        written = 0
+        for model, argument in ((Shop, 'shop_ids'), (Book, 'book_ids')):
+            last_id = 0
+            while True:
+                ids = list(model.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+                if not ids:
+                    break
+                with transaction.atomic():
+                    written += rebuild_inventory(**{'shop_ids': [], 'book_ids': [], argument: ids})
+                last_id = ids[-1]
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} inventory summaries'))
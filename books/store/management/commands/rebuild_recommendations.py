@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.recommendations import rebuild_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the "readers who liked this also liked" neighbours of every book from likes and rates.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=20, help='Number of similar books kept per book.')
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Number of books whose relations are read per query.')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Number of books whose similarities are computed and written at once.')
+        parser.add_argument('--max-nnz', type=int, default=5000000,
+                            help='Bound on the similarities a chunk computes at once, popular books come in '
+                                 'smaller chunks.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written = rebuild_recommendations(k=options['top_k'], batch_size=options['batch_size'],
+                                          chunk_size=options['chunk_size'], max_nnz=options['max_nnz'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {written} book similarities in {time.perf_counter() - started:.1f}s'))
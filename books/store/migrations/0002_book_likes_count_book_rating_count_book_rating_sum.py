@@ -0,0 +1,43 @@
+# Generated by Django 5.0.6 on 2026-10-18 04:21
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+    relations = UserBookRelation.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    Book.objects.update(
+        rating_sum=Coalesce(Subquery(relations.annotate(value=Sum('rate')).values('value')), Value(0)),
+        rating_count=Coalesce(Subquery(relations.annotate(value=Count('rate')).values('value')), Value(0)),
+        likes_count=Coalesce(Subquery(relations.annotate(value=Count('pk', filter=Q(like=True))).values('value')),
+                             Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
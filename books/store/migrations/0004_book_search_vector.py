@@ -0,0 +1,75 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+# The search_vector trigger and the GIN indexes only exist on PostgreSQL, other
+# databases fall back to store.search.InvertedIndex. pg_trgm is optional.
+
+SEARCH_VECTOR_SQL = [
+    """
+    CREATE FUNCTION store_book_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('simple', translate(coalesce(NEW.name, ''), 'Ёё', 'Ее')), 'A') ||
+            setweight(to_tsvector('simple', translate(coalesce(NEW.author_name, ''), 'Ёё', 'Ее')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER store_book_search_vector_update
+    BEFORE INSERT OR UPDATE OF name, author_name ON store_book
+    FOR EACH ROW EXECUTE FUNCTION store_book_search_vector()
+    """,
+    "UPDATE store_book SET name = name",
+    "CREATE INDEX store_book_search_vector_gin ON store_book USING gin (search_vector)",
+]
+
+TRIGRAM_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX store_book_name_trgm ON store_book USING gin (name gin_trgm_ops)",
+    "CREATE INDEX store_book_author_name_trgm ON store_book USING gin (author_name gin_trgm_ops)",
+]
+
+DROP_SQL = [
+    "DROP INDEX IF EXISTS store_book_author_name_trgm",
+    "DROP INDEX IF EXISTS store_book_name_trgm",
+    "DROP INDEX IF EXISTS store_book_search_vector_gin",
+    "DROP TRIGGER IF EXISTS store_book_search_vector_update ON store_book",
+    "DROP FUNCTION IF EXISTS store_book_search_vector()",
+]
+
+
+def create_search_objects(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in SEARCH_VECTOR_SQL:
+        schema_editor.execute(sql)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        trigram_available = cursor.fetchone() is not None
+    if trigram_available:
+        for sql in TRIGRAM_SQL:
+            schema_editor.execute(sql)
+
+
+def drop_search_objects(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0003_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_objects, drop_search_objects),
+    ]
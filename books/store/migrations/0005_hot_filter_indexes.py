@@ -0,0 +1,62 @@
+# Generated by Django 5.0.6 on 2026-10-18 04:37
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_relations(apps, schema_editor):
+    """
+    Keeps the newest relation of every (user, book) pair so the unique constraint can be
+    created, then recounts the counters of the books that lost rows.
+    """
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+    duplicates = (UserBookRelation.objects.order_by().values('user', 'book')
+                  .annotate(keep=Max('pk'), total=Count('pk')).filter(total__gt=1))
+    book_ids = set()
+    for row in duplicates:
+        UserBookRelation.objects.filter(user=row['user'], book=row['book']).exclude(pk=row['keep']).delete()
+        book_ids.add(row['book'])
+    if not book_ids:
+        return
+    relations = UserBookRelation.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    Book.objects.filter(pk__in=book_ids).update(
+        rating_sum=Coalesce(Subquery(relations.annotate(value=Sum('rate')).values('value')), Value(0)),
+        rating_count=Coalesce(Subquery(relations.annotate(value=Count('rate')).values('value')), Value(0)),
+        likes_count=Coalesce(Subquery(relations.annotate(value=Count('pk', filter=Q(like=True))).values('value')),
+                             Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0004_book_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['price', 'id'], name='store_book_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author_name', 'id'], name='store_book_author_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['book', 'datetime_created'], name='store_comment_book_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(fields=['shop', 'book'], name='store_stock_shop_book_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_relations, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='userbookrelation',
+            constraint=models.UniqueConstraint(fields=('user', 'book'), name='store_userbookrelation_user_book_uniq'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.0.6 on 2026-10-18 05:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Min, Q, Sum
+
+
+def merge_duplicate_stock(apps, schema_editor):
+    """
+    Folds every (shop, book) pair with several Stock rows into its oldest row, summing the
+    counts, so the unique constraint can be created.
+    """
+    Stock = apps.get_model('store', 'Stock')
+    duplicates = (Stock.objects.order_by().values('shop', 'book')
+                  .annotate(keep=Min('pk'), total=Count('pk'), units=Sum('count')).filter(total__gt=1))
+    for row in duplicates:
+        Stock.objects.filter(pk=row['keep']).update(count=row['units'])
+        Stock.objects.filter(shop=row['shop'], book=row['book']).exclude(pk=row['keep']).delete()
+
+
+def fill_inventory(apps, schema_editor):
+    Stock = apps.get_model('store', 'Stock')
+    for model_name, column, stocked in (('ShopInventory', 'shop_id', 'titles'), ('BookInventory', 'book_id', 'shops')):
+        model = apps.get_model('store', model_name)
+        totals = (Stock.objects.order_by().values(column)
+                  .annotate(units=Sum('count'), stocked=Count('pk'), out_of_stock=Count('pk', filter=Q(count__lte=0))))
+        model.objects.bulk_create(
+            (model(pk=row[column], units=row['units'], out_of_stock=row['out_of_stock'], **{stocked: row['stocked']})
+             for row in totals.iterator()),
+            batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookInventory',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='inventory', serialize=False, to='store.book')),
+                ('units', models.BigIntegerField(default=0)),
+                ('shops', models.PositiveIntegerField(default=0)),
+                ('out_of_stock', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ShopInventory',
+            fields=[
+                ('shop', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='inventory', serialize=False, to='store.shop')),
+                ('units', models.BigIntegerField(default=0)),
+                ('titles', models.PositiveIntegerField(default=0)),
+                ('out_of_stock', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(merge_duplicate_stock, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='stock',
+            name='store_stock_shop_book_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='stock',
+            constraint=models.UniqueConstraint(fields=('shop', 'book'), name='store_stock_shop_book_uniq'),
+        ),
+        migrations.RunPython(fill_inventory, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.6 on 2026-10-18 05:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_book_scores(apps, schema_editor):
+    """
+    Creates a score row for every book with relations or comments, so later changes of
+    these books are seen by the leaderboard sync. There is no history to start trending from.
+    """
+    Book = apps.get_model('store', 'Book')
+    BookScore = apps.get_model('store', 'BookScore')
+    books = Book.objects.filter(models.Q(userbookrelation__isnull=False) | models.Q(comment__isnull=False))
+    BookScore.objects.bulk_create((BookScore(book_id=pk) for pk in books.distinct().values_list('pk', flat=True)
+                                   .iterator()), batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_book_similarity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookScore',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending_score', serialize=False, to='store.book')),
+                ('trending', models.FloatField(default=0)),
+                ('trending_at', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+        migrations.RunPython(fill_book_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.6 on 2026-10-18 06:05
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_comments_count(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    Comment = apps.get_model('store', 'Comment')
+    comments = Comment.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    Book.objects.update(comments_count=Coalesce(Subquery(comments.annotate(value=Count('pk')).values('value')),
+                                                Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_book_score'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='store_comment_book_created_idx',
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_comments_count, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['book', 'datetime_created', 'id'], name='store_comment_book_feed_idx'),
+        ),
+    ]
@@ -1,5 +1,19 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, router, transaction
+from django.db.models.functions import Cast
+
+
+class BookQuerySet(models.QuerySet):
+    def with_rate(self):
+        """
+        Annotates the average rate from the stored counters, without joining UserBookRelation.
+        """
+        rate_field = models.DecimalField(max_digits=12, decimal_places=2)
+        return self.annotate(rate=models.Case(
+            models.When(rating_count=0, then=None),
+            default=Cast('rating_sum', rate_field) / models.F('rating_count'),
+            output_field=rate_field))
 
 
 class Book(models.Model):
@@ -8,6 +22,33 @@ class Book(models.Model):
     author_name = models.CharField(max_length=255, default='')
     owner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='my_books')
     readers = models.ManyToManyField(User, through='UserBookRelation', related_name='books')
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Filled by a database trigger on PostgreSQL (see migration 0004), together with its GIN index.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = BookQuerySet.as_manager()
+
+    COUNTER_FIELDS = ('rating_sum', 'rating_count', 'likes_count', 'comments_count')
+
+    class Meta:
+        indexes = [
+            # (field, id) pairs match the keyset pagination order for ?price= and ?ordering=.
+            models.Index(fields=['price', 'id'], name='store_book_price_id_idx'),
+            models.Index(fields=['author_name', 'id'], name='store_book_author_name_id_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Counters are only changed with F() updates and search_vector by a database trigger,
+        # a full save must not write back stale values.
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.COUNTER_FIELDS
+                                       and field.name != 'search_vector']
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.name} : {self.price} : {self.author_name}"
@@ -28,9 +69,27 @@ class UserBookRelation(models.Model):
     in_bookmarks = models.BooleanField(default=False)
     rate = models.PositiveSmallIntegerField(choices=RATE_CHOICES, null=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if not instance.get_deferred_fields() & {'book_id', 'like', 'rate'}:
+            instance.counted_state = instance.counter_state()
+        return instance
+
+    def counter_state(self):
+        """
+        The part of the relation that is reflected in the Book counters.
+        """
+        return self.book_id, self.like, self.rate
+
     def get_object(self):
         obl, _ = UserBookRelation.objects.get_or_create(user=self.user, book=self.book)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'book'], name='store_userbookrelation_user_book_uniq'),
+        ]
+
     def __str__(self):
         return f"{self.user.username}: {self.book.name} : {self.like}"
 
@@ -40,6 +99,20 @@ class Comment(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     text = models.TextField()
     datetime_created = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # The keyset order of the /book/<id>/comments/ feed, in either direction.
+            models.Index(fields=['book', 'datetime_created', 'id'], name='store_comment_book_feed_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'book_id' not in instance.get_deferred_fields():
+            instance.counted_state = instance.book_id
+        return instance
 
     def __str__(self):
         return f"{self.user.username}: {self.book.name} : {self.text[:10]}"
@@ -50,6 +123,7 @@ class Quote(models.Model):
     text = models.TextField()
     author = models.CharField(max_length=50)
     owner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.book.name} : {self.text[:10]}"
@@ -58,6 +132,7 @@ class Quote(models.Model):
 class Shop(models.Model):
     name = models.CharField(max_length=255)
     books = models.ManyToManyField(Book, related_name='shops')
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -67,11 +142,117 @@ class Stock(models.Model):
     shop = models.ForeignKey(Shop, on_delete=models.CASCADE)
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
     count = models.IntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # One row per shop and book, which lets the inventory summaries count titles incrementally.
+            models.UniqueConstraint(fields=['shop', 'book'], name='store_stock_shop_book_uniq'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if not instance.get_deferred_fields() & {'shop_id', 'book_id', 'count'}:
+            instance.counted_state = instance.inventory_state()
+        return instance
+
+    def inventory_state(self):
+        """
+        The part of the row that is reflected in ShopInventory and BookInventory.
+        """
+        return self.shop_id, self.book_id, self.count
+
+    def save(self, *args, **kwargs):
+        # The summaries move by the difference to the row as stored, which another instance or a
+        # checkout may have changed since this one was loaded: lock it and read it first.
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(Stock, instance=self)):
+            if not self._state.adding and self.pk is not None and not kwargs.get('force_insert'):
+                self.lock_counted_state()
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(Stock, instance=self)):
+            self.lock_counted_state()
+            return super().delete(*args, **kwargs)
+
+    def lock_counted_state(self):
+        state = (Stock.objects.select_for_update().filter(pk=self.pk)
+                 .values_list('shop_id', 'book_id', 'count').first())
+        if state is not None:
+            self.counted_state = state
 
     def __str__(self):
         return f"{self.shop.name} : {self.book.name} : {self.count}"
 
 
+class ShopInventory(models.Model):
+    """
+    Stock totals of a shop, maintained incrementally from Stock changes (see store.inventory).
+    A title is out of stock when its count is zero or less.
+    """
+    shop = models.OneToOneField(Shop, on_delete=models.CASCADE, primary_key=True, related_name='inventory')
+    units = models.BigIntegerField(default=0)
+    titles = models.PositiveIntegerField(default=0)
+    out_of_stock = models.PositiveIntegerField(default=0)
+
+    COUNTER_FIELDS = ('units', 'titles', 'out_of_stock')
+
+    def __str__(self):
+        return f"{self.shop_id} : {self.units} : {self.titles} : {self.out_of_stock}"
+
+
+class BookInventory(models.Model):
+    """
+    Stock totals of a book over all shops, maintained like ShopInventory.
+    """
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='inventory')
+    units = models.BigIntegerField(default=0)
+    shops = models.PositiveIntegerField(default=0)
+    out_of_stock = models.PositiveIntegerField(default=0)
+
+    COUNTER_FIELDS = ('units', 'shops', 'out_of_stock')
+
+    def __str__(self):
+        return f"{self.book_id} : {self.units} : {self.shops} : {self.out_of_stock}"
+
+
+class BookSimilarity(models.Model):
+    """
+    One of the top-K "readers who liked this also liked" neighbours of a book, rank 0 being
+    the most similar. Precomputed by the rebuild_recommendations command (see store.recommendations).
+    """
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='similarities')
+    similar = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # Also the index /book/<id>/similar/ reads the neighbours of a book through, in rank order.
+            models.UniqueConstraint(fields=['book', 'rank'], name='store_booksimilarity_book_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} : {self.rank} : {self.similar_id} : {self.score:.3f}"
+
+
+class BookScore(models.Model):
+    """
+    Trending score of a book: its likes, rates and comments, exponentially decayed.
+    `trending` is the score at `trending_at` (a Unix timestamp), see store.leaderboard.
+    `updated_at` moves on every change of the book's relations or comments, so other
+    processes can pick the changes up.
+    """
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='trending_score')
+    trending = models.FloatField(default=0)
+    trending_at = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.book_id} : {self.trending:.3f} : {self.trending_at:.0f}"
+
+
 class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     books = models.ManyToManyField(Book)  # many to many
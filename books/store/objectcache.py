@@ -0,0 +1,149 @@
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from store.renderers import JSONFragment
+
+
+def entry_size(value):
+    """
+    Approximate memory size of a cached representation: the dict, its keys and its values.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sys.getsizeof(key) + entry_size(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(entry_size(item) for item in value)
+    return size
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU holding at most `max_bytes` (as measured by entry_size), the
+    least recently used entries are dropped first.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get_many(self, keys):
+        found = {}
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is not None:
+                    self.entries.move_to_end(key)
+                    found[key] = entry[0]
+        return found
+
+    def set_many(self, values):
+        with self.lock:
+            for key, value in values.items():
+                size = entry_size(value)
+                if size > self.max_bytes:
+                    continue
+                previous = self.entries.pop(key, None)
+                if previous is not None:
+                    self.size -= previous[1]
+                self.entries[key] = (value, size)
+                self.size += size
+            while self.size > self.max_bytes:
+                _, (_, size) = self.entries.popitem(last=False)
+                self.size -= size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+class ObjectCache:
+    """
+    Serialized representations of single objects keyed on (pk, version), where the version
+    moves whenever the representation may change (Book.updated_at for books). An outdated
+    entry is never read again and simply expires, so nothing has to be invalidated.
+
+    Lookups go through an in-process LRU of STORE_OBJECT_CACHE_LOCAL_BYTES first and then
+    through one get_many on the shared cache; only the misses are loaded. With `encode` (e.g.
+    renderers.encode_json) the representations are cached encoded and returned as
+    JSONFragments, rendered without encoding them again.
+    """
+
+    def __init__(self, prefix, schema, cache_alias='default', encode=None):
+        self.prefix = prefix
+        # Changing the serialized fields or the encoding must not serve entries of the old shape.
+        self.schema = hashlib.md5(repr((schema, encode is not None)).encode()).hexdigest()[:8]
+        self.cache_alias = cache_alias
+        self.encode = encode
+        self.local = LRUCache(getattr(settings, 'STORE_OBJECT_CACHE_LOCAL_BYTES', 16 * 1024 * 1024))
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def get_timeout(self):
+        return getattr(settings, 'STORE_OBJECT_CACHE_TIMEOUT', 3600)
+
+    def make_key(self, pk, version):
+        return f'store:object:{self.prefix}:{self.schema}:{pk}:{version}'
+
+    def get_many(self, versions, load):
+        """
+        Returns the representations of [(pk, version), ...], in that order. `load(pks)` is
+        called with the pks missing from both caches and returns {pk: (version, data)}; its
+        results are cached under the versions it read. Objects `load` does not return (deleted
+        meanwhile) are left out.
+        """
+        keys = [self.make_key(pk, version) for pk, version in versions]
+        found = self.local.get_many(keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            shared = self.cache.get_many(missing)
+            self.local.set_many(shared)
+            found.update(shared)
+        missing_pks = [pk for (pk, _), key in zip(versions, keys) if key not in found]
+        with self._lock:
+            self.hits += len(keys) - len(missing_pks)
+            self.misses += len(missing_pks)
+        loaded = {}
+        if missing_pks:
+            loaded = load(missing_pks)
+            if self.encode is not None:
+                loaded = {pk: (version, self.encode(data)) for pk, (version, data) in loaded.items()}
+            values = {self.make_key(pk, version): data for pk, (version, data) in loaded.items()}
+            self.cache.set_many(values, self.get_timeout())
+            self.local.set_many(values)
+        data = []
+        for (pk, _), key in zip(versions, keys):
+            if key in found:
+                data.append(found[key])
+            elif pk in loaded:
+                data.append(loaded[pk][1])
+        if self.encode is not None:
+            data = [JSONFragment(value) for value in data]
+        return data
+
+    def clear_local(self):
+        self.local.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'local_entries': len(self.local),
+                    'local_bytes': self.local.size}
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = 0
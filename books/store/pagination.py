@@ -0,0 +1,226 @@
+import base64
+import datetime
+import decimal
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import FloatField, Model, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a stable (ordering fields..., id) key.
+    The ordering is taken from the queryset (so OrderingFilter keeps working) and
+    the primary key is appended as a tie-breaker. Pages are fetched with
+    WHERE key > cursor ... LIMIT n, so page N costs the same as page 1.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset() for async views: the page is loaded with the async ORM.
+        """
+        queryset = self.get_page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page([obj async for obj in queryset.aiterator(chunk_size=self.page_size + 1)])
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """
+        Returns the queryset of the requested page plus one row (to detect a next page),
+        or None if pagination is turned off.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.ordering = self.get_ordering(queryset, view)
+        self.cursor = self.decode_cursor(request, queryset)
+        self.reverse = bool(self.cursor and self.cursor['reverse'])
+
+        order_by = [self._invert(field) for field in self.ordering] if self.reverse else self.ordering
+        queryset = queryset.order_by(*order_by)
+        if self.cursor is not None:
+            queryset = queryset.filter(self.build_filter(order_by, self.cursor['values']))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if self.reverse:
+            results.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                page_size = int(request.query_params[self.page_size_query_param])
+                if page_size > 0:
+                    return min(page_size, self.max_page_size)
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_ordering(self, queryset, view):
+        """
+        Returns the ordering of the queryset with the primary key appended,
+        e.g. ['-price', '-id'] for ?ordering=-price.
+        """
+        ordering = [field for field in queryset.query.order_by if isinstance(field, str)]
+        if not ordering:
+            ordering = list(getattr(view, 'ordering', None) or queryset.model._meta.ordering or [])
+
+        pk_name = queryset.model._meta.pk.name
+        key = []
+        for field in ordering:
+            key.append(field)
+            if field.lstrip('-') in ('pk', pk_name):
+                return key
+        descending = bool(key) and key[-1].startswith('-')
+        key.append(f'-{pk_name}' if descending else pk_name)
+        return key
+
+    def build_filter(self, order_by, values):
+        """
+        Expands (a, b, id) > (va, vb, vid) into
+        a > va OR (a = va AND b > vb) OR (a = va AND b = vb AND id > vid),
+        bounded by a >= va so an index on the leading column can be range-scanned.
+        """
+        condition = Q()
+        for index, field in enumerate(order_by):
+            step = Q(**{self._lookup(field, strict=True): values[index]})
+            for previous_field, previous_value in zip(order_by[:index], values[:index]):
+                step &= Q(**{previous_field.lstrip('-'): previous_value})
+            condition |= step
+        return Q(**{self._lookup(order_by[0], strict=False): values[0]}) & condition
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, instance, reverse):
+        values = [self._to_json(self._get_value(instance, field.lstrip('-'))) for field in self.ordering]
+        payload = json.dumps({'o': self.ordering, 'v': values, 'r': int(reverse)}, separators=(',', ':'))
+        encoded = base64.urlsafe_b64encode(payload.encode()).decode()
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request, queryset):
+        """
+        Returns the cursor of the request with its values converted back by the ordering
+        fields, or None without one. A cursor that does not fit the ordering is a 404.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            ordering, values, reverse = payload['o'], payload['v'], payload['r']
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if ordering != self.ordering or not isinstance(values, list) or len(values) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            values = [self._from_json(self._get_field(queryset, field.lstrip('-')), value)
+                      for field, value in zip(ordering, values)]
+        except (FieldDoesNotExist, ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        return {'values': values, 'reverse': bool(reverse)}
+
+    @staticmethod
+    def _invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def _lookup(field, strict):
+        if field.startswith('-'):
+            return f'{field[1:]}__{"lt" if strict else "lte"}'
+        return f'{field}__{"gt" if strict else "gte"}'
+
+    @staticmethod
+    def _get_value(instance, field):
+        value = instance
+        for part in field.split('__'):
+            value = getattr(value, 'pk' if part == 'pk' else part)
+        return value.pk if isinstance(value, Model) else value
+
+    @staticmethod
+    def _get_field(queryset, name):
+        """
+        Returns the field holding the values of an ordering column: the model field, the
+        primary key of a relation, or a FloatField for annotations such as search_rank.
+        """
+        if name in queryset.query.annotations:
+            return FloatField()
+        opts = queryset.model._meta
+        field = None
+        for part in name.split('__'):
+            field = opts.pk if part == 'pk' else opts.get_field(part)
+            if field.is_relation:
+                opts = field.related_model._meta
+        return field.target_field if field.is_relation else field
+
+    @staticmethod
+    def _from_json(field, value):
+        # Keys are never NULL (a NULL would not compare), and JSON objects or lists are no column values.
+        if value is None or isinstance(value, (dict, list)):
+            raise ValueError(value)
+        return field.to_python(value)
+
+    @staticmethod
+    def _to_json(value):
+        if isinstance(value, decimal.Decimal):
+            return str(value)
+        if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+            return value.isoformat()
+        return value
@@ -1,11 +1,21 @@
 from rest_framework.permissions import BasePermission, SAFE_METHODS
 
 
+def get_owner(obj):
+    """
+    The user an object belongs to: `owner`, or `user` for relations and comments.
+    Objects without either (Stock) belong to staff only.
+    """
+    if hasattr(obj, 'owner'):
+        return obj.owner
+    return getattr(obj, 'user', None)
+
+
 class IsOwnerOrStaffOrReadOnly(BasePermission):
     def has_object_permission(self, request, view, obj):
         return bool(
             request.method in SAFE_METHODS or
             request.user and
             request.user.is_authenticated and
-            (obj.owner == request.user or request.user.is_staff)
+            (get_owner(obj) == request.user or request.user.is_staff)
         )
@@ -0,0 +1,65 @@
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class NPlusOneError(AssertionError):
+    pass
+
+
+def guard_mode():
+    """
+    STORE_QUERY_GUARD: 'raise' (the default under tests), 'log' or '' to switch the guard off.
+    """
+    return getattr(settings, 'STORE_QUERY_GUARD', '')
+
+
+class ItemQueryCounter:
+    """
+    Database execute wrapper counting the queries run while serializing each item of a list.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.first_sql = None
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        if self.first_sql is None:
+            self.first_sql = sql
+        return execute(sql, params, many, context)
+
+    def watch(self):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+
+def serialize_items(serializer, items):
+    """
+    Serializes `items` with the child of the list `serializer`, counting the queries each
+    item runs. Querysets and prefetches are evaluated by the caller first, so a query made
+    while serializing more than one item is a query per instance: its count grows with the
+    page size. Reported as an NPlusOneError or a warning, depending on guard_mode().
+    """
+    mode = guard_mode()
+    if not mode:
+        return [serializer.child.to_representation(item) for item in items]
+    counter, rows, querying = ItemQueryCounter(), [], 0
+    with counter.watch():
+        for item in items:
+            before = counter.count
+            rows.append(serializer.child.to_representation(item))
+            querying += counter.count > before
+    if querying > 1:
+        message = (f'{type(serializer.child).__name__} ran {counter.count} queries for {len(rows)} items '
+                   f'({querying} of them queried), the first: {counter.first_sql}')
+        if mode == 'raise':
+            raise NPlusOneError(message)
+        logger.warning('N+1 queries: %s', message)
+    return rows
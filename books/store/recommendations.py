@@ -0,0 +1,127 @@
+import numpy as np
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Coalesce
+from scipy import sparse
+
+from store.models import Book, BookSimilarity, UserBookRelation
+
+
+def interaction_weights(like, rate):
+    """
+    How much a reader liked a book, from 0 to 1: a like counts 1, a rate r counts (r - 1) / 4,
+    the larger of the two wins. Rate 0 stands for no rate.
+    """
+    return np.maximum(like.astype(np.float32), (rate.astype(np.float32) - 1) / 4)
+
+
+def interaction_matrix(book_ids, batch_size=10000):
+    """
+    Builds the book x user matrix of interaction weights, row i being book i and column j
+    user j. Relations are read one range of `book_ids` (sorted) at a time and each range
+    becomes a CSR block right away, so besides the matrix only one batch is held in memory.
+    """
+    n_users = (UserBookRelation.objects.order_by('-user_id').values_list('user_id', flat=True).first() or 0) + 1
+    blocks = []
+    first = 0
+    for start in range(0, len(book_ids), batch_size):
+        last = int(book_ids[min(start + batch_size, len(book_ids)) - 1])
+        rows = (UserBookRelation.objects.order_by()
+                .filter(Q(like=True) | Q(rate__gt=1), book_id__gte=first, book_id__lte=last, user_id__lt=n_users)
+                .values_list('book_id', 'user_id', 'like', Coalesce('rate', 0)))
+        data = np.array(list(rows), dtype=np.int64).reshape(-1, 4)
+        weights = interaction_weights(data[:, 2], data[:, 3])
+        blocks.append(sparse.csr_matrix((weights, (data[:, 0] - first, data[:, 1])),
+                                        shape=(last - first + 1, n_users), dtype=np.float32))
+        first = last + 1
+    if not blocks:
+        return sparse.csr_matrix((0, n_users), dtype=np.float32)
+    return sparse.vstack(blocks, format='csr')
+
+
+def top_neighbors(similarities, row_ids, k):
+    """
+    Yields (book id, [(similar book id, score), ...]) for every row of the sparse `similarities`
+    (row i belongs to book row_ids[i], columns are book ids), keeping the k best scores other
+    than the book itself, best first and ties broken on the lower id.
+    """
+    for row, book_id in enumerate(row_ids):
+        start, end = similarities.indptr[row], similarities.indptr[row + 1]
+        columns, scores = similarities.indices[start:end], similarities.data[start:end]
+        # float32 noise must not decide ties, they go to the lower id.
+        scores = scores.astype(np.float64).round(6)
+        keep = (columns != book_id) & (scores > 0)
+        columns, scores = columns[keep], scores[keep]
+        if len(scores) > k:
+            # Only the candidates at or above the k-th best score get sorted.
+            keep = scores >= np.partition(scores, len(scores) - k)[len(scores) - k]
+            columns, scores = columns[keep], scores[keep]
+        order = np.lexsort((columns, -scores))[:k]
+        yield int(book_id), [(int(columns[i]), float(scores[i])) for i in order]
+
+
+def product_sizes(matrix):
+    """
+    Returns, per row of `matrix`, an upper bound of the non-zeros its row of matrix @ matrix.T
+    holds: the number of interactions of its readers, at most one per book.
+    """
+    pattern = matrix.copy()
+    pattern.data[:] = 1
+    readers_books = np.asarray(pattern.sum(axis=0)).ravel()
+    return np.minimum(pattern @ readers_books, matrix.shape[0]).astype(np.int64)
+
+
+def chunk_bounds(sizes, max_rows, max_nnz):
+    """
+    Splits range(len(sizes)) into consecutive (start, end) slices of at most `max_rows` rows
+    whose sizes add up to at most `max_nnz`; a row larger than that makes a chunk of its own.
+    """
+    totals = np.cumsum(sizes)
+    start = 0
+    while start < len(sizes):
+        before = totals[start - 1] if start else 0
+        end = int(np.searchsorted(totals, before + max_nnz, side='right'))
+        end = min(max(end, start + 1), start + max_rows)
+        yield start, end
+        start = end
+
+
+def rebuild_recommendations(k=20, batch_size=10000, chunk_size=500, max_nnz=5000000):
+    """
+    Recomputes the top-k most similar books of every book: the cosine similarity of their
+    interaction vectors (see interaction_weights) over all readers. The similarity matrix
+    is never materialized, it is computed a chunk of books at a time as a sparse product
+    and reduced to the top k right away, then the chunk's rows are replaced in one
+    transaction. A chunk holds at most `chunk_size` books and, by product_sizes(), at most
+    `max_nnz` similarities, so the popular books that co-occur with most of the catalog come
+    in smaller chunks. Returns the number of BookSimilarity rows written.
+    """
+    book_ids = np.fromiter(Book.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=batch_size),
+                           dtype=np.int64)
+    matrix = interaction_matrix(book_ids, batch_size)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    scale = np.divide(1, norms, out=np.zeros_like(norms), where=norms > 0)
+    matrix = sparse.diags(scale.astype(np.float32)) @ matrix
+    transposed = matrix.T.tocsr()
+    sizes = product_sizes(matrix)[book_ids] if len(book_ids) else np.zeros(0, dtype=np.int64)
+
+    written = 0
+    for start, end in chunk_bounds(sizes, chunk_size, max_nnz):
+        ids = book_ids[start:end]
+        rated = ids[norms[ids] > 0]
+        neighbors = list(top_neighbors(matrix[rated] @ transposed, rated, k)) if len(rated) else []
+        with transaction.atomic():
+            # The whole id range is replaced, which also clears books that lost all their readers.
+            BookSimilarity.objects.filter(book_id__gte=int(ids[0]), book_id__lte=int(ids[-1])).delete()
+            # Books deleted since the matrix was read would fail the foreign keys.
+            existing = set(Book.objects.filter(pk__in={pk for _, similar in neighbors for pk, _ in similar}
+                                               | {pk for pk, _ in neighbors}).values_list('pk', flat=True))
+            objs = []
+            for book_id, similar in neighbors:
+                if book_id in existing:
+                    similar = [(pk, score) for pk, score in similar if pk in existing]
+                    objs.extend(BookSimilarity(book_id=book_id, similar_id=similar_id, rank=rank, score=score)
+                                for rank, (similar_id, score) in enumerate(similar))
+            BookSimilarity.objects.bulk_create(objs, batch_size=5000)
+        written += len(objs)
+    return written
@@ -0,0 +1,167 @@
+import codecs
+import json
+import re
+import secrets
+from collections.abc import Mapping
+
+from django.conf import settings
+from rest_framework.compat import INDENT_SEPARATORS, LONG_SEPARATORS, SHORT_SEPARATORS
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson.Fragment (orjson >= 3.9) embeds pre-encoded JSON as is, older versions go through placeholders.
+OrjsonFragment = getattr(orjson, 'Fragment', None)
+
+
+class JSONFragment(Mapping):
+    """
+    An object already encoded as JSON (bytes), written into the rendered output as is by
+    FastJSONRenderer, so a cached representation is sent without encoding it again. Reading it
+    as a mapping decodes it once, for code looking into the response data.
+    """
+    __slots__ = ('value', '_decoded')
+
+    def __init__(self, value):
+        self.value = value
+        self._decoded = None
+
+    def decoded(self):
+        if self._decoded is None:
+            self._decoded = orjson.loads(self.value) if orjson is not None else json.loads(self.value)
+        return self._decoded
+
+    def __getitem__(self, key):
+        return self.decoded()[key]
+
+    def __iter__(self):
+        return iter(self.decoded())
+
+    def __len__(self):
+        return len(self.decoded())
+
+    def __eq__(self, other):
+        if isinstance(other, JSONFragment):
+            return other.value == self.value
+        return super().__eq__(other)
+
+    def __reduce__(self):
+        return JSONFragment, (self.value,)
+
+    def __repr__(self):
+        return f'JSONFragment({self.value!r})'
+
+
+class FragmentSplicer:
+    """
+    Encodes every JSONFragment as a placeholder string and puts the fragments back into the
+    encoded bytes in one pass. The placeholders carry a random nonce, so no string of the data
+    can be mistaken for one.
+    """
+
+    def __init__(self):
+        self.nonce = secrets.token_hex(8)
+        self.fragments = []
+
+    def placeholder(self, fragment):
+        self.fragments.append(fragment.value)
+        return f'\x00{self.nonce}:{len(self.fragments) - 1}\x00'
+
+    def splice(self, encoded):
+        if not self.fragments:
+            return encoded
+        # Both encoders write the NUL character as \u0000.
+        pattern = re.compile(rb'"\\u0000' + self.nonce.encode() + rb':(\d+)\\u0000"')
+        return pattern.sub(lambda match: self.fragments[int(match.group(1))], encoded)
+
+
+class FragmentJSONEncoder(JSONEncoder):
+    def __init__(self, *args, splicer=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.splicer = splicer
+
+    def default(self, obj):
+        if isinstance(obj, JSONFragment):
+            return self.splicer.placeholder(obj)
+        return super().default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer encoding with orjson when it is installed: compact UTF-8 with Decimal as a
+    number (like DRF's encoder), datetimes natively with a Z for UTC, and \\u2028 / \\u2029
+    escaped, the same bytes as JSONRenderer except for non-finite floats, written as null
+    where STRICT_JSON makes JSONRenderer fail. Data orjson cannot encode (integers beyond 64
+    bits), indented output (indent= in the Accept header) and installs without orjson go
+    through the standard library encoder. Either way JSONFragment values are written as is.
+    """
+    orjson_options = (orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS) if orjson is not None else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        splicer = FragmentSplicer()
+        if orjson is None or indent is not None or self.ensure_ascii or not self.compact:
+            return splicer.splice(self.render_stdlib(data, indent, splicer))
+        try:
+            encoded = self.render_orjson(data, splicer)
+        except TypeError:
+            # orjson.JSONEncodeError is a TypeError.
+            splicer = FragmentSplicer()
+            encoded = self.render_stdlib(data, indent, splicer)
+        return splicer.splice(encoded)
+
+    def render_stdlib(self, data, indent, splicer):
+        if indent is None:
+            separators = SHORT_SEPARATORS if self.compact else LONG_SEPARATORS
+        else:
+            separators = INDENT_SEPARATORS
+        encoded = json.dumps(data, cls=FragmentJSONEncoder, splicer=splicer, indent=indent,
+                             ensure_ascii=self.ensure_ascii, allow_nan=not self.strict, separators=separators)
+        return encoded.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+    def render_orjson(self, data, splicer):
+        encoder = JSONEncoder()
+
+        def default(obj):
+            if isinstance(obj, JSONFragment):
+                return OrjsonFragment(obj.value) if OrjsonFragment is not None else splicer.placeholder(obj)
+            return encoder.default(obj)
+
+        encoded = orjson.dumps(data, default=default, option=self.orjson_options)
+        if b'\xe2\x80\xa8' in encoded or b'\xe2\x80\xa9' in encoded:
+            encoded = encoded.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return encoded
+
+
+def encode_json(data):
+    """
+    Compact JSON bytes of `data`, as FastJSONRenderer writes them; wrapped in a JSONFragment
+    they render into the same response.
+    """
+    return FastJSONRenderer().render(data)
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSONParser reading UTF-8 bodies with orjson when it is installed, otherwise (or for other
+    charsets) with the standard library. orjson rejects NaN and Infinity, like STRICT_JSON.
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or not self.strict or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,157 @@
+import bisect
+import re
+import threading
+from collections import defaultdict
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db import connections
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Cast, Greatest
+from rest_framework.filters import SearchFilter
+
+SEARCH_CONFIG = 'simple'
+NAME_WEIGHT = 1.0
+AUTHOR_WEIGHT = 0.4
+
+_trigram_available = {}
+
+
+def normalize(text):
+    """
+    Lowercases and folds ё into е, the same way the search_vector trigger does.
+    """
+    return text.lower().replace('ё', 'е')
+
+
+def tokenize(text):
+    return re.findall(r'\w+', normalize(text))
+
+
+def has_trigram(connection):
+    """
+    Whether pg_trgm is installed. It is optional: without it fuzzy matching is skipped.
+    """
+    if connection.alias not in _trigram_available:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram_available[connection.alias] = cursor.fetchone() is not None
+    return _trigram_available[connection.alias]
+
+
+class InvertedIndex:
+    """
+    In-process token -> {book id: weight} index, used instead of full-text search on
+    databases other than PostgreSQL (SQLite in tests). Built lazily on first search and
+    kept up to date by the Book signals afterwards.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.built = False
+            self.postings = defaultdict(dict)
+            self.documents = {}
+            self._tokens = None
+
+    def build(self):
+        from store.models import Book
+
+        with self.lock:
+            self.reset()
+            for pk, name, author_name in Book.objects.values_list('pk', 'name', 'author_name').iterator():
+                self.add(pk, name, author_name)
+            self.built = True
+
+    def add(self, pk, name, author_name):
+        with self.lock:
+            self.remove(pk)
+            weights = defaultdict(float)
+            for token in tokenize(name):
+                weights[token] += NAME_WEIGHT
+            for token in tokenize(author_name):
+                weights[token] += AUTHOR_WEIGHT
+            for token, weight in weights.items():
+                if token not in self.postings:
+                    self._tokens = None
+                self.postings[token][pk] = weight
+            self.documents[pk] = list(weights)
+
+    def remove(self, pk):
+        with self.lock:
+            for token in self.documents.pop(pk, ()):
+                postings = self.postings[token]
+                postings.pop(pk, None)
+                if not postings:
+                    del self.postings[token]
+                    self._tokens = None
+
+    def search(self, terms):
+        """
+        Returns {book id: score} for books matching every term as a token prefix.
+        """
+        with self.lock:
+            if not self.built:
+                self.build()
+            if self._tokens is None:
+                self._tokens = sorted(self.postings)
+            scores = None
+            for term in terms:
+                matches = defaultdict(float)
+                start = bisect.bisect_left(self._tokens, term)
+                for token in self._tokens[start:]:
+                    if not token.startswith(term):
+                        break
+                    for pk, weight in self.postings[token].items():
+                        matches[pk] = max(matches[pk], weight)
+                if scores is None:
+                    scores = dict(matches)
+                else:
+                    scores = {pk: score + matches[pk] for pk, score in scores.items() if pk in matches}
+                if not scores:
+                    return {}
+            return scores
+
+
+book_index = InvertedIndex()
+
+
+class BookSearchFilter(SearchFilter):
+    """
+    Full-text search over Book.name and Book.author_name, ranked by relevance.
+    On PostgreSQL it matches the search_vector column (GIN indexed) by token prefix and,
+    when pg_trgm is installed, fuzzy-matches by trigram similarity. Other databases
+    use the in-process inverted index.
+    """
+    rank_annotation = 'search_rank'
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        terms = [token for term in search_terms for token in tokenize(term)]
+        if not terms:
+            return queryset
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            queryset = self.filter_postgresql(queryset, terms, ' '.join(search_terms), connection)
+        else:
+            queryset = self.filter_inverted_index(queryset, terms)
+        return queryset.order_by(f'-{self.rank_annotation}')
+
+    def filter_postgresql(self, queryset, terms, text, connection):
+        query = SearchQuery(' & '.join(f'{term}:*' for term in terms), search_type='raw', config=SEARCH_CONFIG)
+        condition = Q(search_vector=query)
+        rank = SearchRank(F('search_vector'), query)
+        if has_trigram(connection):
+            condition |= Q(name__trigram_similar=text) | Q(author_name__trigram_similar=text)
+            rank = rank + Greatest(TrigramSimilarity('name', text), TrigramSimilarity('author_name', text))
+        # Cast to double precision so the rank survives a round-trip through a pagination cursor.
+        return queryset.annotate(**{self.rank_annotation: Cast(rank, FloatField())}).filter(condition)
+
+    def filter_inverted_index(self, queryset, terms):
+        scores = book_index.search(terms)
+        rank = Case(*[When(pk=pk, then=Value(score)) for pk, score in scores.items()],
+                    default=Value(0.0), output_field=FloatField())
+        return queryset.filter(pk__in=list(scores)).annotate(**{self.rank_annotation: rank})
+
@@ -1,45 +1,303 @@
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import models
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Book, UserBookRelation, Comment, Quote, Shop, Stock
+from rest_framework.settings import api_settings
+from .models import Book, UserBookRelation, Comment, Quote, Shop, Stock, Order, OrderItem, ShopInventory, \
+    BookInventory
+from .queryguard import serialize_items
+
+
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField that first looks the pk up in the objects prefetched by
+    BulkListSerializer, so validating N rows costs one query per column instead of N.
+    """
+
+    def to_internal_value(self, data):
+        prefetched = getattr(self.root, 'related_objects', {}).get(self.field_name)
+        if prefetched is not None and not isinstance(data, bool):
+            try:
+                key = self.get_queryset().model._meta.pk.to_python(
+                    self.pk_field.to_internal_value(data) if self.pk_field is not None else data)
+            except (DjangoValidationError, serializers.ValidationError, TypeError):
+                key = None
+            if key in prefetched:
+                return prefetched[key]
+        return super().to_internal_value(data)
+
+
+class QueryGuardListSerializer(serializers.ListSerializer):
+    """
+    ListSerializer of every store serializer: flags the related objects that are loaded one
+    query per item instead of with select_related / prefetch_related, see store.queryguard.
+    """
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        return serialize_items(self, list(iterable))
+
+
+class BulkListSerializer(QueryGuardListSerializer):
+    """
+    ListSerializer for the bulk endpoints: related objects are prefetched once, rows are
+    written with bulk_create / bulk_update. For updates `instance` is a mapping of
+    lookup value -> object and every row is matched on `lookup_field`; rows without a
+    match are created. A row repeating the lookup value or the unique fields of an earlier
+    row is an error at its own index.
+    """
+    lookup_field = 'id'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.related_objects = {}
+        self.matched_instances = []
+        self.row_count = 0
+        self.seen_rows = {}
+
+    def lookup_value(self, row):
+        model = self.child.Meta.model
+        try:
+            return model._meta.get_field(self.lookup_field).to_python(row.get(self.lookup_field))
+        except (AttributeError, DjangoValidationError):
+            return None
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.prefetch_related_objects(data)
+        self.row_count = 0
+        self.seen_rows = {}
+        return super().to_internal_value(data)
+
+    def prefetch_related_objects(self, rows):
+        for name, field in self.child.fields.items():
+            if field.read_only or not isinstance(field, PrefetchedPrimaryKeyRelatedField):
+                continue
+            pks = {row[name] for row in rows
+                   if isinstance(row, dict) and row.get(name) not in (None, '')
+                   and not isinstance(row[name], (bool, dict, list))}
+            self.related_objects[name] = field.get_queryset().in_bulk(pks) if pks else {}
+
+    def run_child_validation(self, data):
+        index = self.row_count
+        self.row_count += 1
+        instance = None
+        if isinstance(self.instance, dict):
+            instance = self.instance.get(self.lookup_value(data)) if isinstance(data, dict) else None
+            self.matched_instances.append(instance)
+            self.child.instance = instance
+            self.child.initial_data = data
+        attrs = super().run_child_validation(data)
+        self.check_repeated(index, data, attrs, instance)
+        return attrs
+
+    def unique_field_sets(self):
+        meta = self.child.Meta.model._meta
+        return [tuple(fields) for fields in meta.unique_together] + [
+            tuple(constraint.fields) for constraint in meta.total_unique_constraints]
+
+    def check_repeated(self, index, data, attrs, instance):
+        """
+        Records the lookup value and unique fields of a valid row, raising if an earlier row
+        of the request had the same. Fields missing from the row come from the matched object,
+        or from save() and then are the same for every row.
+        """
+        keys = []
+        if isinstance(self.instance, dict) and self.lookup_value(data) is not None:
+            keys.append(((self.lookup_field,), (self.lookup_value(data),), self.lookup_field))
+        for fields in self.unique_field_sets():
+            values = []
+            for name in fields:
+                value = attrs[name] if name in attrs else getattr(instance, name, None)
+                values.append(value.pk if isinstance(value, models.Model) else value)
+            if all(value is None for value in values):
+                continue
+            keys.append((fields, tuple(values), api_settings.NON_FIELD_ERRORS_KEY))
+        for fields, values, error_key in keys:
+            first = self.seen_rows.get((fields, values))
+            if first is not None:
+                raise serializers.ValidationError({error_key: [
+                    f'Row {first} has the same {", ".join(fields)}.']})
+        for fields, values, _ in keys:
+            self.seen_rows[(fields, values)] = index
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        return model.objects.bulk_create([model(**attrs) for attrs in validated_data])
+
+    def update(self, instance, validated_data):
+        model = self.child.Meta.model
+        created, updated, fields = [], [], set()
+        for obj, attrs in zip(self.matched_instances, validated_data):
+            if obj is None:
+                created.append(model(**attrs))
+                continue
+            for attr, value in attrs.items():
+                setattr(obj, attr, value)
+            fields.update(attrs)
+            updated.append(obj)
+        auto_now = [field.name for field in model._meta.concrete_fields if getattr(field, 'auto_now', False)]
+        now = timezone.now()
+        for obj in updated:
+            for name in auto_now:
+                setattr(obj, name, now)
+        if created:
+            model.objects.bulk_create(created)
+        if updated and fields:
+            model.objects.bulk_update(updated, sorted(fields | set(auto_now)))
+        self.created_instances = created
+        self.updated_instances = updated
+        return created + updated
+
+
+class BookOwnerSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ['id', 'username']
+        list_serializer_class = QueryGuardListSerializer
+
+
+class BookShopSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Shop
+        fields = ['id', 'name']
+        list_serializer_class = QueryGuardListSerializer
+
+
+class BookStockSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Stock
+        fields = ['shop', 'count']
+        list_serializer_class = QueryGuardListSerializer
 
 
 class BookSerializer(serializers.ModelSerializer):
-    like_count = serializers.IntegerField(read_only=True)
+    like_count = serializers.IntegerField(source='likes_count', read_only=True)
     rate = serializers.DecimalField(max_digits=3, decimal_places=2, read_only=True)
 
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
+    # ?expand= names and the read-only nested fields replacing (or adding) them.
+    expandable_fields = {
+        'owner': lambda: BookOwnerSerializer(read_only=True),
+        'shops': lambda: BookShopSerializer(many=True, read_only=True),
+        'stock': lambda: BookStockSerializer(source='stock_set', many=True, read_only=True),
+    }
+
     class Meta:
         model = Book
         fields = ['id', 'name', 'price', 'author_name', 'owner', 'like_count', 'rate']
+        list_serializer_class = BulkListSerializer
+
+    def get_fields(self):
+        """
+        Honors the `fields` (names to keep, None for all) and `expand` (expandable_fields to
+        embed, always kept) of the context, see BookViewSet.get_sparse_fields().
+        """
+        fields = super().get_fields()
+        requested, expand = self.context.get('fields'), self.context.get('expand', ())
+        for name in expand:
+            fields[name] = self.expandable_fields[name]()
+        if requested is not None:
+            fields = {name: field for name, field in fields.items() if name in requested or name in expand}
+        return fields
+
+
+class SimilarBookSerializer(BookSerializer):
+    score = serializers.FloatField(read_only=True)
+
+    class Meta(BookSerializer.Meta):
+        fields = BookSerializer.Meta.fields + ['score']
+
+
+class RankedBookSerializer(BookSerializer):
+    rank = serializers.IntegerField(read_only=True)
+    score = serializers.FloatField(read_only=True)
+
+    class Meta(BookSerializer.Meta):
+        fields = ['rank'] + BookSerializer.Meta.fields + ['score']
 
-    def get_like_count(self, instance):
-        return UserBookRelation.objects.filter(book=instance, like=True).count()
 
 class UserBookRelationSerializer(serializers.ModelSerializer):
-    book = serializers.PrimaryKeyRelatedField(queryset=Book.objects.all(), pk_field=serializers.IntegerField())
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
+    book = PrefetchedPrimaryKeyRelatedField(queryset=Book.objects.all(), pk_field=serializers.IntegerField())
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
 
     class Meta:
         model = UserBookRelation
         fields = ['id', 'user', 'book', 'like', 'in_bookmarks', 'rate']
+        list_serializer_class = BulkListSerializer
+        # The relation always belongs to the requesting user, see validate().
+        validators = []
+
+    def validate(self, attrs):
+        # Bulk rows are matched against the user's existing relations on `book`, so only
+        # a single create has to check the (user, book) constraint.
+        request = self.context.get('request')
+        if self.instance is None and self.parent is None and request is not None and 'book' in attrs:
+            if UserBookRelation.objects.filter(user=request.user, book=attrs['book']).exists():
+                raise serializers.ValidationError({'book': ['You already have a relation with this book.']})
+        return attrs
 
 
 class CommentSerializer(serializers.ModelSerializer):
+    # Read through select_related('user'), see CommentViewSet and BookViewSet.comments.
+    username = serializers.CharField(source='user.username', read_only=True)
+
     class Meta:
         model = Comment
-        fields = ['id', 'user', 'book', 'text', 'datetime_created']
+        fields = ['id', 'user', 'username', 'book', 'text', 'datetime_created']
+        list_serializer_class = QueryGuardListSerializer
 
 
 class QuoteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Quote
         fields = ['id', 'book', 'text', 'author', 'owner']
+        list_serializer_class = QueryGuardListSerializer
 
 
 class ShopSerializer(serializers.ModelSerializer):
     class Meta:
         model = Shop
         fields = ['id', 'name', 'books']
+        list_serializer_class = QueryGuardListSerializer
 
 
 class StockSerializer(serializers.ModelSerializer):
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
+
     class Meta:
         model = Stock
         fields = ['id', 'shop', 'book', 'count']
+        list_serializer_class = BulkListSerializer
+
+
+class ShopInventorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ShopInventory
+        fields = ['shop', 'units', 'titles', 'out_of_stock']
+        list_serializer_class = QueryGuardListSerializer
+
+
+class BookInventorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BookInventory
+        fields = ['book', 'units', 'shops', 'out_of_stock']
+        list_serializer_class = QueryGuardListSerializer
+
+
+class OrderItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderItem
+        fields = ['id', 'book', 'count']
+        list_serializer_class = QueryGuardListSerializer
+
+
+class OrderSerializer(serializers.ModelSerializer):
+    items = OrderItemSerializer(source='orderitem_set', many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'user', 'books', 'total_price', 'items']
+        list_serializer_class = QueryGuardListSerializer
@@ -0,0 +1,177 @@
+from django.contrib.auth.models import User
+from django.db.models.functions import Now
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from store.cache import bump_generation
+from store import inventory
+from store.leaderboard import COMMENT_WEIGHT, activity_deltas, leaderboard, merge_activity, record_activity
+from store.counters import apply_deltas, comment_deltas, merge_deltas, rebuild_counters, relation_deltas
+from store.models import Book, Comment, Quote, Shop, Stock, UserBookRelation
+from store.search import book_index
+
+# Models whose generation counter backs the response cache and the ETag validators.
+VERSIONED_MODELS = {Book, UserBookRelation, Comment, Quote, Shop, Stock}
+
+
+@receiver(post_save, sender=UserBookRelation)
+def update_book_counters_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    new_state = instance.counter_state()
+    if created:
+        apply_deltas(relation_deltas(None, new_state))
+        record_activity(activity_deltas(None, new_state))
+    elif hasattr(instance, 'counted_state'):
+        apply_deltas(relation_deltas(instance.counted_state, new_state))
+        record_activity(activity_deltas(instance.counted_state, new_state))
+    else:
+        # The previous values are unknown (the instance was not loaded from the DB), recount the book.
+        rebuild_counters(Book.objects.filter(pk=instance.book_id))
+        record_activity({instance.book_id: 0})
+    instance.counted_state = new_state
+
+
+@receiver(post_delete, sender=UserBookRelation)
+def update_book_counters_on_delete(sender, instance, **kwargs):
+    old_state = getattr(instance, 'counted_state', None) or instance.counter_state()
+    apply_deltas(relation_deltas(old_state, None))
+    record_activity(activity_deltas(old_state, None), create=False)
+
+
+@receiver(post_save, sender=Comment)
+def update_book_counters_on_comment_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        apply_deltas(comment_deltas(None, instance.book_id))
+        record_activity({instance.book_id: COMMENT_WEIGHT})
+    elif hasattr(instance, 'counted_state'):
+        apply_deltas(comment_deltas(instance.counted_state, instance.book_id))
+    else:
+        # The previous book is unknown (the instance was not loaded from the DB), recount the current one.
+        rebuild_counters(Book.objects.filter(pk=instance.book_id))
+    instance.counted_state = instance.book_id
+
+
+@receiver(post_delete, sender=Comment)
+def update_book_counters_on_comment_delete(sender, instance, **kwargs):
+    book_id = getattr(instance, 'counted_state', None) or instance.book_id
+    apply_deltas(comment_deltas(book_id, None))
+    record_activity({book_id: -COMMENT_WEIGHT}, create=False)
+
+
+@receiver(post_save, sender=Stock)
+def update_inventory_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    new_state = instance.inventory_state()
+    if created:
+        inventory.apply_deltas(inventory.stock_deltas(None, new_state))
+    elif hasattr(instance, 'counted_state'):
+        inventory.apply_deltas(inventory.stock_deltas(instance.counted_state, new_state))
+    else:
+        # The previous values are unknown (the instance was not loaded from the DB), recount shop and book.
+        inventory.rebuild_inventory(shop_ids=[instance.shop_id], book_ids=[instance.book_id])
+    instance.counted_state = new_state
+
+
+@receiver(post_delete, sender=Stock)
+def update_inventory_on_delete(sender, instance, **kwargs):
+    old_state = getattr(instance, 'counted_state', None) or instance.inventory_state()
+    inventory.apply_deltas(inventory.stock_deltas(old_state, None))
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_cache_generation(sender, raw=False, **kwargs):
+    if not raw and sender in VERSIONED_MODELS:
+        bump_generation(sender)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_cache_generation_on_user(sender, raw=False, update_fields=None, **kwargs):
+    # Usernames are embedded in comments and expanded book owners. A login only saves last_login.
+    if not raw and set(update_fields or ()) != {'last_login'}:
+        bump_generation(User)
+
+
+@receiver(m2m_changed, sender=Shop.books.through)
+def bump_cache_generation_on_shop_books(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_generation(Shop)
+
+
+# Book.updated_at is the version of the cached book representations (store.objectcache), it also
+# moves when the shops of a book change and when related rows are changed without Book.save().
+
+@receiver(m2m_changed, sender=Shop.books.through)
+def touch_books_on_shop_books(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove'):
+        books = Book.objects.filter(pk=instance.pk) if reverse else Book.objects.filter(pk__in=pk_set)
+    elif action == 'pre_clear':
+        books = Book.objects.filter(pk=instance.pk) if reverse else Book.objects.filter(shops=instance)
+    else:
+        return
+    books.update(updated_at=Now())
+
+
+@receiver(pre_delete, sender=Shop)
+def touch_books_on_shop_delete(sender, instance, **kwargs):
+    Book.objects.filter(shops=instance).update(updated_at=Now())
+
+
+@receiver(pre_delete, sender=User)
+def touch_books_on_owner_delete(sender, instance, **kwargs):
+    # The books' owner is set to NULL with a plain UPDATE.
+    Book.objects.filter(owner=instance).update(updated_at=Now())
+
+
+@receiver(post_save, sender=Book)
+def update_search_index_on_save(sender, instance, raw=False, **kwargs):
+    if not raw and book_index.built:
+        book_index.add(instance.pk, instance.name, instance.author_name)
+
+
+@receiver(post_delete, sender=Book)
+def update_search_index_on_delete(sender, instance, **kwargs):
+    if book_index.built:
+        book_index.remove(instance.pk)
+    if leaderboard.built:
+        leaderboard.remove(instance.pk)
+
+
+def bulk_saved(model, created=(), updated=()):
+    """
+    bulk_create / bulk_update send no signals: does what the post_save receivers above
+    would have done for every instance.
+    """
+    if model is UserBookRelation:
+        deltas, activity = {}, {}
+        for instance in created:
+            merge_deltas(deltas, relation_deltas(None, instance.counter_state()))
+            merge_activity(activity, activity_deltas(None, instance.counter_state()))
+        for instance in updated:
+            old_state = getattr(instance, 'counted_state', None)
+            merge_deltas(deltas, relation_deltas(old_state, instance.counter_state()))
+            merge_activity(activity, activity_deltas(old_state, instance.counter_state()))
+        apply_deltas(deltas)
+        record_activity(activity)
+        for instance in [*created, *updated]:
+            instance.counted_state = instance.counter_state()
+    if model is Stock:
+        deltas = {}
+        for instance in created:
+            inventory.merge_deltas(deltas, inventory.stock_deltas(None, instance.inventory_state()))
+        for instance in updated:
+            inventory.merge_deltas(deltas, inventory.stock_deltas(getattr(instance, 'counted_state', None),
+                                                                  instance.inventory_state()))
+        inventory.apply_deltas(deltas)
+        for instance in [*created, *updated]:
+            instance.counted_state = instance.inventory_state()
+    if model is Book and book_index.built:
+        for instance in [*created, *updated]:
+            book_index.add(instance.pk, instance.name, instance.author_name)
+    if model in VERSIONED_MODELS and (created or updated):
+        bump_generation(model)
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class LeaderCancelled(Exception):
+    """
+    The asyncio task computing a shared result was cancelled, its followers compute again.
+    """
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent computations within the process: the first caller of a
+    key (the leader) computes, callers arriving before it is done wait for its result, or
+    its exception, instead of computing again. Threads and asyncio tasks share the same
+    calls, they wait on a concurrent.futures.Future.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def join(self, key):
+        """
+        Returns the call's future and whether the caller leads it.
+        """
+        with self.lock:
+            future = self.calls.get(key)
+            if future is not None:
+                self.followers += 1
+                return future, False
+            future = self.calls[key] = Future()
+            self.leaders += 1
+            return future, True
+
+    def finish(self, key, future, result=None, exception=None):
+        with self.lock:
+            if self.calls.get(key) is future:
+                del self.calls[key]
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def do(self, key, compute):
+        """
+        Returns compute() and whether the result was shared from another caller's call.
+        """
+        future, leader = self.join(key)
+        if not leader:
+            try:
+                return future.result(), True
+            except LeaderCancelled:
+                return self.do(key, compute)
+        try:
+            result = compute()
+        except BaseException as exc:
+            self.finish(key, future, exception=exc)
+            raise
+        self.finish(key, future, result)
+        return result, False
+
+    async def ado(self, key, compute):
+        """
+        do() for coroutines: `compute` returns an awaitable.
+        """
+        future, leader = self.join(key)
+        if not leader:
+            try:
+                # Shielded: a follower being cancelled must not cancel the shared call.
+                return await asyncio.shield(asyncio.wrap_future(future)), True
+            except LeaderCancelled:
+                return await self.ado(key, compute)
+        try:
+            result = await compute()
+        except asyncio.CancelledError:
+            self.finish(key, future, exception=LeaderCancelled())
+            raise
+        except BaseException as exc:
+            self.finish(key, future, exception=exc)
+            raise
+        self.finish(key, future, result)
+        return result, False
+
+    def stats(self):
+        with self.lock:
+            return {'leaders': self.leaders, 'followers': self.followers, 'in_flight': len(self.calls)}
+
+    def reset_stats(self):
+        with self.lock:
+            self.leaders = self.followers = 0
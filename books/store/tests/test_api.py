@@ -1,13 +1,26 @@
+import base64
 import json
+import tempfile
+from io import StringIO
+
+from django.conf import settings
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.db.models import Avg
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
 
-from store.models import Book, UserBookRelation
+from store.cache import generations_shared
+from store.models import Book, Quote, Shop, Stock, UserBookRelation
+from store.search import InvertedIndex
 from store.serializers import BookSerializer
+from store.views import book_response_cache
 
 
 class BookTests(APITestCase):
@@ -28,52 +41,101 @@ class BookTests(APITestCase):
         url = reverse('book-list')
         response = self.client.get(url, {'price': 300.00}, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['name'], 'Преступление и наказание')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['name'], 'Преступление и наказание')
 
     def test_search_by_name(self):
         url = reverse('book-list')
         response = self.client.get(url, {'search': 'Война и мир'}, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['name'], 'Война и мир')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['name'], 'Война и мир')
 
     def test_search_by_author_name(self):
         url = reverse('book-list')
         response = self.client.get(url, {'search': 'Фёдор Достоевский'}, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
-        self.assertEqual(response.data[0]['author_name'], 'Фёдор Достоевский')
-        self.assertEqual(response.data[1]['author_name'], 'Фёдор Достоевский')
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(response.data['results'][0]['author_name'], 'Фёдор Достоевский')
+        self.assertEqual(response.data['results'][1]['author_name'], 'Фёдор Достоевский')
 
     def test_ordering_by_price(self):
         url = reverse('book-list')
         response = self.client.get(url, {'ordering': 'price'}, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data[0]['name'], 'Преступление и наказание')
-        self.assertEqual(response.data[1]['name'], 'Идиот')
-        self.assertEqual(response.data[2]['name'], 'Мастер и Маргарита')
-        self.assertEqual(response.data[3]['name'], 'Война и мир')
-        self.assertEqual(response.data[4]['name'], 'Анна Каренина')
+        self.assertEqual(response.data['results'][0]['name'], 'Преступление и наказание')
+        self.assertEqual(response.data['results'][1]['name'], 'Идиот')
+        self.assertEqual(response.data['results'][2]['name'], 'Мастер и Маргарита')
+        self.assertEqual(response.data['results'][3]['name'], 'Война и мир')
+        self.assertEqual(response.data['results'][4]['name'], 'Анна Каренина')
 
     def test_ordering_by_author_name(self):
         url = reverse('book-list')
         response = self.client.get(url, {'ordering': 'author_name'}, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data[0]['author_name'], 'Лев Толстой')
-        self.assertEqual(response.data[1]['author_name'], 'Лев Толстой')
-        self.assertEqual(response.data[2]['author_name'], 'Михаил Булгаков')
-        self.assertEqual(response.data[3]['author_name'], 'Фёдор Достоевский')
-        self.assertEqual(response.data[4]['author_name'], 'Фёдор Достоевский')
+        self.assertEqual(response.data['results'][0]['author_name'], 'Лев Толстой')
+        self.assertEqual(response.data['results'][1]['author_name'], 'Лев Толстой')
+        self.assertEqual(response.data['results'][2]['author_name'], 'Михаил Булгаков')
+        self.assertEqual(response.data['results'][3]['author_name'], 'Фёдор Достоевский')
+        self.assertEqual(response.data['results'][4]['author_name'], 'Фёдор Достоевский')
 
     def test_get_books(self):
         url = reverse('book-list')
         response = self.client.get(url, format='json')
         books = Book.objects.all().annotate(rate=Avg('userbookrelation__rate')).order_by('id')
         serializer_data = BookSerializer(books, many=True).data
-        self.assertEqual(serializer_data, response.data)
+        self.assertEqual(serializer_data, response.data['results'])
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_cursor_pagination_by_price(self):
+        url = reverse('book-list')
+        response = self.client.get(url, {'ordering': 'price', 'page_size': 2}, format='json')
+        names = [book['name'] for book in response.data['results']]
+        self.assertIsNone(response.data['previous'])
+        while response.data['next']:
+            response = self.client.get(response.data['next'], format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            names += [book['name'] for book in response.data['results']]
+        self.assertEqual(names, ['Преступление и наказание', 'Идиот', 'Мастер и Маргарита', 'Война и мир',
+                                 'Анна Каренина'])
+
+        response = self.client.get(response.data['previous'], format='json')
+        self.assertEqual([book['name'] for book in response.data['results']], ['Мастер и Маргарита', 'Война и мир'])
+
+    def test_cursor_pagination_ties_on_author_name(self):
+        url = reverse('book-list')
+        response = self.client.get(url, {'ordering': '-author_name', 'page_size': 1}, format='json')
+        ids = [book['id'] for book in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'], format='json')
+            ids += [book['id'] for book in response.data['results']]
+        expected = list(Book.objects.order_by('-author_name', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_cursor_pagination_does_not_use_offset(self):
+        url = reverse('book-list')
+        response = self.client.get(url, {'ordering': 'price', 'page_size': 2}, format='json')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(response.data['next'], format='json')
+        book_queries = [query['sql'] for query in queries if 'FROM "store_book"' in query['sql']]
+        self.assertTrue(book_queries)
+        self.assertFalse(any('OFFSET' in sql for sql in book_queries))
+
+    def test_invalid_cursor(self):
+        url = reverse('book-list')
+        response = self.client.get(url, {'cursor': 'garbage'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_tampered_cursor(self):
+        url = reverse('book-list')
+        for values in (['abc', 1], [{'x': 1}, 1], ['1.00', 'abc'], [None, 1], ['1.00', [1]]):
+            payload = json.dumps({'o': ['price', 'id'], 'v': values, 'r': 0})
+            cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+            with self.subTest(values):
+                response = self.client.get(url, {'ordering': 'price', 'cursor': cursor}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+                self.assertEqual(response.data, {'detail': 'Invalid cursor'})
+
     def test_get_single_book(self):
         url = reverse('book-detail', args=[self.book1.id])
         book = Book.objects.filter(id=self.book1.id).annotate(rate=Avg('userbookrelation__rate')).first()
@@ -201,3 +263,343 @@ class UserBookRelationTests(APITestCase):
         self.client.force_login(self.user1)
         response = self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_relation_updates_book_counters(self):
+        url = reverse('userbookrelation-detail', args=[self.book1.id])
+        self.client.force_login(self.user1)
+        self.client.patch(url, {'like': True, 'rate': 4}, format='json')
+        self.client.force_login(self.user2)
+        self.client.patch(url, {'like': True, 'rate': 5}, format='json')
+        self.book1.refresh_from_db()
+        self.assertEqual((self.book1.rating_sum, self.book1.rating_count, self.book1.likes_count), (9, 2, 2))
+
+        self.client.patch(url, {'like': False, 'rate': 1}, format='json')
+        self.book1.refresh_from_db()
+        self.assertEqual((self.book1.rating_sum, self.book1.rating_count, self.book1.likes_count), (5, 2, 1))
+
+        self.client.delete(url)
+        self.book1.refresh_from_db()
+        self.assertEqual((self.book1.rating_sum, self.book1.rating_count, self.book1.likes_count), (4, 1, 1))
+
+        response = self.client.get(reverse('book-detail', args=[self.book1.id]), format='json')
+        self.assertEqual(response.data['rate'], '4.00')
+        self.assertEqual(response.data['like_count'], 1)
+
+    def test_book_update_keeps_counters(self):
+        UserBookRelation.objects.create(user=self.user2, book=self.book1, like=True, rate=3)
+        url = reverse('book-detail', args=[self.book1.id])
+        self.client.force_login(self.user1)
+        data = {'name': 'Война и мир', 'price': '550.00', 'author_name': 'Лев Толстой'}
+        response = self.client.put(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.book1.refresh_from_db()
+        self.assertEqual((self.book1.rating_sum, self.book1.rating_count, self.book1.likes_count), (3, 1, 1))
+
+    def test_rebuild_book_counters_command(self):
+        UserBookRelation.objects.create(user=self.user1, book=self.book1, like=True, rate=5)
+        UserBookRelation.objects.create(user=self.user2, book=self.book1, like=False, rate=2)
+        Book.objects.update(rating_sum=0, rating_count=0, likes_count=0)
+        call_command('rebuild_book_counters', batch_size=1, stdout=StringIO())
+        self.book1.refresh_from_db()
+        self.book2.refresh_from_db()
+        self.assertEqual((self.book1.rating_sum, self.book1.rating_count, self.book1.likes_count), (7, 2, 1))
+        self.assertEqual((self.book2.rating_sum, self.book2.rating_count, self.book2.likes_count), (0, 0, 0))
+
+
+class BookResponseCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        book_response_cache.reset_stats()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.book1 = Book.objects.create(name='Война и мир', price=500.00, author_name='Лев Толстой', owner=self.user)
+        self.book2 = Book.objects.create(name='Идиот', price=350.00, author_name='Фёдор Достоевский', owner=self.user)
+
+    def test_list_is_served_from_cache(self):
+        url = reverse('book-list')
+        first = self.client.get(url, {'ordering': 'price'}, format='json')
+        with self.assertNumQueries(0):
+            second = self.client.get(url, {'ordering': 'price'}, format='json')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(book_response_cache.stats(), {'hits': 1, 'misses': 1})
+
+    def test_query_params_are_part_of_the_key(self):
+        url = reverse('book-list')
+        self.client.get(url, {'ordering': 'price'}, format='json')
+        response = self.client.get(url, {'ordering': '-price'}, format='json')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['name'], 'Война и мир')
+
+    def test_relation_change_invalidates_detail(self):
+        url = reverse('book-detail', args=[self.book1.id])
+        self.client.get(url, format='json')
+        UserBookRelation.objects.create(user=self.user, book=self.book1, like=True, rate=5)
+        response = self.client.get(url, format='json')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['like_count'], 1)
+
+    def test_book_and_shop_changes_invalidate_list(self):
+        url = reverse('book-list')
+        self.client.get(url, format='json')
+        self.book2.name = 'Идиот (новое издание)'
+        self.book2.save()
+        response = self.client.get(url, format='json')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][1]['name'], 'Идиот (новое издание)')
+
+        shop = Shop.objects.create(name='Читай-город')
+        self.assertEqual(self.client.get(url, format='json')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(url, format='json')['X-Cache'], 'HIT')
+        shop.books.add(self.book1)
+        self.assertEqual(self.client.get(url, format='json')['X-Cache'], 'MISS')
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.book = Book.objects.create(name='Война и мир', price=500.00, author_name='Лев Толстой', owner=self.user)
+        self.shop = Shop.objects.create(name='Библио-Глобус')
+        self.stock = Stock.objects.create(shop=self.shop, book=self.book, count=10)
+
+    def test_matching_etag_returns_304_without_queries(self):
+        for url in (reverse('book-list'), reverse('shop-list'), reverse('stock-list'),
+                    reverse('book-detail', args=[self.book.id])):
+            response = self.client.get(url, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIn('Last-Modified', response)
+            with self.assertNumQueries(0):
+                response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response.content, b'')
+
+    def test_change_invalidates_etag(self):
+        url = reverse('stock-list')
+        etag = self.client.get(url, format='json')['ETag']
+        self.stock.count = 9
+        self.stock.save()
+        response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['results'][0]['count'], 9)
+
+    def test_book_delete_invalidates_shop_list(self):
+        url = reverse('shop-list')
+        self.shop.books.add(self.book)
+        etag = self.client.get(url, format='json')['ETag']
+        self.book.delete()
+        response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['books'], [])
+
+    def test_if_modified_since(self):
+        url = reverse('quote-list')
+        Quote.objects.create(book=self.book, text='Все счастливые семьи похожи друг на друга...', author='Лев Толстой')
+        last_modified = self.client.get(url, format='json')['Last-Modified']
+        response = self.client.get(url, format='json', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @override_settings(TESTING=False, DEBUG=False)
+    def test_process_local_generations_disable_validators(self):
+        url = reverse('book-list')
+        for _ in range(2):
+            response = self.client.get(url, format='json')
+            self.assertNotIn('ETag', response)
+            # Still coalesced, never cached.
+            self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(url, format='json', HTTP_IF_NONE_MATCH='*').status_code, status.HTTP_200_OK)
+
+        with tempfile.TemporaryDirectory() as location, override_settings(
+                CACHES={**settings.CACHES, 'shared': {
+                    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}},
+                STORE_GENERATION_CACHE='shared'):
+            self.assertTrue(generations_shared())
+            self.assertIn('ETag', self.client.get(url, format='json'))
+
+
+class BookSearchTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.book1 = Book.objects.create(name='Война и мир', price=500.00, author_name='Лев Толстой', owner=self.user)
+        self.book2 = Book.objects.create(name='Преступление и наказание', price=300.00, author_name='Фёдор Достоевский',
+                                         owner=self.user)
+        self.book3 = Book.objects.create(name='Толстой и Достоевский', price=450.00, author_name='Дмитрий Мережковский',
+                                         owner=self.user)
+
+    def search(self, term):
+        response = self.client.get(reverse('book-list'), {'search': term}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [book['id'] for book in response.data['results']]
+
+    def test_search_by_prefix(self):
+        self.assertEqual(self.search('Войн'), [self.book1.id])
+        self.assertEqual(self.search('преступ наказ'), [self.book2.id])
+
+    def test_search_folds_yo(self):
+        self.assertEqual(self.search('Федор'), [self.book2.id])
+
+    def test_search_ranks_name_above_author(self):
+        self.assertEqual(self.search('Толстой'), [self.book3.id, self.book1.id])
+
+    def test_search_follows_updates(self):
+        self.book1.name = 'Анна Каренина'
+        self.book1.save()
+        self.assertEqual(self.search('Война'), [])
+        self.assertEqual(self.search('Каренина'), [self.book1.id])
+
+    def test_inverted_index(self):
+        index = InvertedIndex()
+        index.build()
+        self.assertEqual(set(index.search(['толст'])), {self.book1.id, self.book3.id})
+        self.assertGreater(index.search(['толст'])[self.book3.id], index.search(['толст'])[self.book1.id])
+        self.assertEqual(list(index.search(['федор', 'достоевский'])), [self.book2.id])
+        index.remove(self.book2.id)
+        self.assertEqual(index.search(['федор']), {})
+        index.add(self.book2.id, 'Идиот', 'Фёдор Достоевский')
+        self.assertEqual(list(index.search(['идиот'])), [self.book2.id])
+
+
+class BulkTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.user2 = User.objects.create_user(username='testuser2', password='testpassword2')
+        self.staff_user = User.objects.create_user(username='staffuser', password='staffpassword', is_staff=True)
+        self.book1 = Book.objects.create(name='Война и мир', price=500.00, author_name='Лев Толстой', owner=self.user)
+        self.book2 = Book.objects.create(name='Идиот', price=350.00, author_name='Фёдор Достоевский', owner=self.user2)
+        self.shop = Shop.objects.create(name='Библио-Глобус')
+        self.stock1 = Stock.objects.create(shop=self.shop, book=self.book1, count=10)
+        self.stock2 = Stock.objects.create(shop=self.shop, book=self.book2, count=5)
+
+    def test_bulk_create_books(self):
+        self.client.force_login(self.user)
+        url = reverse('book-bulk')
+        rows = [{'name': f'Книга {i}', 'price': f'{100 + i}.00', 'author_name': 'Автор'} for i in range(2)]
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(url, rows, format='json')
+        rows = [{'name': f'Книга {i}', 'price': f'{100 + i}.00', 'author_name': 'Автор'} for i in range(2, 12)]
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post(url, rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([book['name'] for book in response.data], [row['name'] for row in rows])
+        self.assertEqual(Book.objects.filter(owner=self.user, author_name='Автор').count(), 12)
+        self.assertEqual(len(small), len(large))
+
+    def test_bulk_create_reports_errors_per_row(self):
+        self.client.force_login(self.user)
+        rows = [{'name': 'Книга', 'price': '100.00', 'author_name': 'Автор'}, {'name': 'Книга', 'price': 'дорого'}]
+        response = self.client.post(reverse('book-bulk'), rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('price', response.data[1])
+        self.assertEqual(Book.objects.count(), 2)
+
+    def test_bulk_update_stock_requires_staff(self):
+        rows = [{'id': self.stock1.id, 'count': 7}, {'id': self.stock2.id, 'count': 0}]
+        self.client.force_login(self.user)
+        response = self.client.patch(reverse('stock-bulk'), rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(len(response.data), 2)
+
+        self.client.force_login(self.staff_user)
+        response = self.client.patch(reverse('stock-bulk'), rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([stock['count'] for stock in response.data], [7, 0])
+        self.stock2.refresh_from_db()
+        self.assertEqual(self.stock2.count, 0)
+
+    def test_bulk_update_unknown_row(self):
+        self.client.force_login(self.staff_user)
+        rows = [{'id': self.stock1.id, 'count': 7}, {'id': 0, 'count': 1}]
+        response = self.client.patch(reverse('stock-bulk'), rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data[0], {})
+        self.stock1.refresh_from_db()
+        self.assertEqual(self.stock1.count, 10)
+
+    def test_bulk_delete_checks_each_owner(self):
+        self.client.force_login(self.user)
+        response = self.client.delete(reverse('book-bulk'), [self.book1.id, self.book2.id], format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('detail', response.data[1])
+        self.assertEqual(Book.objects.count(), 2)
+
+        response = self.client.delete(reverse('book-bulk'), [{'id': self.book1.id}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Book.objects.filter(id=self.book1.id).exists())
+
+    def test_bulk_upsert_relations_updates_counters(self):
+        UserBookRelation.objects.create(user=self.user, book=self.book1, like=True, rate=2)
+        self.client.force_login(self.user)
+        rows = [{'book': self.book1.id, 'rate': 4}, {'book': self.book2.id, 'like': True, 'rate': 5}]
+        response = self.client.post(reverse('userbookrelation-bulk'), rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(UserBookRelation.objects.filter(user=self.user).count(), 2)
+        self.book1.refresh_from_db()
+        self.book2.refresh_from_db()
+        self.assertEqual((self.book1.rating_sum, self.book1.rating_count, self.book1.likes_count), (4, 1, 1))
+        self.assertEqual((self.book2.rating_sum, self.book2.rating_count, self.book2.likes_count), (5, 1, 1))
+
+    def test_bulk_rejects_repeated_relation_books(self):
+        self.client.force_login(self.user)
+        rows = [{'book': self.book1.id, 'like': True}, {'book': self.book2.id, 'rate': 5},
+                {'book': self.book1.id, 'rate': 3}]
+        response = self.client.post(reverse('userbookrelation-bulk'), rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, [{}, {}, {'book': ['Row 0 has the same book.']}])
+        self.assertFalse(UserBookRelation.objects.exists())
+
+    def test_bulk_rejects_repeated_stock_rows(self):
+        shop = Shop.objects.create(name='Читай-город')
+        self.client.force_login(self.staff_user)
+        rows = [{'shop': shop.id, 'book': self.book1.id, 'count': 1},
+                {'shop': shop.id, 'book': self.book1.id, 'count': 2}]
+        response = self.client.post(reverse('stock-bulk'), rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, [{}, {'non_field_errors': ['Row 0 has the same shop, book.']}])
+        self.assertFalse(Stock.objects.filter(shop=shop).exists())
+
+    def test_bulk_rejects_repeated_ids(self):
+        self.client.force_login(self.user)
+        rows = [{'id': self.book1.id, 'name': 'Первое', 'price': '1.00', 'author_name': 'Автор'},
+                {'id': self.book1.id, 'name': 'Второе', 'price': '2.00', 'author_name': 'Автор'}]
+        response = self.client.put(reverse('book-bulk'), rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, [{}, {'id': ['Row 0 has the same id.']}])
+        self.book1.refresh_from_db()
+        self.assertEqual(self.book1.name, 'Война и мир')
+
+
+class BookExportTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.book1 = Book.objects.create(name='Война и мир', price=500.00, author_name='Лев Толстой', owner=self.user)
+        self.book2 = Book.objects.create(name='Идиот', price=350.00, author_name='Фёдор Достоевский', owner=self.user)
+        self.book3 = Book.objects.create(name='Анна Каренина', price=600.00, author_name='Лев Толстой')
+        UserBookRelation.objects.create(user=self.user, book=self.book1, like=True, rate=5)
+        self.shop = Shop.objects.create(name='Библио-Глобус')
+        self.shop.books.add(self.book1, self.book2)
+
+    def test_export_ndjson(self):
+        response = self.client.get(reverse('book-export'), {'ordering': 'price'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['name'] for row in rows], ['Идиот', 'Война и мир', 'Анна Каренина'])
+        self.assertEqual(rows[1], {'id': self.book1.id, 'name': 'Война и мир', 'price': '500.00',
+                                   'author_name': 'Лев Толстой', 'owner': self.user.id, 'like_count': 1,
+                                   'rate': '5.00', 'shops': [self.shop.id]})
+        self.assertEqual(rows[2]['shops'], [])
+
+    def test_export_csv_with_search(self):
+        response = self.client.get(reverse('book-export'), {'export_format': 'csv', 'search': 'Толстой'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,name,price,author_name,owner,like_count,rate,shops')
+        self.assertEqual(len(lines), 3)
+        self.assertIn(f'{self.book1.id},Война и мир,500.00,Лев Толстой,{self.user.id},1,5.00,{self.shop.id}', lines)
+
+    def test_export_rejects_unknown_format(self):
+        response = self.client.get(reverse('book-export'), {'export_format': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
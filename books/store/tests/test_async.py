@@ -0,0 +1,124 @@
+import asyncio
+import base64
+import json
+from unittest import mock
+
+from asgiref.sync import iscoroutinefunction
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import resolve, reverse
+
+from store.async_views import AsyncReadView
+from store.models import Book, Shop, Stock, UserBookRelation
+
+
+class AsyncCatalogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.book1 = Book.objects.create(name='Война и мир', price=500.00, author_name='Лев Толстой', owner=self.user)
+        self.book2 = Book.objects.create(name='Идиот', price=350.00, author_name='Фёдор Достоевский', owner=self.user)
+        self.book3 = Book.objects.create(name='Анна Каренина', price=600.00, author_name='Лев Толстой')
+        UserBookRelation.objects.create(user=self.user, book=self.book1, like=True, rate=4)
+        self.shop = Shop.objects.create(name='Библио-Глобус')
+        self.shop.books.add(self.book1, self.book2)
+        self.stock = Stock.objects.create(shop=self.shop, book=self.book1, count=3)
+        Stock.objects.create(shop=self.shop, book=self.book2, count=1)
+
+    def test_views_are_async(self):
+        for url in ('/async/book/', f'/async/book/{self.book1.pk}/', '/async/shop/', '/async/stock/'):
+            self.assertTrue(iscoroutinefunction(resolve(url).func), url)
+
+    async def test_book_list_matches_sync_endpoint(self):
+        params = {'ordering': '-price', 'page_size': 2}
+        response = await self.async_client.get(reverse('async-book-list'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = json.loads(response.content)
+        expected = json.loads((await self.async_client.get(reverse('book-list'), params)).content)
+        self.assertEqual(data['results'], expected['results'])
+        self.assertEqual([book['name'] for book in data['results']], ['Анна Каренина', 'Война и мир'])
+        self.assertEqual(data['results'][1]['rate'], '4.00')
+
+        response = await self.async_client.get(data['next'])
+        self.assertEqual([book['name'] for book in json.loads(response.content)['results']], ['Идиот'])
+
+    async def test_book_list_cached(self):
+        response = await self.async_client.get(reverse('async-book-list'))
+        self.assertEqual(response['X-Cache'], 'MISS')
+        response = await self.async_client.get(reverse('async-book-list'))
+        self.assertEqual(response['X-Cache'], 'HIT')
+        await Book.objects.acreate(name='Идиот', price=300.00, author_name='Фёдор Достоевский')
+        response = await self.async_client.get(reverse('async-book-list'))
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(json.loads(response.content)['results']), 4)
+
+    async def test_book_list_coalesced_without_shared_generations(self):
+        load = AsyncReadView.load
+
+        async def slow_load(view, *args):
+            await asyncio.sleep(0.05)
+            return await load(view, *args)
+
+        with override_settings(TESTING=False, DEBUG=False), mock.patch.object(AsyncReadView, 'load', slow_load):
+            for _ in range(2):
+                responses = await asyncio.gather(*(self.async_client.get(reverse('async-book-list'))
+                                                   for _ in range(3)))
+                # Never cached, concurrent misses still share one load.
+                self.assertEqual(sorted(response['X-Cache'] for response in responses),
+                                 ['COALESCED', 'COALESCED', 'MISS'])
+                self.assertEqual(len({response.content for response in responses}), 1)
+
+    async def test_book_list_with_stock_follows_stock_changes(self):
+        params = {'expand': 'stock'}
+        response = await self.async_client.get(reverse('async-book-list'), params)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual((await self.async_client.get(reverse('async-book-list'), params))['X-Cache'], 'HIT')
+        self.stock.count = 99
+        await self.stock.asave()
+        response = await self.async_client.get(reverse('async-book-list'), params)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        expected = json.loads((await self.async_client.get(reverse('book-list'), params)).content)
+        self.assertEqual(json.loads(response.content)['results'], expected['results'])
+        self.assertIn(99, [row['count'] for book in expected['results'] for row in book['stock']])
+
+    async def test_book_filter_and_search(self):
+        response = await self.async_client.get(reverse('async-book-list'), {'price': '350.00'})
+        self.assertEqual([book['name'] for book in json.loads(response.content)['results']], ['Идиот'])
+        response = await self.async_client.get(reverse('async-book-list'), {'search': 'толстой'})
+        self.assertEqual({book['name'] for book in json.loads(response.content)['results']},
+                         {'Война и мир', 'Анна Каренина'})
+
+    async def test_book_detail(self):
+        response = await self.async_client.get(reverse('async-book-detail', args=[self.book1.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['like_count'], 1)
+
+        response = await self.async_client.get(reverse('async-book-detail', args=[0]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(json.loads(response.content), {'detail': 'No Book matches the given query.'})
+
+    async def test_invalid_cursor(self):
+        response = await self.async_client.get(reverse('async-book-list'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(json.loads(response.content), {'detail': 'Invalid cursor'})
+
+    async def test_tampered_cursor(self):
+        payload = json.dumps({'o': ['price', 'id'], 'v': ['abc', 1], 'r': 0})
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+        response = await self.async_client.get(reverse('async-book-list'), {'ordering': 'price', 'cursor': cursor})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(json.loads(response.content), {'detail': 'Invalid cursor'})
+
+    async def test_shop_list(self):
+        response = await self.async_client.get(reverse('async-shop-list'))
+        [shop] = json.loads(response.content)['results']
+        self.assertEqual((shop['id'], shop['name']), (self.shop.pk, 'Библио-Глобус'))
+        self.assertCountEqual(shop['books'], [self.book1.pk, self.book2.pk])
+
+    async def test_stock_lookup(self):
+        response = await self.async_client.get(reverse('async-stock-list'), {'shop': self.shop.pk,
+                                                                           'book': self.book1.pk})
+        self.assertEqual(json.loads(response.content)['results'],
+                         [{'id': self.stock.pk, 'shop': self.shop.pk, 'book': self.book1.pk, 'count': 3}])
@@ -0,0 +1,92 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book, Shop, Stock, UserBookRelation
+
+
+class BookSparseFieldsTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.book1 = Book.objects.create(name='Война и мир', price=500.00, author_name='Лев Толстой', owner=self.user)
+        self.book2 = Book.objects.create(name='Идиот', price=350.00, author_name='Фёдор Достоевский')
+        self.shop1 = Shop.objects.create(name='Библио-Глобус')
+        self.shop2 = Shop.objects.create(name='Читай-город')
+        self.shop1.books.add(self.book1, self.book2)
+        self.shop2.books.add(self.book1)
+        Stock.objects.create(shop=self.shop2, book=self.book1, count=2)
+        Stock.objects.create(shop=self.shop1, book=self.book1, count=0)
+        UserBookRelation.objects.create(user=self.user, book=self.book1, like=True, rate=4)
+
+    def get_list(self, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('book-list'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        book_query = next(query['sql'] for query in context.captured_queries if 'FROM "store_book"' in query['sql'])
+        return response.data['results'], book_query
+
+    def test_fields(self):
+        results, sql = self.get_list(fields='name,like_count')
+        self.assertEqual(results, [{'id': self.book1.pk, 'name': 'Война и мир', 'like_count': 1},
+                                   {'id': self.book2.pk, 'name': 'Идиот', 'like_count': 0}])
+        self.assertNotIn('"price"', sql)
+        self.assertNotIn('rating_sum', sql)
+
+        results, sql = self.get_list(fields='rate', ordering='-price')
+        self.assertEqual(results, [{'id': self.book1.pk, 'rate': '4.00'}, {'id': self.book2.pk, 'rate': None}])
+        self.assertIn('"price"', sql)
+
+    def test_expand(self):
+        results, sql = self.get_list(fields='name', expand='owner,shops,stock')
+        self.assertNotIn('"password"', sql)
+        self.assertEqual(results[0], {
+            'id': self.book1.pk,
+            'name': 'Война и мир',
+            'owner': {'id': self.user.pk, 'username': 'testuser'},
+            'shops': [{'id': self.shop1.pk, 'name': 'Библио-Глобус'}, {'id': self.shop2.pk, 'name': 'Читай-город'}],
+            'stock': [{'shop': self.shop1.pk, 'count': 0}, {'shop': self.shop2.pk, 'count': 2}],
+        })
+        self.assertEqual((results[1]['owner'], results[1]['stock']), (None, []))
+
+        response = self.client.get(reverse('book-detail', args=[self.book1.pk]), {'expand': 'owner'})
+        self.assertEqual(response.data['owner'], {'id': self.user.pk, 'username': 'testuser'})
+        self.assertEqual(response.data['rate'], '4.00')
+
+    def test_expanded_stock_is_not_served_stale(self):
+        self.get_list(expand='stock')
+        Stock.objects.filter(book=self.book1, shop=self.shop1).update(count=7)
+        stock = Stock.objects.get(book=self.book1, shop=self.shop2)
+        stock.count = 3
+        stock.save()
+        results, _ = self.get_list(expand='stock')
+        self.assertEqual(results[0]['stock'][1], {'shop': self.shop2.pk, 'count': 3})
+
+    def test_expanded_owner_follows_username(self):
+        response = self.client.get(reverse('book-list'), {'expand': 'owner'})
+        self.client.login(username='testuser', password='testpassword')
+        self.client.logout()
+        # A login does not invalidate the owners.
+        self.assertEqual(self.client.get(reverse('book-list'), {'expand': 'owner'})['X-Cache'], 'HIT')
+        self.user.username = 'renamed'
+        self.user.save()
+        renamed = self.client.get(reverse('book-list'), {'expand': 'owner'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(renamed.status_code, status.HTTP_200_OK)
+        self.assertEqual(renamed['X-Cache'], 'MISS')
+        self.assertEqual(renamed.data['results'][0]['owner']['username'], 'renamed')
+
+    def test_unknown_names(self):
+        response = self.client.get(reverse('book-list'), {'fields': 'name,password'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'fields': ['Unknown field "password".']})
+        response = self.client.get(reverse('book-list'), {'expand': 'readers'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_writes_return_every_field(self):
+        self.client.force_login(self.user)
+        response = self.client.patch(reverse('book-detail', args=[self.book1.pk]) + '?fields=name',
+                                     {'price': '450.00'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data), {'id', 'name', 'price', 'author_name', 'owner', 'like_count', 'rate'})
@@ -0,0 +1,105 @@
+import logging
+import threading
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TransactionTestCase, skipUnlessDBFeature
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.checkout import OutOfStock, checkout
+from store.models import Book, Cart, Order, OrderItem, Shop, Stock
+
+logger = logging.getLogger(__name__)
+
+
+class CheckoutTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.book1 = Book.objects.create(name='Война и мир', price=500.00, author_name='Лев Толстой')
+        self.book2 = Book.objects.create(name='Идиот', price=350.00, author_name='Фёдор Достоевский')
+        self.shop1 = Shop.objects.create(name='Библио-Глобус')
+        self.shop2 = Shop.objects.create(name='Читай-город')
+        self.stock1 = Stock.objects.create(shop=self.shop1, book=self.book1, count=1)
+        self.stock2 = Stock.objects.create(shop=self.shop2, book=self.book2, count=3)
+        self.cart = Cart.objects.create(user=self.user, total_price=850.00)
+        self.cart.books.add(self.book1, self.book2)
+
+    def test_checkout(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('checkout-list'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['total_price'], '850.00')
+        self.assertEqual(sorted(item['book'] for item in response.data['items']), [self.book1.id, self.book2.id])
+        self.stock1.refresh_from_db()
+        self.stock2.refresh_from_db()
+        self.assertEqual((self.stock1.count, self.stock2.count), (0, 2))
+        self.assertFalse(self.cart.books.exists())
+
+    def test_out_of_stock_reserves_nothing(self):
+        Stock.objects.filter(pk=self.stock1.pk).update(count=0)
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('checkout-list'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['books'], [self.book1.id])
+        self.stock2.refresh_from_db()
+        self.assertEqual(self.stock2.count, 3)
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(self.cart.books.count(), 2)
+
+    def test_empty_cart(self):
+        self.cart.books.clear()
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('checkout-list'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_requires_authentication(self):
+        response = self.client.post(reverse('checkout-list'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+@skipUnlessDBFeature('has_select_for_update_skip_locked')
+class CheckoutConcurrencyTests(TransactionTestCase):
+    buyers = 40
+
+    def setUp(self):
+        self.book = Book.objects.create(name='Мастер и Маргарита', price=400.00, author_name='Михаил Булгаков')
+        for name, count in (('Библио-Глобус', 7), ('Читай-город', 5), ('Москва', 3)):
+            Stock.objects.create(shop=Shop.objects.create(name=name), book=self.book, count=count)
+        self.users = []
+        for i in range(self.buyers):
+            user = User.objects.create_user(username=f'buyer{i}', password='password')
+            Cart.objects.create(user=user, total_price=400.00).books.add(self.book)
+            self.users.append(user)
+
+    def test_parallel_checkouts_never_oversell(self):
+        results = []
+        barrier = threading.Barrier(self.buyers)
+
+        def buy(user):
+            try:
+                barrier.wait()
+                checkout(user)
+                results.append('ok')
+            except OutOfStock:
+                results.append('out of stock')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(user,)) for user in self.users]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(len(results), self.buyers)
+        self.assertEqual(results.count('ok'), 15)
+        self.assertEqual(list(Stock.objects.values_list('count', flat=True)), [0, 0, 0])
+        self.assertEqual(OrderItem.objects.count(), 15)
+        self.assertEqual(Order.objects.filter(total_price=Decimal('400.00')).count(), 15)
+        logger.info('%d parallel checkouts: %.0f checkouts/s', self.buyers, self.buyers / elapsed)
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db.models import Count, Q
+from rest_framework.test import APITestCase
+
+from store.management.commands.benchmark_servers import read_response
+from store.leaderboard import COMMENT_WEIGHT, leaderboard, relation_activity
+from store.models import Book, BookScore, Comment, Quote, Shop, Stock, UserBookRelation
+
+
+class GenerateCatalogTests(APITestCase):
+    def generate(self, **options):
+        out = StringIO()
+        call_command('generate_catalog', stdout=out, **{'books': 200, 'users': 500, 'relations': 3000,
+                                                        'shops': 4, 'seed': 7, 'chunk_size': 500, **options})
+        return out.getvalue()
+
+    def test_generates_skewed_catalog(self):
+        output = self.generate()
+        self.assertIn('rows/s', output)
+        self.assertEqual(Book.objects.count(), 200)
+        self.assertEqual(User.objects.count(), 500)
+        self.assertEqual(Shop.objects.count(), 4)
+        self.assertGreater(Stock.objects.count(), 0)
+        self.assertEqual(Comment.objects.count(), 300)
+        self.assertEqual(Quote.objects.count(), 20)
+        relations = UserBookRelation.objects.count()
+        self.assertAlmostEqual(relations, 3000, delta=30)
+
+        per_book = sorted(Book.objects.annotate(total=Count('userbookrelation'))
+                          .values_list('total', flat=True), reverse=True)
+        # Zipf: the top tenth of the books has more readers than the bottom half.
+        self.assertGreater(sum(per_book[:20]), sum(per_book[100:]))
+
+    def test_counters_are_rebuilt(self):
+        self.generate()
+        for book in Book.objects.annotate(likes=Count('userbookrelation', filter=Q(userbookrelation__like=True))):
+            self.assertEqual(book.likes_count, book.likes)
+
+    def test_trending_scores_are_seeded(self):
+        self.generate()
+        book = Book.objects.annotate(total=Count('userbookrelation')).order_by('-total').first()
+        weight = sum(relation_activity((book.pk, like, rate))[1] for like, rate in
+                     UserBookRelation.objects.filter(book=book).values_list('like', 'rate'))
+        weight += COMMENT_WEIGHT * Comment.objects.filter(book=book).count()
+        self.assertAlmostEqual(BookScore.objects.get(book=book).trending, weight)
+        leaderboard.reset()
+        self.addCleanup(leaderboard.reset)
+        self.assertEqual(leaderboard.top('trending')[0], BookScore.objects.filter(trending__gt=0).count())
+
+    def test_same_seed_same_catalog(self):
+        self.generate()
+        first = list(Book.objects.order_by('pk').values_list('name', 'price', 'author_name'))
+        Book.objects.all().delete()
+        self.generate(prefix='again')
+        second = list(Book.objects.order_by('pk').values_list('name', 'price', 'author_name'))
+        self.assertEqual(first, second)
+
+
+class BenchmarkTests(APITestCase):
+    def test_reports_every_endpoint(self):
+        call_command('generate_catalog', books=30, users=5, relations=100, shops=2, stdout=StringIO())
+        books = Book.objects.count()
+        out = StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.json')
+            call_command('benchmark', requests=3, import_rows=20, export_requests=1, output=path, stdout=out)
+            with open(path) as results_file:
+                results = json.load(results_file)
+        for name in ('BookViewSet.list', 'BookViewSet.retrieve', 'BookViewSet.export', 'UserBookRelationViewSet.list',
+                     'CommentViewSet.list', 'QuoteViewSet.retrieve', 'StockViewSet.list', 'ShopViewSet.list'):
+            self.assertIn(name, results['endpoints'])
+            self.assertIn(name, out.getvalue())
+            self.assertEqual(results['endpoints'][name]['errors'], 0, name)
+        self.assertGreater(results['endpoints']['BookViewSet.list']['queries'], 0)
+        self.assertEqual(results['imports']['BookViewSet.bulk']['rows'], 20)
+        self.assertGreater(results['imports']['BookViewSet.bulk']['rows_per_s'], 0)
+        self.assertEqual(results['serializers']['BookSerializer']['rows'], 30)
+        self.assertGreater(results['serializers']['CommentSerializer']['compiled_rows_per_s'], 0)
+        # Imports are rolled back.
+        self.assertEqual(Book.objects.count(), books)
+
+
+class BenchmarkServersTests(APITestCase):
+    def parse(self, payload):
+        async def parse():
+            reader = asyncio.StreamReader()
+            reader.feed_data(payload)
+            reader.feed_eof()
+            return await read_response(reader), await reader.read()
+        return asyncio.run(parse())
+
+    def test_reads_one_response_per_call(self):
+        response = b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}'
+        self.assertEqual(self.parse(response + b'next'), ((200, True), b'next'))
+        chunked = (b'HTTP/1.1 404 Not Found\r\nTransfer-Encoding: chunked\r\nConnection: close\r\n\r\n'
+                   b'2\r\n{}\r\n0\r\n\r\n')
+        self.assertEqual(self.parse(chunked), ((404, False), b''))
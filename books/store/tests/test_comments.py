@@ -0,0 +1,90 @@
+import datetime
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book, Comment
+
+
+class CommentFeedTests(APITestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='reader1', password='testpassword')
+        self.user2 = User.objects.create_user(username='reader2', password='testpassword')
+        self.book1 = Book.objects.create(name='Война и мир', price=500.00, author_name='Лев Толстой')
+        self.book2 = Book.objects.create(name='Идиот', price=350.00, author_name='Фёдор Достоевский')
+        created = timezone.now()
+        self.comments = []
+        for index in range(5):
+            comment = Comment.objects.create(user=[self.user1, self.user2][index % 2], book=self.book1,
+                                             text=f'Комментарий {index}')
+            self.comments.append(comment)
+        # Two comments share a timestamp, the id breaks the tie.
+        for index, comment in enumerate(self.comments):
+            Comment.objects.filter(pk=comment.pk).update(
+                datetime_created=created + datetime.timedelta(seconds=min(index, 3)))
+        Comment.objects.create(user=self.user1, book=self.book2, text='Другая книга')
+
+    def feed(self, book, **params):
+        return self.client.get(reverse('book-comments', args=[book.pk]), params)
+
+    def test_pages_in_order(self):
+        with self.assertNumQueries(2):
+            response = self.feed(self.book1, page_size=2)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual([(row['id'], row['username']) for row in response.data['results']],
+                         [(self.comments[0].pk, 'reader1'), (self.comments[1].pk, 'reader2')])
+
+        ids = []
+        url = reverse('book-comments', args=[self.book1.pk]) + '?page_size=2'
+        while url:
+            response = self.client.get(url)
+            ids += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, [comment.pk for comment in self.comments])
+
+        response = self.feed(self.book1, ordering='-datetime_created', page_size=3)
+        self.assertEqual([row['id'] for row in response.data['results']],
+                         [self.comments[4].pk, self.comments[3].pk, self.comments[2].pk])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([row['id'] for row in response.data['results']], [self.comments[1].pk, self.comments[0].pk])
+
+    def test_errors(self):
+        self.assertEqual(self.feed(self.book1, ordering='text').status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('book-comments', args=[0]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_comments_count(self):
+        self.assertEqual(Book.objects.get(pk=self.book2.pk).comments_count, 1)
+        self.comments[0].delete()
+        comment = Comment.objects.get(pk=self.comments[1].pk)
+        comment.book = self.book2
+        comment.save()
+        self.assertEqual([self.feed(book).data['count'] for book in (self.book1, self.book2)], [3, 2])
+        self.client.force_login(self.user1)
+        response = self.client.post(reverse('comment-list'),
+                                    {'user': self.user1.pk, 'book': self.book2.pk, 'text': 'Ещё один'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['username'], 'reader1')
+        self.assertEqual(self.feed(self.book2).data['count'], 3)
+
+        self.book1.delete()
+        self.assertEqual(Book.objects.get(pk=self.book2.pk).comments_count, 3)
+
+    def test_comment_list_follows_username(self):
+        response = self.client.get(reverse('comment-list'))
+        self.user1.username = 'renamed'
+        self.user1.save()
+        response = self.client.get(reverse('comment-list'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('renamed', {row['username'] for row in response.data['results']})
+
+    def test_rebuild_command(self):
+        Book.objects.update(comments_count=0)
+        call_command('rebuild_book_counters', stdout=StringIO())
+        self.assertEqual(list(Book.objects.order_by('pk').values_list('comments_count', flat=True)), [5, 1])
@@ -0,0 +1,151 @@
+import gc
+import threading
+from io import BytesIO
+from unittest import skipUnless
+
+import psycopg2
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection, connections
+from django.test import TransactionTestCase
+
+from books.postgresql_pool.pool import ConnectionPool, PoolTimeout
+from books.stats import request_stats
+from store.models import Book
+
+pooled = connection.settings_dict['ENGINE'] == 'books.postgresql_pool'
+
+
+def backend_pid():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_backend_pid()')
+        return cursor.fetchone()[0]
+
+
+@skipUnless(pooled, 'DB_POOL is off')
+class PooledRequestTests(TransactionTestCase):
+    def setUp(self):
+        Book.objects.create(name='Война и мир', price=500.00, author_name='Лев Толстой')
+        connection.close()
+        request_stats.reset()
+
+    def wsgi_get(self, path):
+        """
+        Serves a request the way a WSGI server does, so request_started / request_finished
+        close (here: return) the connection like in production.
+        """
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'SERVER_NAME': 'testserver', 'SERVER_PORT': '80',
+                   'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.url_scheme': 'http', 'wsgi.input': BytesIO()}
+        statuses = []
+        response = WSGIHandler()(environ, lambda status, headers: statuses.append(status))
+        b''.join(response)
+        response.close()
+        return statuses[0]
+
+    def test_requests_reuse_connections(self):
+        pool = None
+        for _ in range(5):
+            self.assertEqual(self.wsgi_get('/book/'), '200 OK')
+            # The connection went back to the pool at the end of the request.
+            self.assertIsNone(connection.connection)
+            pool = pool or connection.pool
+        self.assertEqual(request_stats.merged('BookViewSet.list')['db_connects'].total, 0)
+        self.assertGreaterEqual(pool.stats()['reused'], 5)
+
+    def test_request_threads_share_connections(self):
+        # Under ASGI every request runs its sync code on a fresh thread.
+        pids = []
+
+        def request():
+            pids.append(backend_pid())
+            connections.close_all()
+
+        for _ in range(5):
+            thread = threading.Thread(target=request)
+            thread.start()
+            thread.join()
+        self.assertEqual(len(set(pids)), 1)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'PostgreSQL only')
+class ConnectionPoolTests(TransactionTestCase):
+    def setUp(self):
+        params = {**connection.get_connection_params()}
+        self.connect = lambda: psycopg2.connect(**params)
+        self.pools = []
+
+    def tearDown(self):
+        for pool in self.pools:
+            pool.close()
+
+    def pool(self, **options):
+        pool = ConnectionPool(**{'min_size': 0, 'max_size': 2, 'timeout': 1, **options})
+        self.pools.append(pool)
+        return pool
+
+    def test_returned_connection_is_reused(self):
+        pool = self.pool()
+        first, reused = pool.getconn(self.connect)
+        self.assertFalse(reused)
+        with first.cursor() as cursor:
+            # Left open by the borrower, rolled back by the pool.
+            cursor.execute('BEGIN; CREATE TEMP TABLE scratch (id int)')
+        pool.putconn(first)
+        second, reused = pool.getconn(self.connect)
+        self.assertIs(second, first)
+        self.assertTrue(reused)
+        with second.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('scratch')")
+            self.assertIsNone(cursor.fetchone()[0])
+        self.assertEqual(pool.stats()['opened'], 1)
+
+    def test_max_age(self):
+        pool = self.pool(max_age=0)
+        first, _ = pool.getconn(self.connect)
+        pool.putconn(first)
+        self.assertTrue(first.closed)
+        second, reused = pool.getconn(self.connect)
+        self.assertFalse(reused)
+        self.assertEqual(pool.stats()['closed'], 1)
+
+    def test_idle_connections_above_min_size_are_closed(self):
+        pool = self.pool(min_size=1, max_idle=0)
+        first, _ = pool.getconn(self.connect)
+        second, _ = pool.getconn(self.connect)
+        pool.putconn(first)
+        pool.putconn(second)
+        self.assertEqual(pool.stats()['idle'], 1)
+        self.assertTrue(first.closed)
+        self.assertFalse(second.closed)
+
+    def test_health_check_replaces_dead_connection(self):
+        pool = self.pool(check_idle=0)
+        first, _ = pool.getconn(self.connect)
+        pool.putconn(first)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [first.info.backend_pid])
+        second, reused = pool.getconn(self.connect)
+        self.assertIsNot(second, first)
+        self.assertFalse(reused)
+        with second.cursor() as cursor:
+            cursor.execute('SELECT 1')
+
+    def test_waits_for_free_connection(self):
+        pool = self.pool(max_size=1, timeout=0.1)
+        first, _ = pool.getconn(self.connect)
+        with self.assertRaises(PoolTimeout):
+            pool.getconn(self.connect)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+        threading.Timer(0.05, pool.putconn, [first]).start()
+        pool.timeout = 5
+        second, _ = pool.getconn(self.connect)
+        self.assertIs(second, first)
+
+    def test_lost_connection_frees_slot(self):
+        pool = self.pool(max_size=1, timeout=2)
+        lost, _ = pool.getconn(self.connect)
+        del lost
+        gc.collect()
+        replacement, reused = pool.getconn(self.connect)
+        self.assertFalse(reused)
+        pool.putconn(replacement)
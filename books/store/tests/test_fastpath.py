@@ -0,0 +1,93 @@
+import datetime
+import json
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from store.fastpath import CompiledSerializer
+from store.models import Book, Comment, Quote, Shop, Stock, UserBookRelation
+from store.serializers import BookSerializer, CommentSerializer, QuoteSerializer, ShopSerializer, StockSerializer
+
+
+class CompiledSerializerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testcase_user', password='testpassword')
+        self.book1 = Book.objects.create(name='Book 1', price='100.5', author_name='Author 1', owner=self.user)
+        self.book2 = Book.objects.create(name='Book 2', price=200, author_name='Author 2')
+        UserBookRelation.objects.create(user=self.user, book=self.book1, like=True, rate=5)
+        UserBookRelation.objects.create(user=User.objects.create_user(username='another'), book=self.book1, rate=3)
+        shop = Shop.objects.create(name='Shop 1')
+        Stock.objects.create(shop=shop, book=self.book1, count=10)
+        Stock.objects.create(shop=shop, book=self.book2, count=0)
+        Comment.objects.create(user=self.user, book=self.book1, text='Great book!')
+        comment = Comment.objects.create(user=self.user, book=self.book2, text='')
+        Comment.objects.filter(pk=comment.pk).update(
+            datetime_created=datetime.datetime(2024, 6, 29, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc))
+        Quote.objects.create(book=self.book1, text='Inspiring quote', author='Author 1', owner=self.user)
+        Quote.objects.create(book=self.book2, text='Another quote', author='Author 2')
+
+    def assertSameOutput(self, serializer, queryset):
+        compiled = CompiledSerializer.compile(serializer, queryset)
+        self.assertIsNotNone(compiled)
+        expected = type(serializer)(queryset, many=True, context=serializer.context).data
+        data = compiled.to_representation(compiled.values(queryset))
+        self.assertEqual(JSONRenderer().render(data), JSONRenderer().render(expected))
+        return data
+
+    def test_same_bytes_as_the_serializers(self):
+        data = self.assertSameOutput(BookSerializer(), Book.objects.with_rate().order_by('pk'))
+        self.assertEqual([(row['price'], row['rate']) for row in data], [('100.50', '4.00'), ('200.00', None)])
+        self.assertSameOutput(StockSerializer(), Stock.objects.order_by('pk'))
+        self.assertSameOutput(CommentSerializer(), Comment.objects.select_related('user').order_by('pk'))
+        self.assertSameOutput(QuoteSerializer(), Quote.objects.order_by('pk'))
+        self.assertSameOutput(BookSerializer(context={'fields': ['id', 'price'], 'expand': []}),
+                              Book.objects.order_by('-pk'))
+
+    @override_settings(TIME_ZONE='Europe/Moscow')
+    def test_datetimes_in_the_current_time_zone(self):
+        data = self.assertSameOutput(CommentSerializer(), Comment.objects.select_related('user').order_by('pk'))
+        self.assertEqual(data[1]['datetime_created'], '2024-06-29T15:30:15.123456+03:00')
+        with timezone.override(datetime.timezone.utc):
+            data = self.assertSameOutput(CommentSerializer(), Comment.objects.select_related('user').order_by('pk'))
+        self.assertEqual(data[1]['datetime_created'], '2024-06-29T12:30:15.123456Z')
+
+    def test_fields_without_a_column_are_not_compiled(self):
+        class ReadersSerializer(BookSerializer):
+            readers_count = serializers.SerializerMethodField()
+
+            class Meta(BookSerializer.Meta):
+                fields = ['id', 'readers_count']
+
+        self.assertIsNone(CompiledSerializer.compile(ReadersSerializer(), Book.objects.all()))
+        # A rate that was not annotated, the m2m books of a shop, a nested serializer.
+        self.assertIsNone(CompiledSerializer.compile(BookSerializer(), Book.objects.all()))
+        self.assertIsNone(CompiledSerializer.compile(ShopSerializer(), Shop.objects.all()))
+        self.assertIsNone(CompiledSerializer.compile(
+            BookSerializer(context={'fields': None, 'expand': ['owner']}), Book.objects.with_rate()))
+
+
+class CompiledListTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        for index in range(5):
+            book = Book.objects.create(name=f'Книга {index}', price=100 + index, author_name=f'Автор {index % 2}',
+                                       owner=self.user)
+            Comment.objects.create(user=self.user, book=book, text=f'Комментарий {index}')
+
+    def test_pages_follow_the_cursor(self):
+        url = reverse('book-list') + '?ordering=-author_name&page_size=2'
+        names = []
+        while url:
+            response = self.client.get(url)
+            names += [row['name'] for row in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(names, ['Книга 3', 'Книга 1', 'Книга 4', 'Книга 2', 'Книга 0'])
+
+        response = self.client.get(reverse('comment-list'), {'ordering': '-datetime_created', 'page_size': 2})
+        self.assertEqual([row['text'] for row in response.data['results']], ['Комментарий 4', 'Комментарий 3'])
+        self.assertEqual(json.loads(response.content)['results'][0]['username'], 'testuser')
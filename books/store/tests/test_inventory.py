@@ -0,0 +1,159 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.checkout import checkout
+from store.inventory import rebuild_inventory
+from store.models import Book, BookInventory, Cart, Shop, ShopInventory, Stock
+
+
+def summaries():
+    return ({row[0]: row[1:] for row in ShopInventory.objects.values_list('shop', 'units', 'titles', 'out_of_stock')},
+            {row[0]: row[1:] for row in BookInventory.objects.values_list('book', 'units', 'shops', 'out_of_stock')})
+
+
+class InventoryTests(APITestCase):
+    def setUp(self):
+        self.staff_user = User.objects.create_user(username='staffuser', password='staffpassword', is_staff=True)
+        self.book1 = Book.objects.create(name='Война и мир', price=500.00, author_name='Лев Толстой')
+        self.book2 = Book.objects.create(name='Идиот', price=350.00, author_name='Фёдор Достоевский')
+        self.shop1 = Shop.objects.create(name='Библио-Глобус')
+        self.shop2 = Shop.objects.create(name='Читай-город')
+        self.stock1 = Stock.objects.create(shop=self.shop1, book=self.book1, count=1)
+        self.stock2 = Stock.objects.create(shop=self.shop1, book=self.book2, count=3)
+        self.stock3 = Stock.objects.create(shop=self.shop2, book=self.book1, count=0)
+
+    def assertMatchesRebuild(self):
+        incremental = summaries()
+        rebuild_inventory()
+        self.assertEqual(incremental, summaries())
+
+    def test_stock_changes_update_summaries(self):
+        shops, books = summaries()
+        self.assertEqual(shops, {self.shop1.pk: (4, 2, 0), self.shop2.pk: (0, 1, 1)})
+        self.assertEqual(books, {self.book1.pk: (1, 2, 1), self.book2.pk: (3, 1, 0)})
+
+        stock = Stock.objects.get(pk=self.stock1.pk)
+        stock.count = 0
+        stock.save()
+        stock = Stock.objects.get(pk=self.stock3.pk)
+        stock.count = 5
+        stock.save()
+        self.stock2.delete()
+        shops, books = summaries()
+        self.assertEqual(shops[self.shop1.pk], (0, 1, 1))
+        self.assertEqual(shops[self.shop2.pk], (5, 1, 0))
+        self.assertEqual(books[self.book1.pk], (5, 2, 1))
+        self.assertEqual(books[self.book2.pk], (0, 0, 0))
+        self.assertMatchesRebuild()
+
+    def test_moving_stock_to_another_shop(self):
+        stock = Stock.objects.get(pk=self.stock2.pk)
+        stock.shop = self.shop2
+        stock.save()
+        shops, _ = summaries()
+        self.assertEqual(shops, {self.shop1.pk: (1, 1, 0), self.shop2.pk: (3, 2, 1)})
+        self.assertMatchesRebuild()
+
+    def test_save_of_unloaded_instance(self):
+        Stock(pk=self.stock2.pk, shop=self.shop1, book=self.book2, count=10).save()
+        self.assertEqual(summaries()[0][self.shop1.pk], (11, 2, 0))
+
+    def test_stale_instances(self):
+        first, second = Stock.objects.get(pk=self.stock2.pk), Stock.objects.get(pk=self.stock2.pk)
+        first.count = 10
+        first.save()
+        second.count = 7
+        second.save()
+        self.assertEqual(summaries()[0][self.shop1.pk], (8, 2, 0))
+        first.delete()
+        self.assertEqual(summaries()[0][self.shop1.pk], (1, 1, 0))
+        self.assertMatchesRebuild()
+
+    def test_update_after_checkout(self):
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        Cart.objects.create(user=user, total_price=350.00).books.add(self.book2)
+        checkout(user)
+        self.client.force_login(self.staff_user)
+        response = self.client.patch(reverse('stock-detail', args=[self.stock2.pk]), {'count': 5}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(summaries()[0][self.shop1.pk], (6, 2, 0))
+        self.assertMatchesRebuild()
+
+    def test_checkout_updates_summaries(self):
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        cart = Cart.objects.create(user=user, total_price=850.00)
+        cart.books.add(self.book1, self.book2)
+        checkout(user)
+        shops, books = summaries()
+        self.assertEqual(shops[self.shop1.pk], (2, 2, 1))
+        self.assertEqual(books[self.book1.pk], (0, 2, 2))
+        self.assertEqual(books[self.book2.pk], (2, 1, 0))
+        self.assertMatchesRebuild()
+
+    def test_bulk_writes_update_summaries(self):
+        book3 = Book.objects.create(name='Анна Каренина', price=600.00, author_name='Лев Толстой')
+        self.client.force_login(self.staff_user)
+        response = self.client.post(reverse('stock-bulk'), [{'shop': self.shop2.pk, 'book': book3.pk, 'count': 4}],
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.patch(reverse('stock-bulk'), [{'id': self.stock1.pk, 'count': 0},
+                                                             {'id': self.stock3.pk, 'count': 2}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        shops, books = summaries()
+        self.assertEqual(shops[self.shop2.pk], (6, 2, 0))
+        self.assertEqual(books[book3.pk], (4, 1, 0))
+        self.assertMatchesRebuild()
+
+        response = self.client.delete(reverse('stock-bulk'), [self.stock1.pk, self.stock2.pk], format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(summaries()[0][self.shop1.pk], (0, 0, 0))
+        self.assertMatchesRebuild()
+
+    def test_deleting_shop_or_book(self):
+        self.shop2.delete()
+        self.assertEqual(summaries()[1][self.book1.pk], (1, 1, 0))
+        self.book1.delete()
+        self.assertEqual(summaries(), ({self.shop1.pk: (3, 1, 0)}, {self.book2.pk: (3, 1, 0)}))
+        self.assertMatchesRebuild()
+
+    def test_duplicate_stock_rejected(self):
+        self.client.force_login(self.staff_user)
+        response = self.client.post(reverse('stock-list'), {'shop': self.shop1.pk, 'book': self.book1.pk, 'count': 2},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_endpoints(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('shopinventory-detail', args=[self.shop1.pk]))
+        self.assertEqual(response.data, {'shop': self.shop1.pk, 'units': 4, 'titles': 2, 'out_of_stock': 0})
+        response = self.client.get(reverse('bookinventory-detail', args=[self.book1.pk]))
+        self.assertEqual(response.data, {'book': self.book1.pk, 'units': 1, 'shops': 2, 'out_of_stock': 1})
+
+        shop3 = Shop.objects.create(name='Москва')
+        response = self.client.get(reverse('shopinventory-detail', args=[shop3.pk]))
+        self.assertEqual(response.data, {'shop': shop3.pk, 'units': 0, 'titles': 0, 'out_of_stock': 0})
+        response = self.client.get(reverse('shopinventory-detail', args=[0]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.get(reverse('shopinventory-list'))
+        self.assertEqual([row['shop'] for row in response.data['results']], [self.shop1.pk, self.shop2.pk])
+        etag = response['ETag']
+        Stock.objects.create(shop=shop3, book=self.book2, count=1)
+        response = self.client.get(reverse('shopinventory-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_rebuild_command(self):
+        ShopInventory.objects.all().delete()
+        BookInventory.objects.filter(pk=self.book1.pk).update(units=100)
+        expected = ({self.shop1.pk: (4, 2, 0), self.shop2.pk: (0, 1, 1)},
+                    {self.book1.pk: (1, 2, 1), self.book2.pk: (3, 1, 0)})
+        out = StringIO()
+        call_command('rebuild_inventory', batch_size=1, stdout=out)
+        self.assertIn('Rebuilt 4 inventory summaries', out.getvalue())
+        self.assertEqual(summaries(), expected)
@@ -0,0 +1,134 @@
+import random
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from freezegun import freeze_time
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.leaderboard import SkipList, leaderboard
+from store.models import Book, BookScore, Comment, UserBookRelation
+
+HALF_LIFE = 86400
+
+
+class SkipListTests(SimpleTestCase):
+    def test_matches_sorted_list(self):
+        skiplist, expected = SkipList(seed=1), []
+        rng = random.Random(0)
+        for _ in range(2000):
+            key = rng.randrange(300)
+            if key in expected:
+                skiplist.remove(key)
+                expected.remove(key)
+            else:
+                skiplist.insert(key)
+                expected.append(key)
+                expected.sort()
+        self.assertEqual(list(skiplist), expected)
+        self.assertEqual(len(skiplist), len(expected))
+        for key in range(300):
+            self.assertEqual(skiplist.rank(key), expected.index(key) if key in expected else None)
+        for index in (0, 1, len(expected) // 2, len(expected) - 1, len(expected), len(expected) + 5):
+            self.assertEqual(list(skiplist.iter_from(index)), expected[index:])
+        with self.assertRaises(KeyError):
+            skiplist.insert(expected[0])
+        with self.assertRaises(KeyError):
+            skiplist.remove(-1)
+
+
+@override_settings(STORE_LEADERBOARD_SYNC_INTERVAL=0, STORE_TRENDING_HALF_LIFE=HALF_LIFE)
+class LeaderboardTests(APITestCase):
+    def setUp(self):
+        leaderboard.reset()
+        self.addCleanup(leaderboard.reset)
+        self.users = [User.objects.create_user(username=f'reader{i}', password='testpassword') for i in range(3)]
+        self.book1 = Book.objects.create(name='Война и мир', price=500.00, author_name='Лев Толстой')
+        self.book2 = Book.objects.create(name='Идиот', price=350.00, author_name='Фёдор Достоевский')
+        self.book3 = Book.objects.create(name='Бесы', price=400.00, author_name='Фёдор Достоевский')
+
+    def relate(self, user, book, **values):
+        with self.captureOnCommitCallbacks(execute=True):
+            relation, _ = UserBookRelation.objects.get_or_create(user=user, book=book)
+            for field, value in values.items():
+                setattr(relation, field, value)
+            relation.save()
+
+    def ranking(self, name):
+        return [(book_id, round(score, 3)) for book_id, _, score in leaderboard.top(name, 0, 10)[1]]
+
+    def test_top_rated_uses_bayesian_average(self):
+        for user in self.users:
+            self.relate(user, self.book1, rate=5)
+        self.relate(self.users[0], self.book2, rate=5)
+        self.relate(self.users[0], self.book3, rate=2)
+        self.assertEqual(self.ranking('top-rated'),
+                         [(self.book1.pk, 3.75), (self.book2.pk, 3.333), (self.book3.pk, 2.833)])
+
+        # Changes after the build are applied on commit.
+        self.relate(self.users[1], self.book3, rate=5)
+        self.relate(self.users[2], self.book3, rate=5)
+        self.assertEqual(leaderboard.rank('top-rated', self.book3.pk), (1, 3.375))
+        with self.captureOnCommitCallbacks(execute=True):
+            UserBookRelation.objects.filter(book=self.book1).delete()
+        self.assertEqual([book_id for book_id, _ in self.ranking('top-rated')], [self.book3.pk, self.book2.pk])
+
+    def test_trending_decays(self):
+        with freeze_time('2026-01-01') as frozen:
+            self.relate(self.users[0], self.book1, like=True)
+            with self.captureOnCommitCallbacks(execute=True):
+                Comment.objects.create(user=self.users[0], book=self.book1, text='Отлично')
+            self.assertEqual(self.ranking('trending'), [(self.book1.pk, 1.5)])
+
+            frozen.tick(HALF_LIFE)
+            self.relate(self.users[1], self.book2, like=True, rate=5)
+            self.assertEqual(self.ranking('trending'), [(self.book2.pk, 2.0), (self.book1.pk, 0.75)])
+
+            frozen.tick(HALF_LIFE)
+            self.relate(self.users[1], self.book1, like=True)
+            self.assertEqual(self.ranking('trending'), [(self.book1.pk, 1.375), (self.book2.pk, 1.0)])
+            # Taking a like back removes it at its current weight, the score never goes negative.
+            self.relate(self.users[1], self.book1, like=False)
+            self.relate(self.users[0], self.book1, like=False)
+            self.assertEqual(self.ranking('trending'), [(self.book2.pk, 1.0)])
+            self.assertEqual(BookScore.objects.get(pk=self.book1.pk).trending, 0)
+
+    def test_sync_reads_changes_of_other_processes(self):
+        self.relate(self.users[0], self.book1, like=True)
+        self.assertEqual(len(self.ranking('trending')), 1)
+        # What another process writes reaches this one through BookScore.updated_at only.
+        with self.captureOnCommitCallbacks(execute=False):
+            self.relate(self.users[0], self.book2, like=True, rate=4)
+        self.assertEqual([book_id for book_id, _ in self.ranking('trending')], [self.book2.pk, self.book1.pk])
+        self.assertEqual(leaderboard.rank('top-rated', self.book2.pk)[0], 0)
+
+        self.book2.delete()
+        self.assertIsNone(leaderboard.rank('trending', self.book2.pk))
+
+    def test_endpoints(self):
+        for user in self.users:
+            self.relate(user, self.book1, rate=5)
+        self.relate(self.users[0], self.book2, rate=4, like=True)
+        response = self.client.get(reverse('leaderboard-detail', args=['top-rated']), {'limit': 1, 'offset': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual([(row['rank'], row['id'], row['name'], row['rate']) for row in response.data['results']],
+                         [(2, self.book2.pk, 'Идиот', '4.00')])
+
+        # Between syncs a page costs one query, for its books.
+        with self.settings(STORE_LEADERBOARD_SYNC_INTERVAL=60), self.assertNumQueries(1):
+            response = self.client.get(reverse('leaderboard-detail', args=['trending']))
+        self.assertEqual([row['id'] for row in response.data['results']], [self.book1.pk, self.book2.pk])
+
+        response = self.client.get(reverse('leaderboard-rank', args=['top-rated', self.book1.pk]))
+        self.assertEqual(response.data, {'book': self.book1.pk, 'rank': 1, 'score': 3.75})
+        response = self.client.get(reverse('leaderboard-rank', args=['trending', self.book3.pk]))
+        self.assertEqual(response.data, {'book': self.book3.pk, 'rank': None, 'score': None})
+        response = self.client.get(reverse('leaderboard-rank', args=['trending', 0]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.get(reverse('leaderboard-detail', args=['trending']), {'limit': 'x'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/leaderboard/popular/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
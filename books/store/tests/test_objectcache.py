@@ -0,0 +1,122 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from store.models import Book, Shop, UserBookRelation
+from store.objectcache import LRUCache, entry_size
+from store.renderers import JSONFragment
+from store.views import BookViewSet, book_object_cache
+
+
+class LRUCacheTests(SimpleTestCase):
+    def test_evicts_least_recently_used_by_size(self):
+        value = {'name': 'x' * 100}
+        lru = LRUCache(max_bytes=entry_size(value) * 3)
+        lru.set_many({'a': value, 'b': value, 'c': value})
+        self.assertEqual(lru.get_many(['a']), {'a': value})
+        lru.set_many({'d': value})
+        self.assertEqual(set(lru.get_many(['a', 'b', 'c', 'd'])), {'a', 'c', 'd'})
+        self.assertLessEqual(lru.size, lru.max_bytes)
+        lru.set_many({'big': {'name': 'x' * 1000}})
+        self.assertEqual(lru.get_many(['big']), {})
+        lru.clear()
+        self.assertEqual((len(lru), lru.size), (0, 0))
+
+
+class BookObjectCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        book_object_cache.clear_local()
+        book_object_cache.reset_stats()
+        self.owner = User.objects.create_user(username='owner', password='testpassword')
+        self.reader = User.objects.create_user(username='reader', password='testpassword')
+        self.book1 = Book.objects.create(name='Война и мир', price=500, author_name='Лев Толстой', owner=self.owner)
+        self.book2 = Book.objects.create(name='Идиот', price=350, author_name='Фёдор Достоевский')
+        self.shop = Shop.objects.create(name='Библио-Глобус')
+
+    def books(self, **params):
+        cache.clear()
+        return {row['id']: row for row in self.client.get(reverse('book-list'), params).data['results']}
+
+    def assertReloaded(self, change, book):
+        """
+        Applies `change` and checks that exactly `book` is loaded again.
+        """
+        self.books()
+        book_object_cache.reset_stats()
+        change()
+        books = self.books()
+        self.assertEqual(book_object_cache.stats()['misses'], 1)
+        self.books()
+        self.assertEqual(book_object_cache.stats()['misses'], 1)
+        return books[book.pk]
+
+    def test_hits_and_sparse_fields(self):
+        self.assertEqual(self.books()[self.book1.pk], {
+            'id': self.book1.pk, 'name': 'Война и мир', 'price': '500.00', 'author_name': 'Лев Толстой',
+            'owner': self.owner.pk, 'like_count': 0, 'rate': None})
+        self.assertEqual(self.books(fields='rate,name')[self.book2.pk], {'id': self.book2.pk, 'name': 'Идиот',
+                                                                         'rate': None})
+        stats = book_object_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['local_entries']), (2, 2, 2))
+
+    def test_cached_books_are_not_serialized_or_encoded_again(self):
+        first = self.client.get(reverse('book-list'))
+        cache.clear()
+        with mock.patch.object(BookViewSet, 'load_representations', autospec=True,
+                               side_effect=BookViewSet.load_representations) as load, \
+                mock.patch.object(book_object_cache, 'encode', wraps=book_object_cache.encode) as encode:
+            second = self.client.get(reverse('book-list'))
+            self.assertEqual(second.content, first.content)
+            self.assertEqual((load.call_count, encode.call_count), (0, 0))
+            self.assertIsInstance(second.data['results'][0], JSONFragment)
+
+            # The cached bytes go into the response as they are.
+            key = book_object_cache.make_key(self.book2.pk, self.book2.updated_at.timestamp())
+            book_object_cache.local.set_many({key: b'{"id": %d, "name": "cached"}' % self.book2.pk})
+            cache.clear()
+            self.assertIn(b'{"id": %d, "name": "cached"}' % self.book2.pk,
+                          self.client.get(reverse('book-list')).content)
+            self.assertEqual((load.call_count, encode.call_count), (0, 0))
+
+            self.book1.name = 'Анна Каренина'
+            self.book1.save()
+            self.assertEqual(self.books()[self.book1.pk]['name'], 'Анна Каренина')
+            self.assertEqual((load.call_count, encode.call_count), (1, 1))
+
+    def test_book_and_relation_changes(self):
+        def rename():
+            self.book1.name = 'Анна Каренина'
+            self.book1.save()
+        self.assertEqual(self.assertReloaded(rename, self.book1)['name'], 'Анна Каренина')
+
+        relation = UserBookRelation.objects.create(user=self.reader, book=self.book2, like=True)
+        self.assertEqual(self.books()[self.book2.pk]['like_count'], 1)
+
+        def rate():
+            relation.rate = 4
+            relation.save()
+        self.assertEqual(self.assertReloaded(rate, self.book2)['rate'], '4.00')
+
+        def bookmark():
+            # Not part of the representation, the counters and the version stay.
+            relation.in_bookmarks = True
+            relation.save()
+        self.books()
+        book_object_cache.reset_stats()
+        bookmark()
+        self.books()
+        self.assertEqual(book_object_cache.stats()['misses'], 0)
+
+    def test_shop_membership_and_owner_changes(self):
+        self.assertReloaded(lambda: self.shop.books.add(self.book2), self.book2)
+        self.assertReloaded(lambda: self.book2.shops.remove(self.shop), self.book2)
+        self.book1.shops.add(self.shop)
+        self.assertReloaded(lambda: self.shop.books.clear(), self.book1)
+        self.book2.shops.add(self.shop)
+        self.assertReloaded(self.shop.delete, self.book2)
+        self.assertIsNone(self.assertReloaded(self.owner.delete, self.book1)['owner'])
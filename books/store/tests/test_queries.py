@@ -0,0 +1,189 @@
+import re
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.cache import get_last_modified
+from store.counters import rebuild_counters
+from store.models import Book, Comment, Quote, Shop, Stock, UserBookRelation
+from store.views import book_object_cache
+
+
+def seed(books=20, users=4, shops=3, prefix='reader'):
+    """
+    Creates `books` books with one relation per user, a stock row per shop and a
+    comment and quote per book. Returns (users, books, shops).
+    """
+    user_list = User.objects.bulk_create([User(username=f'{prefix}{index}') for index in range(users)])
+    book_list = Book.objects.bulk_create([
+        Book(name=f'Книга {index}', price=Decimal(100 + index % 997), author_name=f'Автор {index % 50:03d}',
+             owner=user_list[index % users])
+        for index in range(books)
+    ])
+    shop_list = Shop.objects.bulk_create([Shop(name=f'Магазин {index}') for index in range(shops)])
+    UserBookRelation.objects.bulk_create([
+        UserBookRelation(user=user, book=book, like=(book.pk + user.pk) % 2 == 0, rate=(book.pk + user.pk) % 5 + 1)
+        for book in book_list for user in user_list
+    ])
+    Stock.objects.bulk_create([Stock(shop=shop, book=book, count=5) for book in book_list for shop in shop_list])
+    Shop.books.through.objects.bulk_create([
+        Shop.books.through(shop=shop, book=book) for book in book_list for shop in shop_list
+    ])
+    Comment.objects.bulk_create([Comment(user=user_list[0], book=book, text='Комментарий') for book in book_list])
+    Quote.objects.bulk_create([Quote(owner=user_list[0], book=book, text='Цитата', author='Автор')
+                               for book in book_list])
+    rebuild_counters()
+    return user_list, book_list, shop_list
+
+
+class QueryCountTests(APITestCase):
+    """
+    Pins the number of queries per endpoint. The counts must not depend on the number
+    of rows, so a new N+1 shows up here as a failure instead of in production.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.users, self.books, self.shops = seed()
+        self.user = self.users[0]
+
+    def count_queries(self, url, params=None):
+        cache.clear()
+        book_object_cache.clear_local()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries)
+
+    def assertQueryCount(self, expected, url, params=None, grow=None):
+        self.assertEqual(self.count_queries(url, params), expected, url)
+        if grow is not None:
+            grow()
+            self.assertEqual(self.count_queries(url, params), expected, f'{url} after adding rows')
+
+    def more_books(self):
+        seed(books=30, users=2, shops=2, prefix='another')
+
+    def test_book_list(self):
+        # The page's ids and versions, the books missing from the object cache, and the
+        # Last-Modified fallback for Book and Shop.
+        self.assertQueryCount(4, reverse('book-list'), grow=self.more_books)
+
+    def test_book_list_filtered(self):
+        self.assertQueryCount(4, reverse('book-list'), {'price': '105.00', 'ordering': 'author_name'})
+
+    def test_book_list_from_object_cache(self):
+        self.client.get(reverse('book-list'))
+        # Other params miss the response cache; the books come from the in-process LRU, then
+        # from the shared cache. Only the page's ids and versions are read from the book table.
+        for params in ({'fields': 'name'}, {'fields': 'rate'}):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(reverse('book-list'), params)
+            self.assertEqual(response['X-Cache'], 'MISS')
+            self.assertEqual(len([query for query in context.captured_queries
+                                  if 'FROM "store_book"' in query['sql']]), 1)
+            book_object_cache.clear_local()
+
+    def test_book_list_expanded(self):
+        # The owner is joined, shops and stock are prefetched, plus the Last-Modified fallback for Stock.
+        self.assertQueryCount(6, reverse('book-list'), {'expand': 'owner,shops,stock'}, grow=self.more_books)
+        self.assertQueryCount(3, reverse('book-list'), {'fields': 'name', 'expand': 'owner'})
+
+    def test_book_detail(self):
+        self.assertQueryCount(3, reverse('book-detail', args=[self.books[0].pk]))
+
+    def test_relation_list(self):
+        self.assertQueryCount(1, reverse('userbookrelation-list'), grow=self.more_books)
+
+    def test_relation_detail(self):
+        self.client.force_login(self.user)
+        # session + user, get_or_create lookup.
+        self.assertQueryCount(3, reverse('userbookrelation-detail', args=[self.books[0].pk]))
+
+    def test_comment_list(self):
+        # comments, Last-Modified fallback, and the filter form checking the book id.
+        self.assertQueryCount(3, reverse('comment-list'), {'book': self.books[0].pk}, grow=self.more_books)
+
+    def test_quote_list(self):
+        self.assertQueryCount(2, reverse('quote-list'), grow=self.more_books)
+
+    def test_shop_list(self):
+        self.assertQueryCount(4, reverse('shop-list'), grow=self.more_books)
+
+    def test_stock_list(self):
+        self.assertQueryCount(3, reverse('stock-list'), {'shop': self.shops[0].pk}, grow=self.more_books)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Query plans are checked on PostgreSQL only')
+class QueryPlanTests(APITestCase):
+    """
+    Runs EXPLAIN on the queries the hot filters send to a seeded, analyzed database and
+    fails when one of them reads a large table with a sequential scan. Small tables
+    (a handful of shops) are legitimately scanned.
+    """
+    books = 6000
+    users = 30
+    shops = 10
+    large_models = [Book, UserBookRelation, Stock, Comment, Quote, Shop.books.through]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user_list, cls.book_list, cls.shop_list = seed(books=cls.books, users=cls.users, shops=cls.shops)
+        with connection.cursor() as cursor:
+            for model in cls.large_models + [Shop, User]:
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+
+    def setUp(self):
+        cache.clear()
+        # The Max('updated_at') fallback runs once per cache lifetime, not per request.
+        get_last_modified([Book, Comment, Quote, Shop, Stock])
+
+    def store_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [query['sql'] for query in context.captured_queries
+                if query['sql'].startswith('SELECT') and 'FROM "store_' in query['sql']]
+
+    def assertNoSeqScan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN {sql}')
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        large_tables = {model._meta.db_table for model in self.large_models}
+        tables = [table for table in re.findall(r'Seq Scan on (\w+)', plan) if table in large_tables]
+        self.assertEqual(tables, [], f'{sql}\n{plan}')
+
+    def assertEndpointIndexed(self, url, params=None):
+        queries = self.store_queries(url, params)
+        self.assertTrue(queries)
+        for sql in queries:
+            self.assertNoSeqScan(sql)
+
+    def test_book_price_filter(self):
+        self.assertEndpointIndexed(reverse('book-list'), {'price': '250.00'})
+
+    def test_book_price_ordering(self):
+        response = self.client.get(reverse('book-list'), {'ordering': 'price', 'page_size': 50})
+        self.assertEndpointIndexed(response.data['next'])
+
+    def test_book_author_ordering(self):
+        self.assertEndpointIndexed(reverse('book-list'), {'ordering': 'author_name', 'page_size': 50})
+
+    def test_relation_lookup(self):
+        self.client.force_login(self.user_list[0])
+        self.assertEndpointIndexed(reverse('userbookrelation-detail', args=[self.book_list[-1].pk]))
+
+    def test_stock_shop_book_filter(self):
+        self.assertEndpointIndexed(reverse('stock-list'), {'shop': self.shop_list[0].pk,
+                                                           'book': self.book_list[100].pk})
+
+    def test_comments_by_book(self):
+        self.assertEndpointIndexed(reverse('comment-list'), {'book': self.book_list[42].pk,
+                                                             'ordering': '-datetime_created'})
@@ -0,0 +1,56 @@
+import inspect
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework import serializers
+
+from store import serializers as store_serializers
+from store.models import Book, UserBookRelation
+from store.queryguard import NPlusOneError
+from store.serializers import BookSerializer, QueryGuardListSerializer
+
+
+class ReaderCountSerializer(BookSerializer):
+    readers_count = serializers.SerializerMethodField()
+
+    class Meta(BookSerializer.Meta):
+        fields = ['id', 'readers_count']
+
+    def get_readers_count(self, instance):
+        return instance.readers.count()
+
+
+class QueryGuardTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.books = [Book.objects.create(name=f'Книга {index}', price=100, author_name='Автор') for index in range(3)]
+        UserBookRelation.objects.create(user=self.user, book=self.books[0], like=True)
+
+    def test_like_count_is_read_from_the_counter(self):
+        with self.assertNumQueries(1):
+            data = BookSerializer(Book.objects.with_rate().order_by('pk'), many=True).data
+        self.assertEqual([row['like_count'] for row in data], [1, 0, 0])
+
+    def test_query_per_item_raises(self):
+        with self.assertRaisesRegex(NPlusOneError, r'ReaderCountSerializer ran 3 queries for 3 items'):
+            ReaderCountSerializer(Book.objects.order_by('pk'), many=True).data
+        # A single item cannot tell a per-item query from a one-off one.
+        self.assertEqual(ReaderCountSerializer(Book.objects.filter(pk=self.books[0].pk), many=True).data,
+                         [{'id': self.books[0].pk, 'readers_count': 1}])
+
+    @override_settings(STORE_QUERY_GUARD='log')
+    def test_log_mode(self):
+        with self.assertLogs('store.queryguard', 'WARNING') as logs:
+            data = ReaderCountSerializer(Book.objects.order_by('pk'), many=True).data
+        self.assertEqual([row['readers_count'] for row in data], [1, 0, 0])
+        self.assertIn('N+1 queries: ReaderCountSerializer ran 3 queries', logs.output[0])
+
+    @override_settings(STORE_QUERY_GUARD='')
+    def test_off(self):
+        self.assertEqual(len(ReaderCountSerializer(Book.objects.all(), many=True).data), 3)
+
+    def test_every_store_serializer_is_guarded(self):
+        for name, serializer in inspect.getmembers(store_serializers, inspect.isclass):
+            if issubclass(serializer, serializers.ModelSerializer) and serializer.__module__ == 'store.serializers':
+                with self.subTest(name):
+                    self.assertTrue(issubclass(serializer.Meta.list_serializer_class, QueryGuardListSerializer))
@@ -0,0 +1,92 @@
+from io import StringIO
+
+import numpy as np
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book, BookSimilarity, UserBookRelation
+from store.recommendations import chunk_bounds, rebuild_recommendations
+
+
+def neighbours():
+    result = {}
+    for book_id, similar_id, score in BookSimilarity.objects.order_by('book', 'rank').values_list(
+            'book', 'similar', 'score'):
+        result.setdefault(book_id, []).append((similar_id, round(score, 4)))
+    return result
+
+
+class RecommendationTests(APITestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'reader{i}', password='testpassword') for i in range(3)]
+        self.book1 = Book.objects.create(name='Война и мир', price=500.00, author_name='Лев Толстой')
+        self.book2 = Book.objects.create(name='Анна Каренина', price=600.00, author_name='Лев Толстой')
+        self.book3 = Book.objects.create(name='Идиот', price=350.00, author_name='Фёдор Достоевский')
+        self.book4 = Book.objects.create(name='Бесы', price=400.00, author_name='Фёдор Достоевский')
+        first, second, third = self.users
+        for user, book, values in ((first, self.book1, {'like': True}), (first, self.book2, {'rate': 5}),
+                                   (second, self.book1, {'like': True}), (second, self.book2, {'like': True}),
+                                   (second, self.book3, {'rate': 5}), (third, self.book3, {'like': True}),
+                                   (third, self.book4, {'rate': 1, 'in_bookmarks': True})):
+            UserBookRelation.objects.create(user=user, book=book, **values)
+
+    def test_cosine_neighbours(self):
+        self.assertEqual(rebuild_recommendations(), 6)
+        # Book 4 only has a rate of 1, which carries no weight.
+        self.assertEqual(neighbours(), {
+            self.book1.pk: [(self.book2.pk, 1.0), (self.book3.pk, 0.5)],
+            self.book2.pk: [(self.book1.pk, 1.0), (self.book3.pk, 0.5)],
+            self.book3.pk: [(self.book1.pk, 0.5), (self.book2.pk, 0.5)],
+        })
+
+    def test_batches_and_top_k(self):
+        rebuild_recommendations(k=1, batch_size=1, chunk_size=1)
+        self.assertEqual(neighbours(), {
+            self.book1.pk: [(self.book2.pk, 1.0)],
+            self.book2.pk: [(self.book1.pk, 1.0)],
+            self.book3.pk: [(self.book1.pk, 0.5)],
+        })
+
+    def test_chunks_bounded_by_similarities(self):
+        self.assertEqual(list(chunk_bounds(np.array([5, 5, 50, 1, 1, 1]), max_rows=3, max_nnz=10)),
+                         [(0, 2), (2, 3), (3, 6)])
+        # Every book with readers reaches more than three interactions through them, each gets a chunk of its own.
+        self.assertEqual(rebuild_recommendations(max_nnz=3), 6)
+        self.assertEqual(neighbours()[self.book3.pk], [(self.book1.pk, 0.5), (self.book2.pk, 0.5)])
+
+    def test_rebuild_replaces_stale_neighbours(self):
+        rebuild_recommendations()
+        UserBookRelation.objects.filter(book=self.book3).delete()
+        UserBookRelation.objects.filter(user=self.users[0], book=self.book2).update(rate=3)
+        rebuild_recommendations()
+        self.assertEqual(neighbours(), {
+            self.book1.pk: [(self.book2.pk, 0.9487)],
+            self.book2.pk: [(self.book1.pk, 0.9487)],
+        })
+
+    def test_similar_endpoint(self):
+        rebuild_recommendations()
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('book-similar', args=[self.book1.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(row['id'], row['name'], row['score']) for row in response.data],
+                         [(self.book2.pk, 'Анна Каренина', 1.0), (self.book3.pk, 'Идиот', 0.5)])
+        self.assertEqual(response.data[0]['like_count'], 1)
+
+        response = self.client.get(reverse('book-similar', args=[self.book4.pk]))
+        self.assertEqual(response.data, [])
+        response = self.client.get(reverse('book-similar', args=[0]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        self.book2.delete()
+        response = self.client.get(reverse('book-similar', args=[self.book1.pk]))
+        self.assertEqual([row['id'] for row in response.data], [self.book3.pk])
+
+    def test_rebuild_command(self):
+        out = StringIO()
+        call_command('rebuild_recommendations', top_k=1, stdout=out)
+        self.assertIn('Rebuilt 3 book similarities', out.getvalue())
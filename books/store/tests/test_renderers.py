@@ -0,0 +1,88 @@
+import datetime
+import io
+import pickle
+from decimal import Decimal
+from unittest import mock, skipIf
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase
+from django.urls import reverse
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+
+from store import renderers
+from store.models import Book
+from store.renderers import FastJSONParser, FastJSONRenderer, JSONFragment
+
+PAYLOAD = {
+    'results': ReturnList([ReturnDict({'id': 1, 'price': '100.00', 'rate': Decimal('4.50'), 'name': 'Война и мир'},
+                                      serializer=None)], serializer=None),
+    'created': datetime.datetime(2024, 6, 29, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+    'moscow': datetime.datetime(2024, 6, 29, 15, 30, tzinfo=datetime.timezone(datetime.timedelta(hours=3))),
+    'day': datetime.date(2024, 6, 29),
+    'separators': 'a\u2028b\u2029c',
+    'nested': {1: [None, True, 2.5, '"quoted"\n']},
+}
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    def test_same_bytes_as_the_drf_renderer(self):
+        expected = JSONRenderer().render(PAYLOAD)
+        self.assertEqual(FastJSONRenderer().render(PAYLOAD), expected)
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(FastJSONRenderer().render(PAYLOAD), expected)
+        self.assertEqual(FastJSONRenderer().render(PAYLOAD, 'application/json; indent=4'),
+                         JSONRenderer().render(PAYLOAD, 'application/json; indent=4'))
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_falls_back_for_data_orjson_cannot_encode(self):
+        data = {'id': 2 ** 70, 'name': 'Война и мир'}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        with self.assertRaises(ValueError):
+            JSONRenderer().render({'rate': float('nan')})
+        if renderers.orjson is not None:
+            # Non-finite floats are null instead of an error.
+            self.assertEqual(FastJSONRenderer().render({'rate': float('nan')}), b'{"rate":null}')
+
+    def test_fragments_are_spliced_as_is(self):
+        data = {'results': [JSONFragment(b'{"id":1,"name":"\\u0000"}'), {'id': 2}, JSONFragment(b'[1, 2]')],
+                'text': '\x00 not a placeholder'}
+        expected = b'{"results":[{"id":1,"name":"\\u0000"},{"id":2},[1, 2]],"text":"\\u0000 not a placeholder"}'
+        self.assertEqual(FastJSONRenderer().render(data), expected)
+        with mock.patch.object(renderers, 'OrjsonFragment', None):
+            self.assertEqual(FastJSONRenderer().render(data), expected)
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(FastJSONRenderer().render(data), expected)
+        # Falling back to the standard library for data orjson cannot encode keeps the fragments.
+        self.assertEqual(FastJSONRenderer().render([2 ** 70, JSONFragment(b'{"id":1}')]),
+                         f'[{2 ** 70},{{"id":1}}]'.encode())
+
+    def test_fragment_reads_as_a_mapping(self):
+        fragment = JSONFragment(b'{"id":1,"name":"\xd0\x98\xd0\xb4\xd0\xb8\xd0\xbe\xd1\x82"}')
+        self.assertEqual(fragment, {'id': 1, 'name': 'Идиот'})
+        self.assertEqual((fragment['name'], list(fragment), len(fragment)), ('Идиот', ['id', 'name'], 2))
+        self.assertEqual(pickle.loads(pickle.dumps(fragment)).value, fragment.value)
+
+    def test_parser(self):
+        body = '{"name": "Война и мир", "price": "500.00", "rows": [1, 2.5, null]}'.encode()
+        expected = {'name': 'Война и мир', 'price': '500.00', 'rows': [1, 2.5, None]}
+        self.assertEqual(FastJSONParser().parse(io.BytesIO(body)), expected)
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(FastJSONParser().parse(io.BytesIO(body)), expected)
+        for invalid in (b'{"name": ', b'[NaN]', b''):
+            with self.subTest(invalid), self.assertRaises(ParseError):
+                FastJSONParser().parse(io.BytesIO(invalid))
+
+
+@skipIf(renderers.orjson is None, 'orjson is not installed')
+class FastJSONEndpointTests(APITestCase):
+    def test_book_endpoints(self):
+        book = Book.objects.create(name='Война и мир', price=500, author_name='Лев Толстой')
+        response = self.client.get(reverse('book-detail', args=[book.pk]))
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+        self.client.force_login(User.objects.create_user(username='testuser', password='testpassword'))
+        response = self.client.post(reverse('book-list'), b'{"name": ', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.data['detail'].startswith('JSON parse error'))
@@ -107,6 +107,7 @@ class CommentSerializerTestCase(TransactionTestCase):
         expected_data = {
             'id': comment.id,
             'user': self.user.id,
+            'username': 'testcase_user',
             'book': self.book.id,
             'text': 'Great book!',
             'datetime_created': '2024-06-29T00:00:00Z'
@@ -119,6 +120,7 @@ class CommentSerializerTestCase(TransactionTestCase):
         expected_data = {
             'id': comment.id,
             'user': self.user.id,
+            'username': 'testcase_user',
             'book': self.book.id,
             'text': '',
             'datetime_created': comment.datetime_created.astimezone(timezone.utc).isoformat().replace('+00:00', 'Z')
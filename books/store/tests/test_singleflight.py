@@ -0,0 +1,163 @@
+import asyncio
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from store.models import Book, UserBookRelation
+from store.singleflight import SingleFlight
+from store.views import BookViewSet, book_object_cache, response_flight
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out')
+        time.sleep(0.005)
+
+
+class SingleFlightTests(SimpleTestCase):
+    def run_threads(self, flight, count, compute):
+        results = []
+
+        def call():
+            try:
+                results.append(flight.do('key', compute))
+            except Exception as exc:
+                results.append(exc)
+
+        threads = [threading.Thread(target=call) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_threads_share_one_call(self):
+        flight, calls = SingleFlight(), []
+
+        def compute():
+            calls.append(1)
+            wait_for(lambda: flight.stats()['followers'] == 7)
+            return 'data'
+
+        results = self.run_threads(flight, 8, compute)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [('data', False)] + [('data', True)] * 7)
+        self.assertEqual(flight.stats(), {'leaders': 1, 'followers': 7, 'in_flight': 0})
+
+        # Finished calls are not reused.
+        self.assertEqual(flight.do('key', lambda: 'again'), ('again', False))
+
+    def test_exception_is_shared(self):
+        flight = SingleFlight()
+
+        def compute():
+            wait_for(lambda: flight.stats()['followers'] == 3)
+            raise ValueError('failed')
+
+        results = self.run_threads(flight, 4, compute)
+        self.assertEqual([type(result) for result in results], [ValueError] * 4)
+        self.assertEqual(flight.stats()['in_flight'], 0)
+
+    def test_tasks_share_one_call(self):
+        flight, calls = SingleFlight(), []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'data'
+
+        async def main():
+            return await asyncio.gather(*(flight.ado('key', compute) for _ in range(5)))
+
+        results = asyncio.run(main())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [('data', False)] + [('data', True)] * 4)
+
+    def test_cancelled_leader_hands_over(self):
+        flight, calls = SingleFlight(), []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return len(calls)
+
+        async def main():
+            leader = asyncio.create_task(flight.ado('key', compute))
+            await asyncio.sleep(0)
+            follower = asyncio.create_task(flight.ado('key', compute))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await follower
+
+        # The follower computes again instead of failing with the leader.
+        self.assertEqual(asyncio.run(main()), (2, False))
+
+
+class CoalescedBookListTests(TransactionTestCase):
+    requests = 8
+
+    def setUp(self):
+        cache.clear()
+        book_object_cache.clear_local()
+        owner = User.objects.create_user(username='owner', password='testpassword')
+        for i in range(5):
+            book = Book.objects.create(name=f'Книга {i}', price=100 + i, author_name='Автор', owner=owner)
+            UserBookRelation.objects.create(user=owner, book=book, like=True, rate=4)
+        # Fills the change markers, another URL so the response itself is not cached.
+        APIClient().get(reverse('book-list'), {'page_size': 1})
+        response_flight.reset_stats()
+
+    def test_concurrent_requests_run_one_query(self):
+        serialize_list = BookViewSet.serialize_list
+        barrier = threading.Barrier(self.requests)
+        results = []
+
+        def slow_serialize_list(view, *args):
+            # The leader waits until every other request has joined its call.
+            wait_for(lambda: response_flight.stats()['followers'] == self.requests - 1)
+            return serialize_list(view, *args)
+
+        def get():
+            try:
+                client = APIClient()
+                barrier.wait()
+                with CaptureQueriesContext(connection) as queries:
+                    response = client.get(reverse('book-list'))
+                book_queries = [query for query in queries if 'FROM "store_book"' in query['sql']]
+                results.append((response, len(book_queries)))
+            finally:
+                connection.close()
+
+        with mock.patch.object(BookViewSet, 'serialize_list', slow_serialize_list):
+            threads = [threading.Thread(target=get) for _ in range(self.requests)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(results), self.requests)
+        self.assertEqual(sorted(response['X-Cache'] for response, _ in results),
+                         ['COALESCED'] * (self.requests - 1) + ['MISS'])
+        self.assertEqual({response.status_code for response, _ in results}, {200})
+        self.assertEqual(len({response.content for response, _ in results}), 1)
+        leader_queries = [count for response, count in results if response['X-Cache'] == 'MISS']
+        self.assertGreater(leader_queries[0], 0)
+        self.assertEqual(sum(count for _, count in results), leader_queries[0])
+        self.assertEqual(response_flight.stats(), {'leaders': 1, 'followers': self.requests - 1, 'in_flight': 0})
+
+
+@override_settings(TESTING=False, DEBUG=False)
+class CoalescedWithoutSharedGenerationsTests(CoalescedBookListTests):
+    """
+    With process-local generation counters nothing is cached, identical misses are still coalesced.
+    """
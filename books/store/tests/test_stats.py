@@ -0,0 +1,133 @@
+import threading
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from books.stats import Histogram, RequestStats, request_stats
+from store.models import Book
+from store.views import book_response_cache
+
+
+class HistogramTests(SimpleTestCase):
+    def test_percentiles_within_bucket_error(self):
+        histogram = Histogram()
+        for value in range(1, 1001):
+            histogram.record(value)
+        self.assertEqual(histogram.count, 1000)
+        self.assertAlmostEqual(histogram.percentile(50), 500, delta=50)
+        self.assertAlmostEqual(histogram.percentile(99), 990, delta=99)
+        self.assertEqual(histogram.percentile(100), 1000)
+
+    def test_zeros_and_empty(self):
+        histogram = Histogram()
+        self.assertIsNone(histogram.percentile(50))
+        histogram.record(0)
+        histogram.record(0)
+        histogram.record(7)
+        self.assertEqual(histogram.percentile(50), 0)
+        self.assertEqual(histogram.percentile(99), 7)
+
+    def test_since(self):
+        histogram = Histogram()
+        for value in (1, 2, 0):
+            histogram.record(value)
+        earlier = Histogram().merge(histogram)
+        for value in (100, 100, 0):
+            histogram.record(value)
+        window = histogram.since(earlier)
+        self.assertEqual((window.count, window.zeros), (3, 1))
+        self.assertAlmostEqual(window.percentile(95), 100, delta=10)
+        # After a reset, everything recorded is new.
+        self.assertEqual(Histogram().since(earlier).count, 0)
+        self.assertEqual(earlier.since(histogram).count, 3)
+
+    def test_threads_record_into_own_shards(self):
+        stats = RequestStats()
+
+        def worker():
+            for _ in range(1000):
+                stats.record('BookViewSet.list', wall_ms=1.5, queries=2)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        snapshot = stats.snapshot()['BookViewSet.list']
+        self.assertEqual(snapshot['count'], 8000)
+        self.assertEqual(snapshot['queries']['p50'], 2)
+        self.assertIsNone(snapshot['size_bytes']['p50'])
+
+        # The shards of the finished threads are retired, their values kept.
+        self.assertEqual(stats.shard_count(), 0)
+        stats.record('BookViewSet.list', wall_ms=1.5)
+        self.assertEqual(stats.shard_count(), 1)
+        self.assertEqual(stats.snapshot()['BookViewSet.list']['count'], 8001)
+        stats.reset()
+        self.assertEqual(stats.snapshot(), {})
+
+
+class RequestStatsMiddlewareTests(APITestCase):
+    def setUp(self):
+        request_stats.reset()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.staff_user = User.objects.create_user(username='staffuser', password='staffpassword', is_staff=True)
+        Book.objects.create(name='Война и мир', price=500.00, author_name='Лев Толстой', owner=self.user)
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('book-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries"$')
+
+    async def test_async_views_count_their_queries(self):
+        # The ORM calls of async views run on other threads.
+        response = await self.async_client.get(reverse('async-book-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        queries = int(response['Server-Timing'].split('desc="')[1].split()[0])
+        self.assertGreater(queries, 0)
+        self.assertEqual(request_stats.merged('async-book-list')['queries'].max, queries)
+
+    def test_stats_per_action(self):
+        self.client.get(reverse('book-list'))
+        self.client.get(reverse('book-list'))
+        self.client.get(reverse('book-detail', args=[Book.objects.get().pk]))
+        self.client.force_login(self.staff_user)
+        response = self.client.get('/stats/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        requests = response.data['requests']
+        self.assertEqual(requests['BookViewSet.list']['count'], 2)
+        self.assertEqual(requests['BookViewSet.retrieve']['count'], 1)
+        self.assertGreater(requests['BookViewSet.list']['queries']['max'], 0)
+        self.assertGreater(requests['BookViewSet.list']['size_bytes']['max'], 0)
+
+        response = self.client.delete('/stats/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertNotIn('BookViewSet.list', request_stats.snapshot())
+
+    def test_component_stats(self):
+        cache.clear()
+        book_response_cache.reset_stats()
+        self.client.get(reverse('book-list'))
+        self.client.get(reverse('book-list'))
+        self.client.force_login(self.staff_user)
+        components = self.client.get('/stats/').data['components']
+        self.assertEqual(components['response_cache:book'], {'hits': 1, 'misses': 1})
+        self.assertEqual(set(components['response_flight']), {'leaders', 'followers', 'in_flight'})
+        self.assertIn('local_bytes', components['object_cache:book'])
+        if settings.DATABASES['default']['ENGINE'] == 'books.postgresql_pool':
+            self.assertGreater(sum(pool['opened'] for pool in components['db_pools']), 0)
+
+        self.client.delete('/stats/')
+        self.assertEqual(book_response_cache.stats(), {'hits': 0, 'misses': 0})
+
+    def test_stats_admin_only(self):
+        response = self.client.get('/stats/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_login(self.user)
+        response = self.client.get('/stats/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,110 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.settings import api_settings
+from rest_framework.test import APITestCase
+
+from books.stats import request_stats
+from store.models import Book
+from store.throttling import CacheBucketStore, LocalBucketStore, load_shedder, local_buckets, take_token
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_burst_then_refill(self):
+        state = None
+        for _ in range(3):
+            wait, state = take_token(state, 100.0, rate=0.5, capacity=3)
+            self.assertEqual(wait, 0)
+        wait, state = take_token(state, 100.0, rate=0.5, capacity=3)
+        self.assertEqual(wait, 2)
+        # One token back after two seconds, never more than the capacity.
+        self.assertEqual(take_token(state, 102.0, rate=0.5, capacity=3)[0], 0)
+        self.assertEqual(take_token(state, 1000.0, rate=0.5, capacity=3)[1], (2, 1000.0))
+
+    @override_settings(STORE_THROTTLE_LOCAL_KEYS=2)
+    def test_local_store_keeps_recent_keys(self):
+        store = LocalBucketStore()
+        store.consume('a', 1, 1)
+        store.consume('b', 1, 1)
+        store.consume('c', 1, 1)
+        self.assertEqual(list(store.buckets), ['b', 'c'])
+
+    def test_cache_store_shared_between_instances(self):
+        cache.clear()
+        self.assertEqual(CacheBucketStore('default').consume('key', 1 / 60, 1), 0)
+        self.assertAlmostEqual(CacheBucketStore('default').consume('key', 1 / 60, 1), 60, delta=1)
+
+
+class WriteThrottleTests(APITestCase):
+    def setUp(self):
+        local_buckets.clear()
+        self.user1 = User.objects.create_user(username='reader1', password='testpassword')
+        self.user2 = User.objects.create_user(username='reader2', password='testpassword')
+        self.book = Book.objects.create(name='Война и мир', price=500.00, author_name='Лев Толстой')
+
+    def comment(self, user):
+        self.client.force_authenticate(user)
+        return self.client.post(reverse('comment-list'), {'user': user.pk, 'book': self.book.pk, 'text': 'Спам'},
+                                format='json')
+
+    @mock.patch.dict(api_settings.DEFAULT_THROTTLE_RATES, {'comment': '2/min'})
+    def test_comments_limited_per_user(self):
+        self.assertEqual(self.comment(self.user1).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.comment(self.user1).status_code, status.HTTP_201_CREATED)
+        # The decision needs no query of its own.
+        with self.assertNumQueries(0):
+            response = self.comment(self.user1)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '30')
+
+        self.assertEqual(self.comment(self.user2).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.client.get(reverse('comment-list')).status_code, status.HTTP_200_OK)
+
+    @mock.patch.dict(api_settings.DEFAULT_THROTTLE_RATES, {'relation': '1/min'})
+    @override_settings(STORE_THROTTLE_STORE='default')
+    def test_relations_limited_in_shared_cache(self):
+        cache.clear()
+        self.client.force_authenticate(self.user1)
+        url = reverse('userbookrelation-detail', args=[self.book.pk])
+        self.assertEqual(self.client.patch(url, {'like': True}, format='json').status_code, status.HTTP_200_OK)
+        response = self.client.patch(url, {'like': False}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(local_buckets.buckets, {})
+
+
+@override_settings(STORE_SHED_SQL_P95_MS=50, STORE_SHED_INTERVAL=0, STORE_SHED_MIN_SAMPLES=5)
+class LoadSheddingTests(APITestCase):
+    def setUp(self):
+        request_stats.reset()
+        load_shedder.reset()
+        self.user = User.objects.create_user(username='reader', password='testpassword')
+        self.book = Book.objects.create(name='Война и мир', price=500.00, author_name='Лев Толстой')
+        self.client.force_authenticate(self.user)
+        self.url = reverse('userbookrelation-detail', args=[self.book.pk])
+
+    def tearDown(self):
+        request_stats.reset()
+        load_shedder.reset()
+
+    def record(self, sql_ms, count=10):
+        for _ in range(count):
+            request_stats.record('BookViewSet.list', sql_ms=sql_ms)
+
+    def test_sheds_writes_while_database_is_slow(self):
+        self.record(200)
+        response = self.client.patch(self.url, {'like': True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '5')
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+        # Only the latest window counts.
+        self.record(1)
+        self.assertEqual(self.client.patch(self.url, {'like': True}, format='json').status_code, status.HTTP_200_OK)
+
+    def test_too_few_samples(self):
+        self.record(200, count=4)
+        self.assertEqual(self.client.patch(self.url, {'like': True}, format='json').status_code, status.HTTP_200_OK)
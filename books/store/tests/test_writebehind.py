@@ -0,0 +1,148 @@
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book, UserBookRelation
+from store.writebehind import relation_buffer
+
+
+@override_settings(STORE_RELATION_WRITE_BEHIND=True, STORE_RELATION_FLUSH_INTERVAL=0)
+class WriteBehindTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.user2 = User.objects.create_user(username='testuser2', password='testpassword2')
+        self.book1 = Book.objects.create(name='Война и мир', price=500.00, author_name='Лев Толстой')
+        self.book2 = Book.objects.create(name='Идиот', price=350.00, author_name='Фёдор Достоевский')
+        self.addCleanup(relation_buffer.pending.clear)
+        self.addCleanup(relation_buffer.versions.clear)
+        self.client.force_login(self.user)
+
+    def patch(self, book, data):
+        return self.client.patch(reverse('userbookrelation-detail', args=[book.pk]), data, format='json')
+
+    def test_changes_are_queued_and_coalesced(self):
+        response = self.patch(self.book1, {'like': True})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.patch(self.book1, {'rate': 3})
+        response = self.patch(self.book1, {'rate': 5, 'like': False})
+        self.assertEqual(response.data, {'user': self.user.pk, 'book': self.book1.pk, 'like': False, 'rate': 5})
+        self.assertFalse(UserBookRelation.objects.exists())
+        self.assertEqual(len(relation_buffer.pending), 1)
+
+        self.assertEqual(relation_buffer.flush(), 1)
+        relation = UserBookRelation.objects.get()
+        self.assertEqual((relation.user, relation.book, relation.like, relation.rate), (self.user, self.book1, False, 5))
+        self.book1.refresh_from_db()
+        self.assertEqual((self.book1.rating_sum, self.book1.rating_count, self.book1.likes_count), (5, 1, 0))
+
+    def test_reads_see_pending_changes(self):
+        UserBookRelation.objects.create(user=self.user, book=self.book1, rate=2)
+        self.patch(self.book1, {'like': True})
+        response = self.client.get(reverse('userbookrelation-detail', args=[self.book1.pk]))
+        self.assertEqual((response.data['like'], response.data['rate']), (True, 2))
+        response = self.client.get(reverse('userbookrelation-list'))
+        self.assertEqual([(row['book'], row['like']) for row in response.data['results']], [(self.book1.pk, True)])
+
+    def test_queued_changes_move_the_etag(self):
+        url = reverse('userbookrelation-detail', args=[self.book1.pk])
+        etag = self.client.get(url)['ETag']
+        self.patch(self.book1, {'like': True})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['like'])
+        self.assertNotIn('Last-Modified', response)
+        pending_etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=pending_etag).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+
+        relation_buffer.flush()
+        self.assertIsNone(relation_buffer.version(self.user.pk))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=pending_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['like'])
+
+    def test_flush_counts_concurrently_created_rows_once(self):
+        self.patch(self.book1, {'like': True, 'rate': 4})
+        # Another process creates the relation after the flush looked for it.
+        lock_relations = relation_buffer.lock_relations
+        calls = []
+
+        def racing_lock_relations(keys):
+            relations = lock_relations(keys)
+            if not calls:
+                UserBookRelation.objects.create(user=self.user, book=self.book1, like=True, rate=2)
+            calls.append(keys)
+            return relations
+
+        with mock.patch.object(relation_buffer, 'lock_relations', racing_lock_relations):
+            self.assertEqual(relation_buffer.flush(), 1)
+        self.book1.refresh_from_db()
+        self.assertEqual((self.book1.rating_sum, self.book1.rating_count, self.book1.likes_count), (4, 1, 1))
+        self.assertEqual(UserBookRelation.objects.get().rate, 4)
+
+    def test_flush_updates_existing_rows_and_counters(self):
+        UserBookRelation.objects.create(user=self.user, book=self.book1, like=True, rate=2)
+        self.patch(self.book1, {'like': False, 'rate': 4})
+        self.patch(self.book2, {'like': True})
+        self.client.force_login(self.user2)
+        self.patch(self.book1, {'like': True, 'in_bookmarks': True})
+        self.assertEqual(relation_buffer.flush(), 3)
+        self.assertEqual(UserBookRelation.objects.count(), 3)
+        self.assertTrue(UserBookRelation.objects.get(user=self.user2, book=self.book1).in_bookmarks)
+        self.book1.refresh_from_db()
+        self.assertEqual((self.book1.rating_sum, self.book1.rating_count, self.book1.likes_count), (4, 1, 1))
+        self.assertEqual(relation_buffer.flush(), 0)
+
+    @override_settings(STORE_RELATION_FLUSH_SIZE=2)
+    def test_size_threshold_flushes(self):
+        self.patch(self.book1, {'like': True})
+        self.assertFalse(UserBookRelation.objects.exists())
+        self.patch(self.book2, {'like': True})
+        self.assertEqual(UserBookRelation.objects.count(), 2)
+        self.assertEqual(relation_buffer.pending, {})
+
+    def test_changes_of_deleted_books_are_dropped(self):
+        self.patch(self.book1, {'like': True})
+        self.patch(self.book2, {'like': True})
+        self.book2.delete()
+        with self.assertLogs('store.writebehind', 'WARNING'):
+            self.assertEqual(relation_buffer.flush(), 2)
+        self.assertEqual(list(UserBookRelation.objects.values_list('book', flat=True)), [self.book1.pk])
+
+    def test_validation_and_unknown_book(self):
+        response = self.patch(self.book1, {'rate': 9})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(reverse('userbookrelation-detail', args=[0]), {'like': True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(relation_buffer.pending, {})
+
+    def test_delete_and_bulk_supersede_pending_changes(self):
+        self.patch(self.book1, {'like': True})
+        self.client.delete(reverse('userbookrelation-detail', args=[self.book1.pk]))
+        self.patch(self.book2, {'rate': 1})
+        response = self.client.post(reverse('userbookrelation-bulk'), [{'book': self.book2.pk, 'rate': 5}],
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(relation_buffer.pending, {})
+
+
+@override_settings(STORE_RELATION_WRITE_BEHIND=True, STORE_RELATION_FLUSH_INTERVAL=0.05)
+class WriteBehindTimerTests(TransactionTestCase):
+    def test_timer_flushes_in_background(self):
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        book = Book.objects.create(name='Война и мир', price=500.00, author_name='Лев Толстой')
+        self.addCleanup(relation_buffer.stop)
+        self.client.force_login(user)
+        response = self.client.patch(reverse('userbookrelation-detail', args=[book.pk]), {'like': True},
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        deadline = time.monotonic() + 5
+        # Polls the buffer, not the table: SQLite fails reads of a table another connection is writing.
+        while relation_buffer.version(user.pk) is not None and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertTrue(UserBookRelation.objects.get(user=user, book=book).like)
@@ -0,0 +1,191 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from books.stats import request_stats
+
+
+def parse_rate(rate):
+    """
+    Returns (requests, seconds) of a DRF rate such as '20/min'.
+    """
+    num_requests, period = rate.split('/')
+    return int(num_requests), {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+
+
+def take_token(state, now, rate, capacity):
+    """
+    Token bucket step: `state` is (tokens, time of the last update) or None for a full bucket,
+    refilled at `rate` tokens per second up to `capacity`. Returns the seconds to wait for a
+    token (0 when one was taken) and the new state.
+    """
+    tokens, updated = state if state is not None else (capacity, now)
+    tokens = min(capacity, tokens + max(now - updated, 0) * rate)
+    if tokens >= 1:
+        return 0, (tokens - 1, now)
+    return (1 - tokens) / rate, (tokens, now)
+
+
+class LocalBucketStore:
+    """
+    Token buckets of this process, the least recently used dropped beyond STORE_THROTTLE_LOCAL_KEYS
+    (a dropped bucket starts full again). Each process admits the full rate.
+    """
+
+    def __init__(self):
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def consume(self, key, rate, capacity):
+        now = time.monotonic()
+        with self.lock:
+            wait, self.buckets[key] = take_token(self.buckets.get(key), now, rate, capacity)
+            self.buckets.move_to_end(key)
+            if len(self.buckets) > getattr(settings, 'STORE_THROTTLE_LOCAL_KEYS', 100000):
+                self.buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class CacheBucketStore:
+    """
+    Token buckets in a shared cache, so the rate holds across processes: one get and one set per
+    decision. Not atomic, requests of the same user racing in two processes may both get the
+    last token.
+    """
+
+    def __init__(self, cache_alias):
+        self.cache_alias = cache_alias
+
+    def consume(self, key, rate, capacity):
+        cache = caches[self.cache_alias]
+        wait, state = take_token(cache.get(key), time.time(), rate, capacity)
+        # Expires once the bucket would be full again, absent means full.
+        cache.set(key, state, math.ceil((capacity - state[0]) / rate) + 1)
+        return wait
+
+
+local_buckets = LocalBucketStore()
+
+
+def get_bucket_store():
+    """
+    STORE_THROTTLE_STORE: 'local' for buckets per process, or the alias of the cache sharing them.
+    """
+    alias = getattr(settings, 'STORE_THROTTLE_STORE', 'local')
+    return local_buckets if alias == 'local' else CacheBucketStore(alias)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttles the writes of each user (or client address) per endpoint with a token bucket:
+    the view's `throttle_scope` rate of DEFAULT_THROTTLE_RATES ('20/min') refills the bucket,
+    whose capacity (the burst) is the number of requests of the rate. Reads are not throttled.
+    """
+
+    def __init__(self):
+        self.wait_time = None
+
+    def allow_request(self, request, view):
+        if request.method in SAFE_METHODS:
+            return True
+        scope = getattr(view, 'throttle_scope', None)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        if rate is None:
+            return True
+        num_requests, duration = parse_rate(rate)
+        ident = request.user.pk if request.user.is_authenticated else self.get_ident(request)
+        self.wait_time = get_bucket_store().consume(f'store:throttle:{scope}:{ident}',
+                                                    num_requests / duration, num_requests)
+        return self.wait_time == 0
+
+    def wait(self):
+        return self.wait_time
+
+
+class Overloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The database is overloaded, try again later.'
+    default_code = 'overloaded'
+
+    def __init__(self, wait):
+        super().__init__()
+        # Sent as Retry-After by the exception handler.
+        self.wait = wait
+
+
+class LoadShedder:
+    """
+    Decides whether the database is overloaded: the p95 SQL time of the requests that queried,
+    as recorded by RequestStatsMiddleware over the last STORE_SHED_INTERVAL seconds, is above
+    STORE_SHED_SQL_P95_MS (0 switches shedding off). Re-evaluated at most once an interval by
+    one thread, other requests read the last decision; windows with fewer than
+    STORE_SHED_MIN_SAMPLES requests count as not overloaded.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked = None
+        self.previous = None
+        self.overloaded = False
+        self.p95 = None
+
+    def is_overloaded(self):
+        if not getattr(settings, 'STORE_SHED_SQL_P95_MS', 0):
+            return False
+        now = time.monotonic()
+        if (self.checked is None or now - self.checked >= getattr(settings, 'STORE_SHED_INTERVAL', 1.0)) \
+                and self.lock.acquire(blocking=False):
+            try:
+                self.refresh(now)
+            finally:
+                self.lock.release()
+        return self.overloaded
+
+    def refresh(self, now):
+        self.checked = now
+        current = request_stats.merged('*')['sql_ms']
+        window = current.since(self.previous)
+        # Requests without queries record 0 ms, they say nothing about the database.
+        window.count -= window.zeros
+        window.zeros = 0
+        if window.count < getattr(settings, 'STORE_SHED_MIN_SAMPLES', 20):
+            # Too few requests to judge, the window grows until the next check.
+            self.overloaded = False
+            return
+        self.p95 = window.percentile(95)
+        self.overloaded = self.p95 > settings.STORE_SHED_SQL_P95_MS
+        self.previous = current
+
+    def reset(self):
+        with self.lock:
+            self.checked = self.previous = self.p95 = None
+            self.overloaded = False
+
+
+load_shedder = LoadShedder()
+
+
+class LoadShedThrottle(BaseThrottle):
+    """
+    Rejects the writes of the view with 503 and Retry-After (STORE_SHED_RETRY_AFTER seconds)
+    while load_shedder finds the database overloaded. For low-priority writes, list it before
+    the other throttles so shed requests do not use up their tokens.
+    """
+
+    def allow_request(self, request, view):
+        if request.method not in SAFE_METHODS and load_shedder.is_overloaded():
+            raise Overloaded(getattr(settings, 'STORE_SHED_RETRY_AFTER', 5))
+        return True
@@ -1,39 +1,448 @@
-from django.db.models import Avg, Count, Case, When
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import render
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
-from rest_framework.viewsets import ModelViewSet
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+from rest_framework.filters import OrderingFilter
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet, ViewSet
 
-from store.models import Book, Stock, Shop, Quote, Comment, UserBookRelation
+from books.stats import register_stats
+from store.cache import GenerationCache, generations_shared, get_generations, get_last_modified
+from store.checkout import EmptyCart, OutOfStock, checkout
+from store.export import csv_lines, ndjson_lines
+from store.fastpath import CompiledSerializer
+from store.leaderboard import leaderboard
+from store.objectcache import ObjectCache
+from store.models import Book, Stock, Shop, Quote, Comment, UserBookRelation, Cart, Order, ShopInventory, \
+    BookInventory, BookSimilarity
 from store.permissions import IsOwnerOrStaffOrReadOnly
+from store.renderers import encode_json
+from store.search import BookSearchFilter
 from store.serializers import BookSerializer, UserBookRelationSerializer, CommentSerializer, QuoteSerializer, \
-    StockSerializer, ShopSerializer
+    StockSerializer, ShopSerializer, OrderSerializer, ShopInventorySerializer, BookInventorySerializer, \
+    SimilarBookSerializer, RankedBookSerializer
+from store.signals import bulk_saved
+from store.singleflight import SingleFlight
+from store.throttling import LoadShedThrottle, TokenBucketThrottle
+from store.writebehind import RELATION_FIELDS, relation_buffer
 
 
 def oauth(request):
     return render(request, 'oauth.html')
 
 
-class OwnerStaffReadOnlyModelViewSet(ModelViewSet):
+class NotModified(Exception):
+    pass
+
+
+class ConditionalGetMixin:
+    """
+    Adds ETag and Last-Modified to list and retrieve responses and answers 304 to a
+    matching If-None-Match / If-Modified-Since before the handler runs.
+    The validators come from the generation counters of `change_markers`, not from
+    the rendered body, so a 304 costs no list query and no serialization. Without
+    shared counters (see generations_shared) no validators are sent.
+    """
+    change_markers = None
+
+    def get_change_markers(self):
+        return self.change_markers or [self.get_queryset().model]
+
+    def get_validators(self, request):
+        markers = self.get_change_markers()
+        params = sorted((key, sorted(values)) for key, values in request.query_params.lists())
+        version = repr((request.path, params, request.user.pk, get_generations(markers)))
+        etag = f'W/"{hashlib.md5(version.encode()).hexdigest()}"'
+        last_modified = get_last_modified(markers)
+        return etag, int(last_modified) if last_modified is not None else None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.validators = None
+        if request.method in ('GET', 'HEAD') and self.action in ('list', 'retrieve') and generations_shared():
+            self.validators = etag, last_modified = self.get_validators(request)
+            if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+            if if_none_match is not None:
+                tags = {tag.removeprefix('W/') for tag in parse_etags(if_none_match)}
+                if '*' in tags or etag.removeprefix('W/') in tags:
+                    raise NotModified
+            elif last_modified is not None:
+                if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+                if if_modified_since is not None and last_modified <= if_modified_since:
+                    raise NotModified
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED)
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        validators = getattr(self, 'validators', None)
+        if validators and response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            etag, last_modified = validators
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class OwnerStaffReadOnlyModelViewSet(ConditionalGetMixin, ModelViewSet):
     permission_classes = [IsOwnerOrStaffOrReadOnly]
 
 
+# Misses of the response caches in flight in this process, see CachedResponseMixin.
+response_flight = SingleFlight()
+
+
+class CachedResponseMixin:
+    """
+    Serves list and retrieve responses from `response_cache` (a GenerationCache),
+    keyed on the request URL and query params. Identical requests missing the cache at
+    the same time are computed once (response_flight): the others get the same data,
+    marked X-Cache: COALESCED. Without shared generation counters (see generations_shared)
+    responses are only coalesced, not cached.
+    """
+    response_cache = None
+
+    def get_response_cache(self):
+        return self.response_cache
+
+    def cached_response(self, name, compute):
+        response_cache = self.get_response_cache()
+        cacheable = generations_shared()
+        if cacheable:
+            key = response_cache.make_key(name, self.request)
+            data = response_cache.get(key)
+            if data is not None:
+                response = Response(data)
+                response['X-Cache'] = 'HIT'
+                return response
+        else:
+            # Coalescing stays within the process, it needs no shared generations.
+            key = response_cache.build_key(name, self.request, ())
+
+        def compute_and_cache():
+            response = compute()
+            if cacheable and response.status_code == status.HTTP_200_OK:
+                response_cache.set(key, response.data)
+            return response
+
+        response, shared = response_flight.do(key, compute_and_cache)
+        if shared:
+            # The leader's Response is rendered by its own request.
+            response = Response(response.data, status=response.status_code)
+        response['X-Cache'] = 'COALESCED' if shared else 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response('list', lambda: super(CachedResponseMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response('detail',
+                                    lambda: super(CachedResponseMixin, self).retrieve(request, *args, **kwargs))
+
+
+class CompiledListMixin:
+    """
+    Serves list through store.fastpath: the page is read with values_list() and turned into
+    dicts by a CompiledSerializer, with the output of the serializer but without its per-field
+    machinery. Serializers with fields it cannot compile are used as usual.
+    """
+
+    def list(self, request, *args, **kwargs):
+        data, paginated = self.serialize_list(self.filter_queryset(self.get_queryset()), self.get_serializer())
+        return self.get_paginated_response(data) if paginated else Response(data)
+
+    def serialize_list(self, queryset, serializer):
+        """
+        Paginates `queryset` and serializes the page (or everything, without pagination) with
+        `serializer`, a single-object instance. Returns the data and whether it was paginated.
+        """
+        compiled = CompiledSerializer.compile(serializer, queryset)
+        if compiled is not None:
+            # The keyset paginator reads its cursor from the ordering columns of the rows.
+            get_ordering = getattr(self.paginator, 'get_ordering', None)
+            ordering = get_ordering(queryset, self) if get_ordering is not None else []
+            queryset = compiled.values(queryset, [field.lstrip('-') for field in ordering])
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else queryset
+        if compiled is not None:
+            return compiled.to_representation(rows), page is not None
+        return type(serializer)(rows, many=True, context=serializer.context).data, page is not None
+
+
+class BulkModelMixin:
+    """
+    Adds /<prefix>/bulk/ taking a list of rows: POST creates them, PUT/PATCH updates
+    the objects matched on `bulk_lookup_field`, DELETE deletes them. Rows are validated
+    with a many=True serializer and written with bulk_create/bulk_update in a single
+    transaction, object permissions are checked per row. Validation and permission
+    errors are reported as a list aligned with the submitted rows.
+    """
+    bulk_lookup_field = 'id'
+    bulk_max_rows = 1000
+    bulk_upsert = False
+
+    @action(detail=False, methods=['post', 'put', 'patch', 'delete'],
+            permission_classes=[IsAuthenticated, IsOwnerOrStaffOrReadOnly])
+    def bulk(self, request, *args, **kwargs):
+        rows = request.data
+        if not isinstance(rows, list) or not rows:
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: ['Expected a non-empty list of rows.']})
+        if len(rows) > self.bulk_max_rows:
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [
+                f'At most {self.bulk_max_rows} rows can be sent at once.']})
+        with transaction.atomic():
+            if request.method == 'DELETE':
+                return self.bulk_destroy(rows)
+            if request.method == 'POST' and not self.bulk_upsert:
+                return self.bulk_create(rows)
+            return self.bulk_update(rows, partial=self.bulk_upsert or request.method == 'PATCH')
+
+    def get_bulk_queryset(self):
+        return self.get_queryset().model.objects.all()
+
+    def get_bulk_create_kwargs(self):
+        return {}
+
+    def get_bulk_update_kwargs(self):
+        return {}
+
+    def get_bulk_objects(self, keys):
+        queryset = self.get_bulk_queryset().filter(**{f'{self.bulk_lookup_field}__in': keys}).select_for_update()
+        return {getattr(obj, queryset.model._meta.get_field(self.bulk_lookup_field).attname): obj for obj in queryset}
+
+    def get_bulk_keys(self, rows):
+        field = self.get_queryset().model._meta.get_field(self.bulk_lookup_field)
+        keys, errors = [], []
+        for row in rows:
+            value = row.get(self.bulk_lookup_field) if isinstance(row, dict) else row
+            try:
+                keys.append(field.to_python(value) if value is not None else None)
+            except DjangoValidationError:
+                keys.append(None)
+            errors.append({} if keys[-1] is not None else {self.bulk_lookup_field: ['This field is required.']})
+        if any(errors):
+            raise ValidationError(errors)
+        return keys
+
+    def check_bulk_permissions(self, objs):
+        errors = []
+        for obj in objs:
+            try:
+                self.check_object_permissions(self.request, obj)
+                errors.append({})
+            except PermissionDenied as exc:
+                errors.append({'detail': exc.detail})
+        if any(errors):
+            raise PermissionDenied(errors)
+
+    def bulk_response(self, objs, status_code):
+        order = {obj.pk: index for index, obj in enumerate(objs)}
+        saved = sorted(self.get_queryset().filter(pk__in=order), key=lambda obj: order[obj.pk])
+        return Response(self.get_serializer(saved, many=True).data, status=status_code)
+
+    def bulk_create(self, rows):
+        serializer = self.get_serializer(data=rows, many=True)
+        serializer.is_valid(raise_exception=True)
+        extra = self.get_bulk_create_kwargs()
+        model = self.get_queryset().model
+        self.check_bulk_permissions([model(**attrs, **extra) for attrs in serializer.validated_data])
+        created = serializer.save(**extra)
+        bulk_saved(model, created=created)
+        return self.bulk_response(created, status.HTTP_201_CREATED)
+
+    def bulk_update(self, rows, partial):
+        keys = self.get_bulk_keys(rows)
+        instances = self.get_bulk_objects(keys)
+        if not self.bulk_upsert:
+            errors = [{} if key in instances else {'detail': 'Not found.'} for key in keys]
+            if any(errors):
+                raise NotFound(errors)
+        serializer = self.get_serializer(instance=instances, data=rows, many=True, partial=partial)
+        serializer.lookup_field = self.bulk_lookup_field
+        serializer.is_valid(raise_exception=True)
+        self.check_bulk_permissions([instances[key] for key in keys if key in instances])
+        objs = serializer.save(**self.get_bulk_update_kwargs())
+        bulk_saved(serializer.child.Meta.model, created=serializer.created_instances,
+                   updated=serializer.updated_instances)
+        return self.bulk_response(objs, status.HTTP_200_OK)
+
+    def bulk_destroy(self, rows):
+        keys = self.get_bulk_keys(rows)
+        instances = self.get_bulk_objects(keys)
+        errors = [{} if key in instances else {'detail': 'Not found.'} for key in keys]
+        if any(errors):
+            raise NotFound(errors)
+        self.check_bulk_permissions(list(instances.values()))
+        self.get_bulk_queryset().filter(pk__in=[obj.pk for obj in instances.values()]).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+# Models embedded by ?expand= besides the book's own, responses expanding them also depend on them.
+EXPANDED_MODELS = {'owner': User, 'stock': Stock}
+book_response_caches = {
+    names: GenerationCache('-'.join(['book', *names]),
+                           [Book, UserBookRelation, Shop, *(EXPANDED_MODELS[name] for name in names)])
+    for names in [(), ('owner',), ('stock',), ('owner', 'stock')]
+}
+book_response_cache = book_response_caches[()]
+book_stock_response_cache = book_response_caches[('stock',)]
+# Encoded books (every field, no expansion) keyed on (id, updated_at), see BookViewSet.serialize_list().
+book_object_cache = ObjectCache('book', BookSerializer.Meta.fields, encode=encode_json)
+
+register_stats('response_flight', response_flight.stats, response_flight.reset_stats)
+for response_cache in book_response_caches.values():
+    register_stats(f'response_cache:{response_cache.prefix}', response_cache.stats, response_cache.reset_stats)
+register_stats('object_cache:book', book_object_cache.stats, book_object_cache.reset_stats)
+
+
 # Create your views here.
-class BookViewSet(OwnerStaffReadOnlyModelViewSet):
+class BookViewSet(CachedResponseMixin, CompiledListMixin, BulkModelMixin, OwnerStaffReadOnlyModelViewSet):
     """
     ViewSet for the Book model.
     Provides CRUD operations for the Book model.
     Uses custom permissions: only the owner or staff can modify data.
     """
-    queryset = Book.objects.all().select_related('owner').prefetch_related('shops').annotate(
-        rate=Avg('userbookrelation__rate')).annotate(
-        likes_count=Count(Case(When(userbookrelation__like=True, then=1))))
+    queryset = Book.objects.all()
     serializer_class = BookSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    response_cache = book_response_cache
+    change_markers = [Book, UserBookRelation, Shop]
+    filter_backends = [DjangoFilterBackend, BookSearchFilter, OrderingFilter]
 
     filterset_fields = ['price']
     search_fields = ['name', 'author_name']
     ordering_fields = ['price', 'author_name']
+    export_chunk_size = 2000
+    # Book columns read by each serializer field, besides id.
+    field_columns = {
+        'name': ['name'],
+        'price': ['price'],
+        'author_name': ['author_name'],
+        'owner': ['owner'],
+        'like_count': ['likes_count'],
+        'rate': ['rating_sum', 'rating_count'],
+    }
+
+    def get_queryset(self):
+        """
+        List and retrieve load only what ?fields= and ?expand= ask for: the columns of the
+        requested fields, the rate annotation if `rate` is requested, and a join or prefetch
+        per expansion. Other actions get every field.
+        """
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve'):
+            return queryset.select_related('owner').prefetch_related('shops').defer('search_vector').with_rate()
+        fields, expand = self.get_sparse_fields()
+        names = set(BookSerializer.Meta.fields if fields is None else fields)
+        # The keyset pagination reads the ordering columns of the first and last book.
+        columns = {'id', *self.get_ordering_columns()}
+        for name in names:
+            columns.update(self.field_columns.get(name, ()))
+        if 'owner' in expand:
+            queryset = queryset.select_related('owner')
+            columns.update(['owner', 'owner__id', 'owner__username'])
+        queryset = queryset.only(*columns)
+        if 'rate' in names:
+            queryset = queryset.with_rate()
+        if 'shops' in expand:
+            queryset = queryset.prefetch_related(Prefetch('shops', Shop.objects.only('id', 'name').order_by('pk')))
+        if 'stock' in expand:
+            queryset = queryset.prefetch_related(
+                Prefetch('stock_set', Stock.objects.only('id', 'book', 'shop', 'count').order_by('shop', 'pk')))
+        return queryset
+
+    def get_sparse_fields(self):
+        """
+        Returns the serializer fields asked for with ?fields= (None for all, the id is always
+        kept) and the expansions asked for with ?expand=, on list and retrieve.
+        """
+        if not hasattr(self, '_sparse_fields'):
+            fields, expand = None, []
+            if self.action in ('list', 'retrieve'):
+                fields = self.parse_field_names('fields', BookSerializer.Meta.fields)
+                if fields is not None:
+                    fields = ['id', *fields]
+                expand = self.parse_field_names('expand', BookSerializer.expandable_fields) or []
+            self._sparse_fields = fields, expand
+        return self._sparse_fields
+
+    def parse_field_names(self, param, allowed):
+        value = self.request.query_params.get(param)
+        if value is None:
+            return None
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in names if name not in allowed]
+        if unknown:
+            raise ValidationError({param: [f'Unknown field "{name}".' for name in unknown]})
+        return names
+
+    def get_ordering_columns(self):
+        ordering = self.request.query_params.get(api_settings.ORDERING_PARAM, '')
+        return [name for name in (field.strip().lstrip('-') for field in ordering.split(','))
+                if name in self.ordering_fields]
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'], context['expand'] = self.get_sparse_fields()
+        return context
+
+    def serialize_list(self, queryset, serializer):
+        """
+        Without ?expand=, the page is read as (id, updated_at) pairs and assembled from
+        book_object_cache: only the books missing there are loaded, serialized and encoded, the
+        others are rendered from their cached JSON as is. Updated_at moves with every change of
+        the book, of its counters (likes and rates) and of its shops.
+        """
+        if self.action != 'list' or self.get_sparse_fields()[1]:
+            return super().serialize_list(queryset, serializer)
+        get_ordering = getattr(self.paginator, 'get_ordering', None)
+        ordering = get_ordering(queryset, self) if get_ordering is not None else []
+        columns = ['id', 'updated_at', *(field.lstrip('-') for field in ordering)]
+        rows = queryset.values_list(*dict.fromkeys(columns), named=True)
+        page = self.paginate_queryset(rows)
+        rows = page if page is not None else rows
+        data = book_object_cache.get_many([(row.id, row.updated_at.timestamp()) for row in rows],
+                                          self.load_representations)
+        names = [name for name in serializer.fields if name in BookSerializer.Meta.fields]
+        if len(names) < len(BookSerializer.Meta.fields):
+            data = [{name: item[name] for name in names} for item in data]
+        return data, page is not None
+
+    def load_representations(self, pks):
+        """
+        Returns {id: (updated_at timestamp, representation with every field)} of the given books.
+        """
+        queryset = Book.objects.filter(pk__in=pks).with_rate()
+        compiled = CompiledSerializer.compile(BookSerializer(context={'fields': None, 'expand': []}), queryset)
+        rows = list(compiled.values(queryset, ['updated_at']))
+        return {row.id: (row.updated_at.timestamp(), item)
+                for row, item in zip(rows, compiled.to_representation(rows))}
+
+    def get_expanded_models(self):
+        """
+        The names of the ?expand= fields embedding other models, see EXPANDED_MODELS.
+        """
+        return tuple(sorted(name for name in self.get_sparse_fields()[1] if name in EXPANDED_MODELS))
+
+    def get_change_markers(self):
+        return [*super().get_change_markers(), *(EXPANDED_MODELS[name] for name in self.get_expanded_models())]
+
+    def get_response_cache(self):
+        return book_response_caches[self.get_expanded_models()]
 
     def perform_create(self, serializer):
         serializer.validated_data['owner'] = self.request.user
@@ -43,8 +452,85 @@ class BookViewSet(OwnerStaffReadOnlyModelViewSet):
         serializer.validated_data['owner'] = self.request.user
         serializer.save()
 
+    def get_bulk_create_kwargs(self):
+        return {'owner': self.request.user}
+
+    @action(detail=False, url_path='export')
+    def export(self, request, *args, **kwargs):
+        """
+        Streams the catalog as NDJSON, or CSV with ?export_format=csv, honoring the same
+        filter, search and ordering params as the list. Books are read through a
+        server-side cursor in chunks, so memory stays flat whatever the catalog size.
+        """
+        export_format = request.query_params.get('export_format', 'ndjson')
+        if export_format not in ('ndjson', 'csv'):
+            raise ValidationError({'export_format': ['Expected "ndjson" or "csv".']})
+        queryset = self.filter_queryset(self.get_queryset())
+        if not queryset.ordered:
+            queryset = queryset.order_by('pk')
+        rows = self.export_rows(queryset)
+        if export_format == 'csv':
+            fieldnames = [*self.get_serializer().fields, 'shops']
+            response = StreamingHttpResponse(csv_lines(rows, fieldnames), content_type='text/csv; charset=utf-8')
+        else:
+            response = StreamingHttpResponse(ndjson_lines(rows), content_type='application/x-ndjson; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="books.{export_format}"'
+        return response
 
-class UserBookRelationViewSet(OwnerStaffReadOnlyModelViewSet):
+    @action(detail=True, url_path='comments')
+    def comments(self, request, *args, **kwargs):
+        """
+        The comments of the book, oldest first (?ordering=-datetime_created for newest first),
+        keyset paginated on (datetime_created, id) through the matching index, with the
+        commenter's username. `count` is the stored Book.comments_count, not a COUNT(*).
+        """
+        try:
+            book_id = int(kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except ValueError:
+            raise NotFound
+        count = Book.objects.filter(pk=book_id).values_list('comments_count', flat=True).first()
+        if count is None:
+            raise NotFound
+        ordering = request.query_params.get('ordering', 'datetime_created')
+        if ordering not in ('datetime_created', '-datetime_created'):
+            raise ValidationError({'ordering': ['Expected "datetime_created" or "-datetime_created".']})
+        queryset = (Comment.objects.filter(book_id=book_id).select_related('user')
+                    .only('id', 'book_id', 'text', 'datetime_created', 'user__username').order_by(ordering))
+        data, _ = self.serialize_list(queryset, CommentSerializer(context=self.get_serializer_context()))
+        return Response({'count': count, **self.paginator.get_paginated_data(data)})
+
+    @action(detail=True, url_path='similar')
+    def similar(self, request, *args, **kwargs):
+        """
+        "Readers who liked this also liked": the precomputed neighbours of the book (see
+        store.recommendations), most similar first. Two indexed lookups of K rows whatever the
+        number of readers; books without neighbours yet get an empty list.
+        """
+        try:
+            book_id = int(kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except ValueError:
+            raise NotFound
+        neighbours = list(BookSimilarity.objects.filter(book_id=book_id).order_by('rank')
+                          .values_list('similar_id', 'score'))
+        if not neighbours and not Book.objects.filter(pk=book_id).exists():
+            raise NotFound
+        books = self.get_queryset().prefetch_related(None).in_bulk([pk for pk, _ in neighbours])
+        for pk, score in neighbours:
+            if pk in books:
+                books[pk].score = score
+        serializer = SimilarBookSerializer([books[pk] for pk, _ in neighbours if pk in books], many=True,
+                                           context=self.get_serializer_context())
+        return Response(serializer.data)
+
+    def export_rows(self, queryset):
+        serializer = self.get_serializer()
+        for book in queryset.iterator(chunk_size=self.export_chunk_size):
+            row = serializer.to_representation(book)
+            row['shops'] = [shop.pk for shop in book.shops.all()]
+            yield row
+
+
+class UserBookRelationViewSet(BulkModelMixin, OwnerStaffReadOnlyModelViewSet):
     """
     ViewSet for the UserBookRelation model.
     Provides CRUD operations for the UserBookRelation model.
@@ -53,14 +539,90 @@ class UserBookRelationViewSet(OwnerStaffReadOnlyModelViewSet):
     queryset = UserBookRelation.objects.all().select_related('user', 'book')
     serializer_class = UserBookRelationSerializer
     permission_classes = [IsOwnerOrStaffOrReadOnly]
+    # Writes are low priority: shed under database load, then limited per user.
+    throttle_classes = [LoadShedThrottle, TokenBucketThrottle]
+    throttle_scope = 'relation'
     lookup_field = 'book'
+    bulk_lookup_field = 'book'
+    bulk_upsert = True
+
+    def get_bulk_queryset(self):
+        return UserBookRelation.objects.filter(user=self.request.user)
+
+    def get_bulk_update_kwargs(self):
+        return {'user': self.request.user}
+
+    def get_bulk_keys(self, rows):
+        keys = super().get_bulk_keys(rows)
+        # A bulk write is newer than the user's queued changes of the same books.
+        relation_buffer.discard(self.request.user.pk, keys)
+        return keys
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    def get_validators(self, request):
+        etag, last_modified = super().get_validators(request)
+        version = relation_buffer.version(request.user.pk)
+        if version is None:
+            return etag, last_modified
+        # Queued writes (see queue_update) are not in the generations yet: they change the ETag,
+        # and If-Modified-Since cannot see them.
+        return f'{etag[:-1]}-{version}"', None
 
     def get_object(self):
-        obj, _ = UserBookRelation.objects.get_or_create(user=self.request.user, book_id=self.kwargs['book'])
+        queryset = UserBookRelation.objects.all()
+        if self.request.method not in SAFE_METHODS:
+            # Lock the row so concurrent writes see each other's contribution to the Book counters.
+            queryset = queryset.select_for_update()
+        obj, _ = queryset.get_or_create(user=self.request.user, book_id=self.kwargs['book'])
+        if self.request.method in SAFE_METHODS:
+            relation_buffer.overlay([obj])
         return obj
 
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        return relation_buffer.overlay(page) if page is not None else None
+
+    @transaction.atomic
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+    def update(self, request, *args, **kwargs):
+        if settings.STORE_RELATION_WRITE_BEHIND:
+            return self.queue_update(request)
+        with transaction.atomic():
+            return super().update(request, *args, **kwargs)
+
+    def queue_update(self, request):
+        """
+        Write-behind update: the changed fields are validated and queued in relation_buffer
+        instead of being written. Answers 202 with the changes still waiting for the database.
+        """
+        if not request.user.is_authenticated:
+            self.permission_denied(request)
+        try:
+            book_id = int(self.kwargs['book'])
+        except ValueError:
+            raise NotFound()
+        if not Book.objects.filter(pk=book_id).exists():
+            raise NotFound()
+        relation = UserBookRelation(user=request.user, book_id=book_id)
+        serializer = self.get_serializer(relation, data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        changes = {field: value for field, value in serializer.validated_data.items() if field in RELATION_FIELDS}
+        relation_buffer.put(request.user.pk, book_id, changes)
+        return Response({'user': request.user.pk, 'book': book_id, **relation_buffer.get(request.user.pk, book_id)},
+                        status=status.HTTP_202_ACCEPTED)
 
-class CommentViewSet(OwnerStaffReadOnlyModelViewSet):
+    @transaction.atomic
+    def destroy(self, request, *args, **kwargs):
+        response = super().destroy(request, *args, **kwargs)
+        relation_buffer.discard(request.user.pk, [int(self.kwargs['book'])])
+        return response
+
+
+class CommentViewSet(CompiledListMixin, OwnerStaffReadOnlyModelViewSet):
     """
     ViewSet for the Comment model.
     Provides CRUD operations for the Comment model.
@@ -69,9 +631,16 @@ class CommentViewSet(OwnerStaffReadOnlyModelViewSet):
     queryset = Comment.objects.all().select_related('user', 'book')
     serializer_class = CommentSerializer
     permission_classes = [IsOwnerOrStaffOrReadOnly]
+    # Comments embed the commenter's username.
+    change_markers = [Comment, User]
+    throttle_classes = [LoadShedThrottle, TokenBucketThrottle]
+    throttle_scope = 'comment'
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_fields = ['book']
+    ordering_fields = ['datetime_created']
 
 
-class QuoteViewSet(OwnerStaffReadOnlyModelViewSet):
+class QuoteViewSet(CompiledListMixin, OwnerStaffReadOnlyModelViewSet):
     """
     ViewSet for the Quote model.
     Provides CRUD operations for the Quote model.
@@ -90,10 +659,11 @@ class ShopViewSet(OwnerStaffReadOnlyModelViewSet):
     """
     queryset = Shop.objects.all().prefetch_related('books')
     serializer_class = ShopSerializer
+    change_markers = [Shop, Book]
     permission_classes = [IsOwnerOrStaffOrReadOnly]
 
 
-class StockViewSet(OwnerStaffReadOnlyModelViewSet):
+class StockViewSet(CompiledListMixin, BulkModelMixin, OwnerStaffReadOnlyModelViewSet):
     """
     ViewSet for the Stock model.
     Provides CRUD operations for the Stock model.
@@ -102,3 +672,128 @@ class StockViewSet(OwnerStaffReadOnlyModelViewSet):
     queryset = Stock.objects.all().select_related('shop', 'book')
     serializer_class = StockSerializer
     permission_classes = [IsOwnerOrStaffOrReadOnly]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['shop', 'book']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('update', 'partial_update', 'destroy'):
+            # Lock the row, concurrent writes and checkouts must see each other's count (see Stock.save).
+            queryset = queryset.select_for_update(of=('self',))
+        return queryset
+
+    @transaction.atomic
+    def update(self, request, *args, **kwargs):
+        return super().update(request, *args, **kwargs)
+
+    @transaction.atomic
+    def destroy(self, request, *args, **kwargs):
+        return super().destroy(request, *args, **kwargs)
+
+
+class InventoryViewSet(ConditionalGetMixin, ReadOnlyModelViewSet):
+    """
+    Read-only access to a materialized inventory summary (see store.inventory). A retrieve
+    is a primary key lookup whatever the size of the catalog. Shops and books without
+    stock have no summary row and are reported with zeros.
+    """
+    change_markers = [Stock]
+    lookup_value_regex = r'\d+'
+    parent_model = None
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+            if not self.parent_model.objects.filter(pk=pk).exists():
+                raise
+            return self.get_queryset().model(pk=int(pk))
+
+
+class ShopInventoryViewSet(InventoryViewSet):
+    """
+    Units, titles and out-of-stock titles per shop.
+    """
+    queryset = ShopInventory.objects.all()
+    serializer_class = ShopInventorySerializer
+    parent_model = Shop
+
+
+class BookInventoryViewSet(InventoryViewSet):
+    """
+    Units, shops stocking the book and shops out of it, per book.
+    """
+    queryset = BookInventory.objects.all()
+    serializer_class = BookInventorySerializer
+    parent_model = Book
+
+
+class LeaderboardViewSet(ViewSet):
+    """
+    Top rated and trending books, ranked in process (see store.leaderboard).
+    /leaderboard/<board>/ lists the books by rank (?offset=, ?limit=), /leaderboard/<board>/<book id>/
+    returns the rank of a book. Both cost O(log n) plus at most one query for the page's books.
+    """
+    lookup_value_regex = 'top-rated|trending'
+    default_limit = 20
+    max_limit = 100
+
+    def get_int_param(self, name, default, maximum=None):
+        value = self.request.query_params.get(name)
+        if value is None:
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            value = -1
+        if value < 0:
+            raise ValidationError({name: ['Expected a non-negative integer.']})
+        return min(value, maximum) if maximum is not None else value
+
+    def retrieve(self, request, pk=None):
+        offset = self.get_int_param('offset', 0)
+        limit = self.get_int_param('limit', self.default_limit, self.max_limit)
+        count, entries = leaderboard.top(pk, offset, limit)
+        books = Book.objects.select_related('owner').defer('search_vector').with_rate().in_bulk(
+            [book_id for book_id, _, _ in entries])
+        ranked = []
+        for book_id, rank, score in entries:
+            # Deleted by another process since the last sync.
+            if book_id in books:
+                books[book_id].rank, books[book_id].score = rank + 1, score
+                ranked.append(books[book_id])
+        serializer = RankedBookSerializer(ranked, many=True, context={'request': request})
+        return Response({'count': count, 'results': serializer.data})
+
+    @action(detail=True, url_path=r'(?P<book_id>\d+)')
+    def rank(self, request, pk=None, book_id=None):
+        book_id = int(book_id)
+        entry = leaderboard.rank(pk, book_id)
+        if entry is None:
+            if not Book.objects.filter(pk=book_id).exists():
+                raise NotFound
+            return Response({'book': book_id, 'rank': None, 'score': None})
+        rank, score = entry
+        return Response({'book': book_id, 'rank': rank + 1, 'score': score})
+
+
+class CheckoutViewSet(ViewSet):
+    """
+    ViewSet for checkout.
+    POST turns the current user's cart into an order, reserving stock for every book.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def create(self, request):
+        try:
+            order = checkout(request.user)
+        except Cart.DoesNotExist:
+            raise NotFound('The user has no cart.')
+        except EmptyCart as exc:
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [str(exc)]})
+        except OutOfStock as exc:
+            return Response({'detail': 'Some books are out of stock.', 'books': exc.book_ids},
+                            status=status.HTTP_409_CONFLICT)
+        order = Order.objects.prefetch_related('books', 'orderitem_set').get(pk=order.pk)
+        return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
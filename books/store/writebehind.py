@@ -0,0 +1,206 @@
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import Q
+
+from store.models import Book, UserBookRelation
+from store.signals import bulk_saved
+
+logger = logging.getLogger(__name__)
+
+RELATION_FIELDS = ('like', 'in_bookmarks', 'rate')
+
+
+def flush_interval():
+    return getattr(settings, 'STORE_RELATION_FLUSH_INTERVAL', 1.0)
+
+
+def flush_size():
+    return getattr(settings, 'STORE_RELATION_FLUSH_SIZE', 1000)
+
+
+class RelationBuffer:
+    """
+    Write-behind buffer for like / bookmark / rate changes. Changes are coalesced per
+    (user, book) field by field, the last write wins, and written in batches by flush():
+    every STORE_RELATION_FLUSH_INTERVAL seconds from a background thread, as soon as
+    STORE_RELATION_FLUSH_SIZE pairs are pending, and at interpreter exit.
+
+    The buffer belongs to the process. Pending changes are only visible to requests served
+    by the same process (through overlay()), and are lost if the process is killed.
+    """
+    lock_batch_size = 500
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pending = {}
+        # The batch being written stays readable until it is committed.
+        self.flushing = {}
+        # {user id: sequence number of their latest queued change}, while any of them is pending or flushing.
+        self.versions = {}
+        self.sequence = 0
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.pid = None
+
+    def put(self, user_id, book_id, changes):
+        with self.lock:
+            self.pending.setdefault((user_id, book_id), {}).update(changes)
+            self.sequence += 1
+            self.versions[user_id] = self.sequence
+            size = len(self.pending)
+        running = self.start()
+        if size >= flush_size():
+            if running:
+                self.wakeup.set()
+            else:
+                self.flush()
+
+    def get(self, user_id, book_id):
+        """
+        Returns the pending changes of the pair, {} if there are none.
+        """
+        key = (user_id, book_id)
+        with self.lock:
+            return {**self.flushing.get(key, {}), **self.pending.get(key, {})}
+
+    def version(self, user_id):
+        """
+        Returns a number that changes with every queued change of the user, None when none of
+        their changes is waiting. Lets validators account for writes not in the database yet.
+        """
+        with self.lock:
+            return self.versions.get(user_id)
+
+    def discard(self, user_id, book_ids):
+        with self.lock:
+            for book_id in book_ids:
+                self.pending.pop((user_id, book_id), None)
+
+    def overlay(self, relations):
+        """
+        Applies the pending changes to the given relations in place, so a user reads their own writes.
+        """
+        with self.lock:
+            if not self.pending and not self.flushing:
+                return relations
+            for relation in relations:
+                key = (relation.user_id, relation.book_id)
+                for field, value in {**self.flushing.get(key, {}), **self.pending.get(key, {})}.items():
+                    setattr(relation, field, value)
+        return relations
+
+    def start(self):
+        """
+        Starts the flush thread of this process unless the interval is 0. Returns whether it runs.
+        """
+        if flush_interval() <= 0:
+            return False
+        with self.lock:
+            # A forked worker inherits the object but not the thread.
+            if self.thread is None or self.pid != os.getpid() or not self.thread.is_alive():
+                self.pid = os.getpid()
+                self.wakeup.clear()
+                self.thread = threading.Thread(target=self.run, name='relation-write-behind', daemon=True)
+                self.thread.start()
+        return True
+
+    def stop(self):
+        """
+        Stops the flush thread and writes what is left.
+        """
+        thread, self.thread = self.thread, None
+        if thread is not None and self.pid == os.getpid():
+            self.wakeup.set()
+            thread.join(timeout=10)
+        try:
+            self.flush()
+        except DatabaseError:
+            logger.exception('Writing %d pending relation changes failed at exit', len(self.pending))
+
+    def run(self):
+        while self.thread is threading.current_thread():
+            self.wakeup.wait(flush_interval())
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Writing pending relation changes failed, retrying in %ss', flush_interval())
+            finally:
+                # Hand the connection back like a request would.
+                close_old_connections()
+
+    def flush(self):
+        """
+        Writes the pending changes, returns the number of (user, book) pairs written. If the
+        write fails the batch goes back into the buffer, below changes made meanwhile.
+        """
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, {}
+                self.flushing = batch
+            if not batch:
+                return 0
+            try:
+                self.write(batch)
+            except BaseException:
+                with self.lock:
+                    for key, changes in batch.items():
+                        self.pending[key] = {**changes, **self.pending.get(key, {})}
+                raise
+            finally:
+                with self.lock:
+                    self.flushing = {}
+                    waiting = {user_id for user_id, _ in self.pending}
+                    self.versions = {user_id: version for user_id, version in self.versions.items()
+                                     if user_id in waiting}
+            return len(batch)
+
+    def write(self, batch):
+        with transaction.atomic():
+            book_ids = set(Book.objects.filter(pk__in={book_id for _, book_id in batch}).values_list('pk', flat=True))
+            user_ids = set(User.objects.filter(pk__in={user_id for user_id, _ in batch}).values_list('pk', flat=True))
+            keys = sorted(key for key in batch if key[0] in user_ids and key[1] in book_ids)
+            if len(keys) < len(batch):
+                logger.warning('Dropped %d relation changes of deleted users or books', len(batch) - len(keys))
+
+            # The current rows are locked and loaded, so the Book counters get exact deltas. Missing
+            # rows are inserted empty first, skipping any inserted concurrently since, and locked too:
+            # every row is then an update from its stored state and is never counted twice.
+            existing = self.lock_relations(keys)
+            missing = [key for key in keys if key not in existing]
+            if missing:
+                UserBookRelation.objects.bulk_create(
+                    [UserBookRelation(user_id=user_id, book_id=book_id) for user_id, book_id in missing],
+                    ignore_conflicts=True)
+                existing.update(self.lock_relations(missing))
+
+            updated = [existing[key] for key in keys]
+            for key, relation in zip(keys, updated):
+                for field, value in batch[key].items():
+                    setattr(relation, field, value)
+            UserBookRelation.objects.bulk_update(updated, list(RELATION_FIELDS), batch_size=self.lock_batch_size)
+            bulk_saved(UserBookRelation, updated=updated)
+
+    def lock_relations(self, keys):
+        """
+        Locks and loads the relations of the given (user id, book id) pairs, in id order.
+        """
+        relations = {}
+        for start in range(0, len(keys), self.lock_batch_size):
+            condition = Q()
+            for user_id, book_id in keys[start:start + self.lock_batch_size]:
+                condition |= Q(user_id=user_id, book_id=book_id)
+            for relation in UserBookRelation.objects.select_for_update().filter(condition).order_by('pk'):
+                relations[relation.user_id, relation.book_id] = relation
+        return relations
+
+
+relation_buffer = RelationBuffer()
+atexit.register(relation_buffer.stop)